@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+
+# Precomputed ALU results and DF, shared by the instruction handlers and jit.JIT. The two-operand tables are
+# indexed by (DF << 16) | (a << 8) | b with DF the carry in, the shift tables by (DF << 8) | D.
+#   ADD: a+b+DF, DF set on carry (ADD, ADC, ADI, ADCI with DF 0 for ADD and ADI)
+#   SUB: a-b-(NOT DF), DF cleared on borrow (SD, SDB, SM, SMB and their immediates, with DF 1 where there's no
+#        borrow in). SD computes M-D, so its a is the memory operand; SM computes D-M.
+#   SHL: D shifted left with DF into bit 0, DF set to the old bit 7 (SHL, SHLC with DF 0 for SHL)
+#   SHR: D shifted right with DF into bit 7, DF set to the old bit 0 (SHR, SHRC with DF 0 for SHR)
+CARRY_IN = 1 << 16      # the DF term of an index with DF set
+
+
+def _two_operand_tables() -> tuple[bytes, bytes, bytes, bytes]:
+    # Built a row (fixed carry in and a) at a time: across b the sum counts up from a+DF and wraps once, and
+    # subtracting b is adding 0xFF-b, so SUB rows are ADD rows reversed
+    counting = bytes(range(256)) * 2
+    add_result, add_df, sub_result, sub_df = bytearray(), bytearray(), bytearray(), bytearray()
+    for carry in range(2):
+        for a in range(256):
+            start = a + carry
+            result = counting[start & 0xFF:(start & 0xFF) + 256]
+            df = bytes(max(0, 256 - start)) + b'\x01' * min(256, start)
+            add_result += result
+            add_df += df
+            sub_result += result[::-1]
+            sub_df += df[::-1]
+    return bytes(add_result), bytes(add_df), bytes(sub_result), bytes(sub_df)
+
+
+ADD_RESULT, ADD_DF, SUB_RESULT, SUB_DF = _two_operand_tables()
+SHL_RESULT = bytes(((d << 1) & 0xFE) | carry for carry in range(2) for d in range(256))
+SHL_DF = bytes(d >> 7 for carry in range(2) for d in range(256))
+SHR_RESULT = bytes((d >> 1) | (carry << 7) for carry in range(2) for d in range(256))
+SHR_DF = bytes(d & 0x01 for carry in range(2) for d in range(256))
+
+TABLES = {'ADD_RESULT': ADD_RESULT, 'ADD_DF': ADD_DF, 'SUB_RESULT': SUB_RESULT, 'SUB_DF': SUB_DF,
+          'SHL_RESULT': SHL_RESULT, 'SHL_DF': SHL_DF, 'SHR_RESULT': SHR_RESULT, 'SHR_DF': SHR_DF}
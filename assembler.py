@@ -0,0 +1,296 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import re
+from opcodes import BYTE, NONE, OPCODES as OPCODE_TABLE, OPERAND_BYTES, PORT, REGISTER, SHORT
+from typing import NamedTuple, Optional, TYPE_CHECKING
+if TYPE_CHECKING:
+    from cpu import CPU
+
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'py1802')
+CACHE_VERSION = 1
+
+
+def _opcode_table() -> dict[str, tuple[int, str]]:
+    # (base opcode, operand kind) by mnemonic for every opcode in opcodes.OPCODES, so the assembler accepts exactly
+    # what the emulator executes. Register and port operands are ORed into the base opcode.
+    table = {}
+    for opcode, entry in enumerate(OPCODE_TABLE):
+        if not entry.mnemonic: continue
+        if entry.operand == REGISTER: opcode &= 0xF0
+        elif entry.operand == PORT: opcode &= 0xF8
+        table.setdefault(entry.mnemonic, (opcode, entry.operand))
+    return table
+
+
+OPCODES = _opcode_table()
+_TABLE_DIGEST = hashlib.sha256(repr(sorted(OPCODES.items())).encode()).hexdigest()
+
+_LABEL = re.compile(r'[A-Za-z_.][A-Za-z0-9_.]*$')
+_TERM = re.compile(r"\s*([+-]?)\s*(A\.[01]\(|'.'|#[0-9A-F]+|\$[0-9A-F]+|0X[0-9A-F]+|\d+|\*|[A-Z_.][A-Z0-9_.]*)",
+                   re.IGNORECASE)
+_REGISTER = re.compile(r'R[0-9A-F]$', re.IGNORECASE)
+
+
+class AssemblyError(SyntaxError):
+    pass
+
+
+class Image(NamedTuple):
+    segments: list[tuple[int, bytes]]   # (address, bytes) per ORG, in source order
+    symbols: dict[str, int]             # address of each label
+    constants: dict[str, int]           # EQU values
+    listing: dict[int, str]             # source text of the line assembled at each address, like load_mem's
+
+    def load(self, cpu: CPU) -> None:
+        for addr, data in self.segments: cpu.load(addr, data)
+
+
+class _Line(NamedTuple):
+    number: int
+    addr: int
+    text: str           # source line, for the listing
+    mnemonic: str
+    operands: list[str]
+
+
+def assemble(source: str) -> Image:
+    # Two passes over mnemonic source: the first places every line and defines labels, the second encodes.
+    # Labels end with ':' (optional before EQU), numbers are decimal unless written #hex, $hex or 0xhex, and
+    # expressions add or subtract numbers, labels, 'c' characters, * (the line's address) and A.0(expr)/A.1(expr)
+    # (low/high byte).
+    # An instruction's operands after the first are bytes that follow it, as in OUT 4,00.
+    symbols: dict[str, int] = {}        # labels and constants share one namespace while assembling
+    labels: list[str] = []
+    lines: list[_Line] = []
+    addr = 0
+    for number, raw in enumerate(source.splitlines(), 1):
+        code = _strip_comment(raw).strip()
+        if not code: continue
+        try:
+            label, code = _split_label(code)
+            mnemonic, rest = (code.split(None, 1) + [''])[:2] if code else ('', '')
+            if label is None and rest[:3].upper() == 'EQU' and rest[3:4] in ('', ' ', '\t'):
+                label, (mnemonic, rest) = mnemonic, (rest.split(None, 1) + [''])[:2]    # NAME EQU value
+                if not _LABEL.match(label): raise AssemblyError(f"Invalid label: {label}")
+            mnemonic = mnemonic.upper()
+            operands = _split_operands(rest)
+            if mnemonic == 'EQU':
+                if label is None or len(operands) != 1: raise AssemblyError("EQU needs a label and one value")
+                _define(symbols, label, _evaluate(operands[0], symbols, addr))
+                continue
+            if mnemonic == 'ORG':
+                if len(operands) != 1: raise AssemblyError("ORG needs one address")
+                addr = _evaluate(operands[0], symbols, addr)
+                if not 0 <= addr <= 0xFFFF: raise AssemblyError(f"Address out of range: {addr:X}")
+            if label is not None:
+                _define(symbols, label, addr)
+                labels.append(label)
+            if mnemonic in ('', 'ORG', 'END'):
+                if mnemonic == 'END': break
+                lines.append(_Line(number, addr, raw.strip(), mnemonic, operands))
+                continue
+            size = _size(mnemonic, operands)
+        except AssemblyError as e:
+            raise AssemblyError(f"Line {number}: {e.msg}") from None
+        lines.append(_Line(number, addr, raw.strip(), mnemonic, operands))
+        addr += size
+        if addr > 0x10000: raise AssemblyError(f"Line {number}: Program runs past the end of memory")
+
+    segments: list[tuple[int, bytearray]] = []
+    listing: dict[int, str] = {}
+    label_line = ''     # a line with only a label is listed with the next instruction
+    for line in lines:
+        if line.mnemonic in ('', 'ORG'):
+            if line.mnemonic == 'ORG' or not segments: segments.append((line.addr, bytearray()))
+            if not line.mnemonic: label_line = line.text + ' '
+            continue
+        try:
+            data = _encode(line, symbols)
+        except AssemblyError as e:
+            raise AssemblyError(f"Line {line.number}: {e.msg}") from None
+        if not segments: segments.append((line.addr, bytearray()))
+        segments[-1][1].extend(data)
+        listing[line.addr] = label_line + line.text
+        label_line = ''
+    constants = {name: value for name, value in symbols.items() if name not in labels}
+    return Image([(start, bytes(data)) for start, data in segments if data],
+                 {name: symbols[name] for name in labels}, constants, listing)
+
+
+def assemble_file(path: str, cache_dir: Optional[str] = CACHE_DIR) -> Image:
+    # assemble() the source at path, reusing the image cached in cache_dir under a hash of the source (and of the
+    # opcode table) when there is one. With cache_dir None, nothing is cached.
+    with open(path, 'rb') as source_file:
+        source = source_file.read()
+    if cache_dir is None: return assemble(source.decode())
+
+    key = hashlib.sha256(f'{CACHE_VERSION}:{_TABLE_DIGEST}:'.encode() + source).hexdigest()
+    cache_path = os.path.join(cache_dir, f'{key}.json')
+    try:
+        with open(cache_path) as cache_file:
+            cached = json.load(cache_file)
+        return Image([(addr, bytes.fromhex(data)) for addr, data in cached['segments']], cached['symbols'],
+                     cached['constants'], {int(addr): text for addr, text in cached['listing'].items()})
+    except (OSError, ValueError, KeyError):
+        pass
+
+    image = assemble(source.decode())
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_path = f'{cache_path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w') as cache_file:
+        json.dump({'segments': [(addr, data.hex()) for addr, data in image.segments], 'symbols': image.symbols,
+                   'constants': image.constants, 'listing': image.listing}, cache_file)
+    os.replace(temp_path, cache_path)   # atomic, so concurrent batch runs never read a partial entry
+    return image
+
+
+def symbolize(addr: int, symbols: dict[str, int]) -> str:
+    # 'LOOP+2' for the nearest label at or before addr, or the hex address
+    best = None
+    for name, value in symbols.items():
+        if value <= addr and (best is None or value > best[1]): best = (name, value)
+    if best is None or addr - best[1] > 0xFF: return f'{addr:04X}'
+    return best[0] if best[1] == addr else f'{best[0]}+{addr - best[1]}'
+
+
+def _strip_comment(line: str) -> str:
+    quoted = False
+    for i, char in enumerate(line):
+        if char == "'": quoted = not quoted
+        elif char == ';' and not quoted: return line[:i]
+    return line
+
+
+def _split_label(code: str) -> tuple[Optional[str], str]:
+    head, colon, rest = code.partition(':')
+    if not colon or "'" in head: return None, code
+    head = head.strip()
+    if not _LABEL.match(head): raise AssemblyError(f"Invalid label: {head}")
+    return head, rest.strip()
+
+
+def _split_operands(text: str) -> list[str]:
+    operands, current, quoted = [], '', False
+    for char in text:
+        if char == "'": quoted = not quoted
+        if char == ',' and not quoted:
+            operands.append(current.strip())
+            current = ''
+        else:
+            current += char
+    if current.strip() or operands: operands.append(current.strip())
+    if any(not operand for operand in operands): raise AssemblyError("Empty operand")
+    return operands
+
+
+def _define(symbols: dict[str, int], name: str, value: int) -> None:
+    if name in symbols: raise AssemblyError(f"Duplicate symbol: {name}")
+    symbols[name] = value
+
+
+def _size(mnemonic: str, operands: list[str]) -> int:
+    if mnemonic == 'DB':
+        if not operands: raise AssemblyError("DB needs at least one value")
+        return sum(len(operand) - 2 if _is_string(operand) else 1 for operand in operands)
+    if mnemonic == 'DW':
+        if not operands: raise AssemblyError("DW needs at least one value")
+        return 2 * len(operands)
+    if mnemonic not in OPCODES: raise AssemblyError(f"Unknown instruction: {mnemonic}")
+    _, kind = OPCODES[mnemonic]
+    needed = 0 if kind == NONE else 1
+    if len(operands) < needed: raise AssemblyError(f"{mnemonic} needs an operand")
+    if kind == NONE and operands: raise AssemblyError(f"{mnemonic} takes no operand")
+    return 1 + OPERAND_BYTES[kind] + len(operands) - needed
+
+
+def _is_string(operand: str) -> bool:
+    return len(operand) >= 2 and operand[0] == operand[-1] == "'" and len(operand) != 3
+
+
+def _encode(line: _Line, symbols: dict[str, int]) -> bytes:
+    mnemonic, operands, addr = line.mnemonic, line.operands, line.addr
+    if mnemonic == 'DB':
+        data = bytearray()
+        for operand in operands:
+            if _is_string(operand): data.extend(operand[1:-1].encode('ascii'))
+            else: data.append(_byte(_evaluate(operand, symbols, addr)))
+        return bytes(data)
+    if mnemonic == 'DW':
+        data = bytearray()
+        for operand in operands:
+            data.extend(_word(_evaluate(operand, symbols, addr)).to_bytes(2, 'big'))
+        return bytes(data)
+
+    opcode, kind = OPCODES[mnemonic]
+    data = bytearray([opcode])
+    if kind != NONE:
+        value = _evaluate(operands[0], symbols, addr)
+        if kind == REGISTER:
+            if not 0 <= value <= 0xF: raise AssemblyError(f"Invalid register: {operands[0]}")
+            if OPCODE_TABLE[opcode | value].mnemonic != mnemonic:
+                raise AssemblyError(f"{mnemonic} can't use R{value:X}")
+            data[0] |= value
+        elif kind == PORT:
+            if not 1 <= value <= 7: raise AssemblyError(f"Invalid port: {operands[0]}")
+            data[0] |= value
+        elif kind == BYTE:
+            data.append(_byte(value))
+        elif kind == SHORT:
+            value = _word(value)
+            if value >> 8 != ((addr + 1) & 0xFFFF) >> 8:
+                raise AssemblyError(f"Short branch target {value:04X} is off page {(addr + 1) >> 8:02X}")
+            data.append(value & 0xFF)
+        else:
+            data.extend(_word(value).to_bytes(2, 'big'))
+        operands = operands[1:]
+    for operand in operands:
+        data.append(_byte(_evaluate(operand, symbols, addr)))
+    return bytes(data)
+
+
+def _byte(value: int) -> int:
+    if not -0x80 <= value <= 0xFF: raise AssemblyError(f"Byte value out of range: {value}")
+    return value & 0xFF
+
+
+def _word(value: int) -> int:
+    if not -0x8000 <= value <= 0xFFFF: raise AssemblyError(f"Word value out of range: {value}")
+    return value & 0xFFFF
+
+
+def _evaluate(text: str, symbols: dict[str, int], addr: int) -> int:
+    value, rest = _expression(text, symbols, addr)
+    if rest.strip(): raise AssemblyError(f"Invalid expression: {text}")
+    return value
+
+
+def _expression(text: str, symbols: dict[str, int], addr: int) -> tuple[int, str]:
+    # sum of terms from the start of text, and the text left after them
+    value = 0
+    first = True
+    while True:
+        match = _TERM.match(text)
+        if match is None or (not first and not match.group(1)): break
+        sign, term = match.groups()
+        text = text[match.end():]
+        if term.upper() in ('A.0(', 'A.1('):
+            inner, text = _expression(text, symbols, addr)
+            text = text.lstrip()
+            if not text.startswith(')'): raise AssemblyError(f"Missing ) after {term}")
+            text = text[1:]
+            term_value = (inner >> 8 if term[2] == '1' else inner) & 0xFF
+        elif term.startswith("'"): term_value = ord(term[1])
+        elif term[0] == '#' or term[0] == '$': term_value = int(term[1:], 16)
+        elif term[:2].lower() == '0x': term_value = int(term[2:], 16)
+        elif term.isdigit(): term_value = int(term)
+        elif term == '*': term_value = addr
+        elif term in symbols: term_value = symbols[term]
+        elif _REGISTER.match(term): term_value = int(term[1], 16)
+        else: raise AssemblyError(f"Undefined symbol: {term}")
+        value += -term_value if sign == '-' else term_value
+        first = False
+    if first: raise AssemblyError(f"Invalid expression: {text}")
+    return value, text
@@ -0,0 +1,102 @@
+# Micro-benchmark: per-opcode dispatch cost of the legacy `match` decoder vs. the DISPATCH table.
+#   python benchmarks/bench_dispatch.py [loops]
+from __future__ import annotations
+import os
+import sys
+import timeit
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from cpu import CPU
+from instructions import *  # noqa: F401,F403 - handlers referenced by match_decode
+from instructions import DISPATCH, _invalid
+
+
+def match_decode(cpu: CPU, I: int, N: int):
+    # decoder as it was before the dispatch table, kept here as the baseline
+    match I, N:
+        case 0x0, 0x0:                      IDL(cpu)
+        case 0x0, N:                        LDN(cpu, N)
+        case 0x1, N:                        INC(cpu, N)
+        case 0x2, N:                        DEC(cpu, N)
+        case 0x3, 0x0:                      BR(cpu)
+        case 0x3, N if 0x4 <= N <= 0x7:     BN(cpu, N)
+        case 0x3, N if 0xC <= N <= 0xF:     BNN(cpu, N)
+        case 0x4, N:                        LDA(cpu, N)
+        case 0x5, N:                        STR(cpu, N)
+        case 0x6, 0x0:                      IRX(cpu)
+        case 0x6, N if 0x1 <= N <= 0x7:     OUT(cpu, N)
+        case 0x6, N if 0x9 <= N <= 0xF:     INP(cpu, N)
+        case 0x7, 0x2:                      LDXA(cpu)
+        case 0x7, 0x3:                      STXD(cpu)
+        case 0x7, 0x4:                      ADC(cpu)
+        case 0x7, 0x5:                      SDB(cpu)
+        case 0x7, 0x6:                      SHRC(cpu)
+        case 0x7, 0x7:                      SMB(cpu)
+        case 0x7, 0xA:                      REQ(cpu)
+        case 0x7, 0xB:                      SEQ(cpu)
+        case 0x7, 0xC:                      ADCI(cpu)
+        case 0x7, 0xD:                      SDBI(cpu)
+        case 0x7, 0xE:                      SHLC(cpu)
+        case 0x7, 0xF:                      SMBI(cpu)
+        case 0x8, N:                        GLO(cpu, N)
+        case 0x9, N:                        GHI(cpu, N)
+        case 0xA, N:                        PLO(cpu, N)
+        case 0xB, N:                        PHI(cpu, N)
+        case 0xC, 0x2:                      LBZ(cpu)
+        case 0xC, 0x4:                      NOP(cpu)
+        case 0xC, 0xA:                      LBNZ(cpu)
+        case 0xD, N:                        SEP(cpu, N)
+        case 0xE, N:                        SEX(cpu, N)
+        case 0xF, 0x0:                      LDX(cpu)
+        case 0xF, 0x1:                      OR(cpu)
+        case 0xF, 0x2:                      AND(cpu)
+        case 0xF, 0x3:                      XOR(cpu)
+        case 0xF, 0x4:                      ADD(cpu)
+        case 0xF, 0x5:                      SD(cpu)
+        case 0xF, 0x6:                      SHR(cpu)
+        case 0xF, 0x7:                      SM(cpu)
+        case 0xF, 0x8:                      LDI(cpu)
+        case 0xF, 0x9:                      ORI(cpu)
+        case 0xF, 0xA:                      ANI(cpu)
+        case 0xF, 0xB:                      XRI(cpu)
+        case 0xF, 0xC:                      ADI(cpu)
+        case 0xF, 0xD:                      SDI(cpu)
+        case 0xF, 0xE:                      SHL(cpu)
+        case 0xF, 0xF:                      SMI(cpu)
+        case _, _: raise NotImplementedError("Attempted to execute invalid instruction.")
+
+
+def match_decodes(opcode: int) -> bool:
+    # whether the baseline has a case for opcode, the ones added since it was retired (RET, DIS, SAV, MARK) aren't
+    # comparable
+    try:
+        match_decode(CPU(), opcode >> 4, opcode & 0xF)
+    except NotImplementedError:
+        return False
+    return True
+
+
+def main(loops: int = 20000) -> None:
+    cpu = CPU()
+    cpu.run()
+
+    rows = []
+    for opcode in range(0x100):
+        if DISPATCH[opcode] is _invalid or not match_decodes(opcode): continue
+        I, N = opcode >> 4, opcode & 0xF
+        handler = DISPATCH[opcode]
+        before = min(timeit.repeat(lambda: match_decode(cpu, I, N), number=loops, repeat=3)) / loops
+        after = min(timeit.repeat(lambda: handler(cpu), number=loops, repeat=3)) / loops
+        rows.append((opcode, before, after))
+
+    print("opcode   match (ns)   table (ns)   speedup")
+    for opcode, before, after in rows:
+        print(f"0x{opcode:02X}     {before * 1e9:10.1f}   {after * 1e9:10.1f}   {before / after:6.2f}x")
+    total_before = sum(row[1] for row in rows)
+    total_after = sum(row[2] for row in rows)
+    print(f"mean     {total_before / len(rows) * 1e9:10.1f}   {total_after / len(rows) * 1e9:10.1f}"
+          f"   {total_before / total_after:6.2f}x")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,78 @@
+# Benchmark: emulated machine cycles per second for the reference loop, the block cache and the JIT.
+#   python benchmarks/bench_engines.py [cycles]
+from __future__ import annotations
+import os
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from blocks import BlockCache
+from cpu import CPU
+from devices import QueueDevice
+from jit import JIT
+
+PROGRAMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'programs')
+
+# 8-bit add/rotate/xor checksum of 0x0100-0x01FF into R3.0, repeated forever:
+#   LDI 01; PHI 2; LDI 00; PLO 2; PLO 3; SEX 2
+#   LOOP: GLO 3; ADD; SHLC; XOR; PLO 3; IRX; GLO 2; LBNZ LOOP; BR 0
+CHECKSUM = bytes([0xF8, 0x01, 0xB2, 0xF8, 0x00, 0xA2, 0xA3, 0xE2,
+                  0x83, 0xF4, 0x7E, 0xF3, 0xA3, 0x60, 0x82, 0xCA, 0x00, 0x08, 0x30, 0x00])
+
+
+def listing(name: str) -> list[tuple[int, bytes]]:
+    # address and opcode columns of a program listing
+    lines = []
+    with open(os.path.join(PROGRAMS, name)) as source_file:
+        for line in source_file:
+            if line.startswith(';'): continue
+            tokens = line.split()
+            lines.append((int(tokens[0], 16), bytes.fromhex(tokens[1])))
+    return lines
+
+
+# workloads: the checksum loop, test_alu_ops.asm with its 'BN4 *' and 'B4 *' key waits replaced by NOPs and an ADD
+# opcode then operands of 5A keyed in on port 4, and test_alu_ops.asm as is, which waits for keys that never come
+# (every engine fast-forwards those waits, so it measures that rather than emulation)
+WORKLOADS = {'checksum': 'checksum', 'alu loop': 'test_alu_ops.asm', 'alu waits': 'test_alu_ops.asm'}
+ENGINES = {'reference': lambda cpu: cpu, 'blocks': BlockCache, 'jit': JIT}
+REPEAT = 5      # runs per engine, interleaved, the fastest counts
+
+
+def make_cpu(workload: str) -> CPU:
+    cpu = CPU()
+    if workload == 'checksum':
+        cpu.load(0, CHECKSUM)
+        cpu.load(0x100, bytes(range(0x100)))
+    else:
+        for addr, data in listing(WORKLOADS[workload]):
+            cpu.load(addr, data)
+            if workload == 'alu loop' and cpu.spins_at(addr): cpu.load(addr, b'\xC4' * len(data))
+        if workload == 'alu loop': cpu.attach_device(4, QueueDevice([0xF4], empty=0x5A))
+    cpu.run()
+    return cpu
+
+
+def measure(workload: str, engine: str, cycles: int) -> float:
+    # cycles/s after a warm-up tenth of the run, which is when the JIT compiles. Only the engine measured is
+    # attached, each engine's write hook would slow down the others' stores.
+    cpu = make_cpu(workload)
+    runner = ENGINES[engine](cpu)
+    runner.run_cycles(cycles // 10)
+    start = time.perf_counter()
+    runner.run_cycles(cycles)
+    return cycles / (time.perf_counter() - start)
+
+
+def main(cycles: int = 1_000_000) -> None:
+    for workload in WORKLOADS:
+        print(f"{workload}:")
+        rates = dict.fromkeys(ENGINES, 0.0)
+        for _ in range(REPEAT):
+            for engine in ENGINES: rates[engine] = max(rates[engine], measure(workload, engine, cycles))
+        for engine, rate in rates.items():
+            print(f"  {engine:10} {rate / 1e6:9.2f}M cycles/s  {rate / rates['reference']:5.1f}x")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
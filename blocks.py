@@ -0,0 +1,180 @@
+from __future__ import annotations
+from instructions import CYCLES, DISPATCH, _invalid
+from opcodes import NEXT, OPCODES, PORT
+from typing import Optional, TYPE_CHECKING
+if TYPE_CHECKING:
+    from cpu import CPU
+
+
+PAGE_BITS = 8                       # invalidation granularity, blocks are indexed by every page they touch
+MAX_BLOCK_LENGTH = 64               # instructions per block
+
+# instructions that end a block: anything that may move PC somewhere other than the next instruction
+TERMINATORS = frozenset(opcode for opcode, entry in enumerate(OPCODES) if entry.branch != NEXT)
+MEMORY_WRITE = frozenset([*range(0x50, 0x60), 0x73, 0x78, 0x79, *range(0x69, 0x70)])   # STR, STXD, SAV, MARK, INP
+PORT_IO = frozenset(opcode for opcode, entry in enumerate(OPCODES) if entry.operand == PORT)   # OUT, INP latch N0-N2
+
+
+class Block:
+    # Straight-line run of decoded instructions starting at `start` and covering memory [start, end)
+    __slots__ = ('start', 'end', 'ops', 'cycles', 'valid', 'hits', 'compiled', 'spins')
+
+    def __init__(self, start: int, end: int, ops: tuple, cycles: int, spins: bool = False) -> None:
+        self.start = start
+        self.end = end
+        self.ops = ops          # (addr, next_pc, I, N, handler, cycles, clear_n, writes) per instruction
+        self.cycles = cycles    # machine cycles to run the whole block
+        self.valid = True
+        self.hits = 0           # executions through the interpreter, used by jit.JIT to find hot blocks
+        self.compiled = None    # jit.JIT code for this block, keyed by (P << 4) | X at entry
+        self.spins = spins      # a lone branch to itself, see CPU.fast_forward
+
+
+class BlockCache:
+    # Execution engine that decodes straight-line code into cached Blocks keyed by start address. Blocks are
+    # dropped when store() or load() writes into their memory range, so writes must go through those (or
+    # invalidate()) rather than assigning CPU.M directly.
+    def __init__(self, cpu: CPU, max_block_length: int = MAX_BLOCK_LENGTH) -> None:
+        self.cpu = cpu
+        self.max_block_length = max_block_length
+        self._blocks: dict[int, Block] = {}
+        self._pages: list[set[Block]] = [set() for _ in range(2**16 >> PAGE_BITS)]
+        self._code = bytearray(2**16)   # 1 where a cached block covers the byte, so data writes beside code are cheap
+        cpu.add_write_hook(self.invalidate)
+
+    def close(self) -> None:
+        self.cpu.remove_write_hook(self.invalidate)
+        self.flush()
+
+    def __len__(self) -> int:
+        return len(self._blocks)
+
+    def flush(self) -> None:
+        for block in self._blocks.values(): block.valid = False
+        self._blocks.clear()
+        for page in self._pages: page.clear()
+        self._code[:] = bytes(len(self._code))
+
+    def invalidate(self, start: int, end: int) -> None:
+        # Drop every block overlapping memory [start, end)
+        if end - start == 1:
+            if not self._code[start]: return
+        elif self._code.find(1, start, end) < 0: return
+        pages = self._pages
+        for page in range(start >> PAGE_BITS, ((end - 1) >> PAGE_BITS) + 1):
+            if not pages[page]: continue
+            for block in [b for b in pages[page] if b.start < end and start < b.end]:
+                self._discard(block)
+
+    def _discard(self, block: Block) -> None:
+        block.valid = False
+        del self._blocks[block.start]
+        start, end = block.start, block.end
+        pages = range(start >> PAGE_BITS, ((end - 1) >> PAGE_BITS) + 1)
+        for page in pages: self._pages[page].discard(block)
+        self._code[start:end] = bytes(end - start)
+        for page in pages:
+            for other in self._pages[page]:     # bytes still covered by an overlapping block stay marked
+                low, high = max(start, other.start), min(end, other.end)
+                if low < high: self._code[low:high] = b'\x01' * (high - low)
+
+    def lookup(self, addr: int) -> Optional[Block]:
+        # Cached block starting at addr, translating it on a miss. None if the instruction at addr can't start
+        # a block (IDL, an invalid opcode, or an instruction running off the end of memory).
+        block = self._blocks.get(addr)
+        if block is None:
+            block = self._translate(addr)
+            if block is not None:
+                self._blocks[addr] = block
+                for page in range(block.start >> PAGE_BITS, ((block.end - 1) >> PAGE_BITS) + 1):
+                    self._pages[page].add(block)
+                self._code[block.start:block.end] = b'\x01' * (block.end - block.start)
+        return block
+
+    def _translate(self, start: int) -> Optional[Block]:
+        M = self.cpu.M
+        ops = []
+        addr = start
+        cycles = 0
+        clear_n = True  # the first fetch of a block always clears N0-N2, later ones only follow OUT/INP
+
+        while len(ops) < self.max_block_length and addr < len(M):
+            opcode = M[addr]
+            handler = DISPATCH[opcode]
+            length = OPCODES[opcode].length
+            if opcode == 0x00 or handler is _invalid or addr + length > len(M): break
+
+            cost = CYCLES[opcode]
+            ops.append((addr, (addr + 1) & 0xFFFF, opcode >> 4, opcode & 0x0F, handler, cost, clear_n,
+                        opcode in MEMORY_WRITE))
+            clear_n = opcode in PORT_IO
+            cycles += cost
+            addr += length
+            if opcode in TERMINATORS: break
+
+        if not ops: return None
+        return Block(start, addr, tuple(ops), cycles, len(ops) == 1 and self.cpu.spins_at(start))
+
+    def execute(self, block: Block) -> int:
+        # Run block as the Fetch/Execute states would, stopping early if PC leaves the block or a write
+        # invalidates it. Returns machine cycles executed; the CPU is left in S0.
+        cpu = self.cpu
+        R = cpu.R
+        P = cpu.P
+        execute, force = cpu.execute_state, cpu.force_execute_state
+        cycles = executed = 0
+
+        for addr, next_pc, I, N, handler, cost, clear_n, writes in block.ops:
+            if R[P] != addr: break
+            executed += 1
+            # S0
+            if clear_n: cpu.N2 = cpu.N1 = cpu.N0 = 0
+            cpu.I = I
+            cpu.N = N
+            R[P] = next_pc
+            cpu._state = execute
+            # S1 (and the forced S1 of three-cycle instructions)
+            handler(cpu)
+            if cpu._state is force:
+                handler(cpu)
+                cpu._state = cpu.fetch_state
+            cycles += cost
+            if writes and not block.valid: break
+        cpu.cycles += cycles
+        cpu.instructions += executed
+        return cycles
+
+    def run_cycles(self, n: int, stop_on_idle: bool = False) -> int:
+        # Equivalent to CPU.run_cycles(n), running whole cached blocks whenever the CPU is in S0 and the block
+        # fits in the remaining budget. With stop_on_idle, returns early once IDL has executed. Returns the
+        # number of cycles executed.
+        cpu = self.cpu
+        R = cpu.R
+        fetch = cpu.fetch_state
+        blocks = self._blocks
+        remaining = n
+        if cpu.io_requested(): return cpu.run_cycles(n, stop_on_idle)  # DMA and interrupts need the reference path
+
+        while remaining > 0:
+            if cpu._state is fetch:
+                pc = R[cpu.P]
+                block = blocks.get(pc) or self.lookup(pc)
+                if block is not None and block.spins and (skipped := cpu.fast_forward(remaining)):
+                    remaining -= skipped
+                    continue
+                if block is not None and block.cycles <= remaining:
+                    remaining -= self.execute(block)
+                    continue
+                # no block here or not enough budget left for it, step the reference path instead
+                step = min(remaining, 2)
+                cpu.run_cycles(step)
+                remaining -= step
+                if stop_on_idle and cpu.is_idle(): return n - remaining
+            else:
+                if not stop_on_idle and (skipped := cpu.fast_forward(remaining)):
+                    remaining -= skipped
+                    continue
+                cpu.tick()
+                remaining -= 1
+                if stop_on_idle and cpu.is_idle(): return n - remaining
+        return n
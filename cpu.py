@@ -1,21 +1,72 @@
 from __future__ import annotations
-from states import Reset
-from typing import TYPE_CHECKING
+import errno
+import mmap
+import struct
+import sys
+import tempfile
+import zlib
+from array import array
+from enum import Enum
+from itertools import count
+from instructions import CYCLES, DISPATCH, SPINS
+from states import DMAIn, DMAOut, Execute, Fetch, ForceExecute, Init, Interrupt, Pause, Reset
+from typing import BinaryIO, Callable, Collection, NamedTuple, Optional, TYPE_CHECKING
 if TYPE_CHECKING:
+    from devices import Device
     from states import State
 
 
+class StopReason(Enum):
+    MAX_CYCLES = 'max_cycles'   # cycle budget exhausted
+    PREDICATE = 'predicate'     # predicate returned True at an instruction boundary
+    BREAKPOINT = 'breakpoint'   # about to fetch from a breakpoint address
+    IDLE = 'idle'               # IDL executed
+
+
+# snapshot() layout: this header followed by the 64 KB memory image (zlib-compressed if SNAPSHOT_COMPRESSED is set)
+#   magic, version, flags, D, DF, B, P, X, N, I, T, IE, Q, BUS, EF1-4, N0-N2, running, state, Pause previous state,
+#   cycles, instructions, R0-RF, INT, DMA_IN, DMA_OUT
+SNAPSHOT_MAGIC = b'1802'
+SNAPSHOT_VERSION = 2
+SNAPSHOT_COMPRESSED = 0x01
+_SNAPSHOT_HEADER = struct.Struct('<4sB22B2Q16HB2I')
+# state machine position is stored as an index into these CPU attributes, 0xFF for no Pause previous state
+_SNAPSHOT_STATES = ('reset_state', 'init_state', 'fetch_state', 'execute_state', 'force_execute_state', 'pause_state',
+                    'interrupt_state', 'dma_in_state', 'dma_out_state')
+_NO_STATE = 0xFF
+
+
+# mmap keeps a duplicate of the file descriptor it maps unless told not to (Python 3.13+ on Unix)
+_UNTRACKED = {'trackfd': False} if sys.version_info >= (3, 13) and sys.platform != 'win32' else {}
+
+
+class _ForkImage(NamedTuple):
+    # memory image forks map copy-on-write (see CPU.fork), held open by every CPU mapping it
+    file: BinaryIO
+    data: mmap.mmap     # read-only mapping of file
+
+
 class CPU:
     _state: State = None
 
-    def __init__(self) -> None:
-        self.set_state(Reset())
+    def __init__(self, memory: Optional[bytearray | mmap.mmap] = None) -> None:
+        # preallocate one instance per machine state, transitions switch between these
+        self.fetch_state = Fetch(self)
+        self.execute_state = Execute(self)
+        self.force_execute_state = ForceExecute(self)
+        self.init_state = Init(self)
+        self.reset_state = Reset(self)
+        self.pause_state = Pause(context=self)
+        self.interrupt_state = Interrupt(self)
+        self.dma_in_state = DMAIn(self)
+        self.dma_out_state = DMAOut(self)
+        self._state = self.reset_state
 
         # setup registers
         self.D = 0              # Data Register (Accumulator), 8b
         self.DF = 0             # Data Flag (ALU Carry), 1b
         self.B = 0              # Auxiliary Holding Register, 8b
-        self.R = [0]*16         # Scratchpad Registers, 16x16b
+        self.R = array('H', [0]*16)   # Scratchpad Registers, 16x16b
         self.P = 0              # Designates Program Counter register, 4b
         self.X = 0              # Designates Data Pointer register, 4b
         self.N = 0              # Low-Order Instruction Digit, 4b
@@ -30,15 +81,35 @@ class CPU:
         self.N0 = 0
         self.N1 = 0
         self.N2 = 0
+        self.devices: list[Optional[Device]] = [None]*8    # by I/O port, OUT/INP call these as they execute
+
+        # setup request lines, change these between batches (e.g. from scheduler.Scheduler events), the inlined
+        # run loops only look for requests when they start
+        self.INT = 0            # Interrupt request, 1b
+        self.DMA_IN = 0         # DMA-in cycles requested, the line is held until they have run
+        self.DMA_OUT = 0        # DMA-out cycles requested
+        self.dma_device: Optional[Device] = None    # source of DMA-in and sink of DMA-out bytes, BUS if None
 
-        # setup memory
-        self.M = [0]*(2**16)    # Standard RAM and ROM up to 65,536B
+        # setup memory, 64 KB of it unless given (see fork())
+        self._memory = bytearray(2**16) if memory is None else memory    # Standard RAM and ROM up to 65,536B
+        self.M = memoryview(self._memory)   # fixed-size view, slices copy without a per-byte loop
+        self._write_hooks: tuple[Callable[[int, int], None], ...] = ()
+        self._image: Optional[_ForkImage] = None    # image the last fork() mapped, reused while memory matches it
+
+        # machine cycles spent in S0/S1 (not in RESET or PAUSE) and instructions fetched, since construction
+        self.cycles = 0
+        self.instructions = 0
 
         self.running = False
 
     def set_state(self, state: State) -> None:
-        self._state = state
-        self._state.context = self
+        # A state made outside the CPU stands for the CPU's own instance of its type, which the run loops and
+        # handlers compare by identity. A Pause brings the state it resumes to along.
+        own = self._own_state(state)
+        if own is not state and isinstance(state, Pause):
+            own.prev_state = None if state.prev_state is None else self._own_state(state.prev_state)
+        if own.context is not self: own.context = self
+        self._state = own
 
     def get_state(self) -> State:
         return self._state
@@ -47,6 +118,161 @@ class CPU:
         self.N2 = self.N1 = self.N0 = 0
         self._state.tick()
 
+    def run_cycles(self, n: int, stop_on_idle: bool = False) -> int:
+        # Equivalent to calling tick() n times with Fetch/Execute inlined and waiting() cycles fast-forwarded. With
+        # stop_on_idle, returns early once IDL has executed. Returns the number of cycles executed.
+        M, R = self.M, self.R
+        fetch, execute = self.fetch_state, self.execute_state
+        dispatch = DISPATCH
+        requests = self.io_requested()
+
+        # inlined states are counted here and added to cycles/instructions once on the way out
+        cycle = -1
+        fetched = ticked = 0
+        last_pc = -1
+        try:
+            for cycle in range(n):
+                state = self._state
+                if state is fetch:
+                    if requests and self._service_request():
+                        ticked += 1
+                        continue
+                    P = self.P
+                    pc = R[P]
+                    if pc == last_pc and not requests and (skipped := self.fast_forward(n - cycle)):
+                        # a branch to itself spins to the end of the batch, the cycles left over run as usual
+                        ticked += 1
+                        self.run_cycles(n - cycle - skipped)
+                        return n
+                    last_pc = pc
+                    fetched += 1
+                    self.N2 = self.N1 = self.N0 = 0
+                    opcode = M[pc]
+                    self.I = opcode >> 4
+                    self.N = opcode & 0x0F
+                    R[P] = (pc + 1) & 0xFFFF
+                    self._state = execute
+                elif state is execute:
+                    # N0-N2 were already cleared by the preceding fetch
+                    opcode = (self.I << 4) | self.N
+                    dispatch[opcode](self)
+                    if opcode == 0x00:
+                        if stop_on_idle: return cycle + 1
+                        if not requests:
+                            # IDL repeats S1 to the end of the batch
+                            self.cycles += n - cycle - 1
+                            return n
+                else:
+                    ticked += 1
+                    self.tick()
+                    if stop_on_idle and self.is_idle(): return cycle + 1
+            return n
+        finally:
+            self.cycles += cycle + 1 - ticked
+            self.instructions += fetched
+
+    def run_until(self, predicate: Optional[Callable[[CPU], bool]] = None, max_cycles: Optional[int] = None,
+                  breakpoints: Optional[Collection[int]] = None) -> StopReason:
+        # Run until predicate(cpu) holds or PC reaches a breakpoint (both checked before each fetch), IDL is
+        # executed, or max_cycles have elapsed. Breakpoints are ignored for the first instruction so a run
+        # can resume from the address it stopped at.
+        M, R = self.M, self.R
+        fetch, execute = self.fetch_state, self.execute_state
+        dispatch = DISPATCH
+        breakpoints = frozenset(breakpoints) if breakpoints else None
+        resume_pc = R[self.P] if self._state is fetch else None
+        requests = self.io_requested()
+        # inlined states are counted here and added to cycles/instructions once on the way out
+        inlined = fetched = 0
+        try:
+            for _ in range(max_cycles) if max_cycles is not None else count():
+                state = self._state
+                if state is fetch:
+                    if requests and self._service_request(): continue
+                    if predicate is not None and predicate(self):
+                        return StopReason.PREDICATE
+                    P = self.P
+                    pc = R[P]
+                    if breakpoints is not None and pc in breakpoints and pc != resume_pc:
+                        return StopReason.BREAKPOINT
+                    inlined += 1
+                    fetched += 1
+                    self.N2 = self.N1 = self.N0 = 0
+                    opcode = M[pc]
+                    self.I = opcode >> 4
+                    self.N = opcode & 0x0F
+                    R[P] = (pc + 1) & 0xFFFF
+                    self._state = execute
+                elif state is execute:
+                    inlined += 1
+                    opcode = (self.I << 4) | self.N
+                    dispatch[opcode](self)
+                    if opcode == 0x00:
+                        return StopReason.IDLE
+                else:
+                    self.tick()
+                resume_pc = None
+            return StopReason.MAX_CYCLES
+        finally:
+            self.cycles += inlined
+            self.instructions += fetched
+
+    def io_requested(self) -> bool:
+        # Any interrupt or DMA request line raised, checked by run loops before they start
+        return bool(self.INT or self.DMA_IN or self.DMA_OUT)
+
+    def _service_request(self) -> bool:
+        # At an instruction boundary (in S0), run the S2 or S3 cycle of the highest priority request, returns
+        # whether there was one. DMA goes before interrupts, which are only taken while IE is set.
+        if self.DMA_IN: state = self.dma_in_state
+        elif self.DMA_OUT: state = self.dma_out_state
+        elif self.INT and self.IE: state = self.interrupt_state
+        else: return False
+        self._state = state
+        state.tick()
+        return True
+
+    def spins_at(self, pc: int) -> bool:
+        # Whether the instruction at pc is a branch to itself, taken or not (see instructions.SPINS)
+        M = self.M
+        opcode = M[pc]
+        if opcode not in SPINS: return False
+        if CYCLES[opcode] == 3: return pc <= 0xFFFD and ((M[pc + 1] << 8) | M[pc + 2]) == pc
+        return (pc & 0xFF) != 0xFF and M[pc + 1] == (pc & 0xFF)
+
+    def spinning(self) -> bool:
+        # In S0 of a branch to itself that will be taken, it repeats until an external event changes its condition
+        if self._state is not self.fetch_state: return False
+        pc = self.R[self.P]
+        return self.spins_at(pc) and SPINS[self.M[pc]](self)
+
+    def waiting(self) -> bool:
+        # Idle or spinning with no request raised: nothing but an external event can change the CPU's state
+        return not self.io_requested() and (self.is_idle() or self.spinning())
+
+    def fast_forward(self, n: int) -> int:
+        # Skip up to n cycles of waiting(), leaving the CPU exactly as running them would: all n for IDL, whole
+        # iterations of a spinning branch. Returns the number of cycles skipped.
+        if self.io_requested(): return 0
+        if self.is_idle():
+            self.BUS = self.M[self.R[0]]
+            self.cycles += n
+            return n
+        if not self.spinning(): return 0
+        opcode = self.M[self.R[self.P]]
+        iterations = n // CYCLES[opcode]
+        if not iterations: return 0
+        self.N2 = self.N1 = self.N0 = 0
+        self.I = opcode >> 4
+        self.N = opcode & 0x0F
+        self.cycles += iterations * CYCLES[opcode]
+        self.instructions += iterations
+        return iterations * CYCLES[opcode]
+
+    def is_idle(self) -> bool:
+        # In S1 of IDL, which repeats until an interrupt or DMA request
+        return self._state is self.execute_state and self.I == 0 and self.N == 0
+
     def reset(self) -> None:
         self._state.reset()
         self.running = False
@@ -61,15 +287,152 @@ class CPU:
 
     def increment_register(self, reg: int) -> None:
         # 0xFFFF + 1 = 0x000
-        self.R[reg] = (self.R[reg] + 1) % 0x10000
+        self.R[reg] = (self.R[reg] + 1) & 0xFFFF
 
     def decrement_register(self, reg: int) -> None:
         # 0x0000 - 1 = 0xFFFF
-        self.R[reg] = self.R[reg] - 1 if self.R[reg] - 1 >= 0 else 0xFFFF
+        self.R[reg] = (self.R[reg] - 1) & 0xFFFF
 
     def increment_program_counter(self) -> None:
         self.increment_register(self.P)
 
+    def store(self, addr: int, val: int) -> None:
+        # Write a byte on behalf of an instruction (STR/STXD/INP), notifying write hooks first
+        if self._write_hooks:
+            for hook in self._write_hooks: hook(addr, addr + 1)
+        self.M[addr] = val
+
+    def load(self, addr: int, data: bytes) -> None:
+        # Copy data into memory starting at addr as one slice assignment
+        if not isinstance(data, (bytes, bytearray, memoryview)): data = bytes(data)
+        if not 0 <= addr <= addr + len(data) <= len(self.M): raise IndexError
+        for hook in self._write_hooks: hook(addr, addr + len(data))
+        self.M[addr:addr + len(data)] = data
+
+    def add_write_hook(self, hook: Callable[[int, int], None]) -> None:
+        # hook(start, end) is called before memory [start, end) is written through store() or load(). Hooks are
+        # kept in a tuple so a hook can remove itself while they are being called.
+        self._write_hooks += (hook,)
+
+    def remove_write_hook(self, hook: Callable[[int, int], None]) -> None:
+        hooks = list(self._write_hooks)
+        hooks.remove(hook)
+        self._write_hooks = tuple(hooks)
+
+    def fork(self) -> CPU:
+        # Copy of this CPU whose memory shares pages with this one's until either writes them. The image is written
+        # once to a temporary file that forks map copy-on-write, so the OS copies a page (mmap.PAGESIZE bytes) on
+        # its first write by any means, and a fork costs a mapping rather than a memory copy. Later forks reuse the
+        # file while this CPU's memory still matches it. Before Python 3.13 each mapping holds a file descriptor
+        # until close(); once the process runs out of them forks get a plain copy instead. Write hooks and devices
+        # (including the DMA device) aren't inherited.
+        image = self._image
+        try:
+            if image is None or image.data[:] != self.M.tobytes():
+                image_file = tempfile.TemporaryFile()
+                image_file.write(self.M)
+                image_file.flush()
+                image = self._image = _ForkImage(image_file, mmap.mmap(image_file.fileno(), len(self.M),
+                                                                       access=mmap.ACCESS_READ, **_UNTRACKED))
+            child = CPU(mmap.mmap(image.file.fileno(), len(image.data), access=mmap.ACCESS_COPY, **_UNTRACKED))
+            child._image = image
+        except OSError as e:
+            if e.errno not in (errno.EMFILE, errno.ENFILE): raise
+            child = CPU(bytearray(self.M))
+        for name in ('D', 'DF', 'B', 'P', 'X', 'N', 'I', 'T', 'IE', 'Q', 'BUS', 'N0', 'N1', 'N2',
+                     'INT', 'DMA_IN', 'DMA_OUT', 'cycles', 'instructions', 'running'):
+            setattr(child, name, getattr(self, name))
+        child.R[:] = self.R
+        child.EF[:] = self.EF
+        child._state = child._state_from_id(self._state_id(self._state))
+        prev_state = self._state_id(self.pause_state.prev_state)
+        child.pause_state.prev_state = None if prev_state == _NO_STATE else child._state_from_id(prev_state)
+        return child
+
+    def close(self) -> None:
+        # Release the memory mapping of a fork and the file descriptor it holds. The CPU can't be used afterwards.
+        if isinstance(self._memory, mmap.mmap):
+            self.M.release()
+            self._memory.close()
+        self._image = None
+
+    def __enter__(self) -> CPU:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def dump(self, start: int = 0, end: int = 2**16) -> bytes:
+        # Copy memory [start, end) out as bytes
+        if not 0 <= start <= end <= len(self.M): raise IndexError
+        return self.M[start:end].tobytes()
+
+    def snapshot(self, compress: bool = False) -> bytes:
+        # Serialize registers, I/O lines, counters, state machine position and memory into a versioned blob for
+        # restore(). compress trades a few hundred microseconds for a blob of mostly-empty memory a few KB long.
+        memory = zlib.compress(self._memory, 1) if compress else self._memory
+        header = _SNAPSHOT_HEADER.pack(
+            SNAPSHOT_MAGIC, SNAPSHOT_VERSION, SNAPSHOT_COMPRESSED if compress else 0,
+            self.D, self.DF, self.B, self.P, self.X, self.N, self.I, self.T, self.IE, self.Q, self.BUS,
+            *self.EF, self.N0, self.N1, self.N2, int(self.running),
+            self._state_id(self._state), self._state_id(self.pause_state.prev_state),
+            self.cycles, self.instructions, *self.R, self.INT, self.DMA_IN, self.DMA_OUT)
+        return b''.join((header, memory))
+
+    def restore(self, blob: bytes) -> None:
+        # Load a snapshot() blob into this CPU in place. Memory is written as one load(), so write hooks (e.g.
+        # block caches) see the whole image change.
+        try:
+            fields = _SNAPSHOT_HEADER.unpack_from(blob)
+        except struct.error:
+            raise ValueError("Snapshot is truncated.") from None
+        magic, version, flags = fields[:3]
+        if magic != SNAPSHOT_MAGIC: raise ValueError("Not a CPU snapshot.")
+        if version != SNAPSHOT_VERSION: raise ValueError(f"Unsupported snapshot version {version}.")
+        memory = memoryview(blob)[_SNAPSHOT_HEADER.size:]
+        if flags & SNAPSHOT_COMPRESSED: memory = zlib.decompress(memory)
+        if len(memory) != len(self.M): raise ValueError("Snapshot memory image has the wrong size.")
+        state = self._state_from_id(fields[22])
+        prev_state = None if fields[23] == _NO_STATE else self._state_from_id(fields[23])
+
+        (self.D, self.DF, self.B, self.P, self.X, self.N, self.I, self.T, self.IE, self.Q,
+         self.BUS) = fields[3:14]
+        self.EF[:] = fields[14:18]
+        self.N0, self.N1, self.N2 = fields[18:21]
+        self.running = bool(fields[21])
+        self.cycles, self.instructions = fields[24:26]
+        self.R[:] = array('H', fields[26:42])
+        self.INT, self.DMA_IN, self.DMA_OUT = fields[42:45]
+        self._state = state
+        self.pause_state.prev_state = prev_state
+        self.load(0, memory)
+
+    def _own_state(self, state: State) -> State:
+        # the CPU's preallocated instance of state's type, or state itself for a type the CPU doesn't preallocate
+        for name in _SNAPSHOT_STATES:
+            own = getattr(self, name)
+            if own is state or type(own) is type(state): return own
+        return state
+
+    def _state_id(self, state: Optional[State]) -> int:
+        if state is None: return _NO_STATE
+        for id, name in enumerate(_SNAPSHOT_STATES):
+            if getattr(self, name) is state: return id
+        raise ValueError("Only the CPU's own states can be saved in a snapshot.")
+
+    def _state_from_id(self, id: int) -> State:
+        if id >= len(_SNAPSHOT_STATES): raise ValueError(f"Invalid state {id} in snapshot.")
+        return getattr(self, _SNAPSHOT_STATES[id])
+
+    def attach_device(self, port: int, device: Device) -> None:
+        if port not in range(1, 8): raise IndexError
+        self.devices[port] = device
+
+    def detach_device(self, port: int) -> Optional[Device]:
+        if port not in range(1, 8): raise IndexError
+        device, self.devices[port] = self.devices[port], None
+        return device
+
     def get_external_flag(self, id: int) -> int:
         return self.EF[id - 1]
 
@@ -0,0 +1,164 @@
+from __future__ import annotations
+from instructions import DISPATCH
+from typing import Mapping, NamedTuple, Optional, TYPE_CHECKING, Union
+if TYPE_CHECKING:
+    from cpu import CPU
+    from pacing import Runner
+
+
+X = 16  # register selector for R(X) in the access tables below
+
+
+def _access_tables() -> tuple[list[int], list[int]]:
+    # register holding the data address each opcode reads/writes: 0-15 for that register, X for R(X), -1 for none.
+    # Immediate operands and branch targets are part of the instruction and don't count as data reads.
+    reads, writes = [-1] * 0x100, [-1] * 0x100
+    for N in range(0x10):
+        reads[0x00 | N] = N             # LDN (IDL puts M(R(0)) on the bus)
+        reads[0x40 | N] = N             # LDA
+        writes[0x50 | N] = N            # STR
+    for opcode in [*range(0x61, 0x68), 0x70, 0x71, 0x72, 0x74, 0x75, 0x77, *range(0xF0, 0xF6), 0xF7]:
+        reads[opcode] = X               # OUT, RET, DIS, LDXA, ADC, SDB, SMB, LDX, OR, AND, XOR, ADD, SD, SM
+    for opcode in [*range(0x69, 0x70), 0x73, 0x78]:
+        writes[opcode] = X              # INP, STXD, SAV
+    writes[0x79] = 2                    # MARK
+    return reads, writes
+
+
+READ_REGISTER, WRITE_REGISTER = _access_tables()
+
+
+class Hit(NamedTuple):
+    kind: str       # 'break', 'read' or 'write'
+    addr: int       # breakpoint address or watched memory address
+    pc: int         # address of the triggering instruction
+    opcode: int
+
+    def __str__(self) -> str:
+        if self.kind == 'break': return f"Breakpoint at {self.pc:04X} ({self.opcode:02X})"
+        return f"Watchpoint: {self.opcode:02X} at {self.pc:04X} {self.kind}s {self.addr:04X}"
+
+
+class Debugger:
+    # Execution engine with breakpoints on instruction addresses and read/write watchpoints on memory, kept as 64K
+    # bitmaps so each check is one index. A hit stops run_cycles() in S0 of the triggering instruction, before it
+    # executes, and is left in `hit`; the next run lets that instruction execute. Watchpoints only see data accesses
+    # made by instructions, not host writes. With nothing set, run_cycles() is engine.run_cycles(). Addresses can
+    # also be given as names from symbols (e.g. assembler.Image.symbols).
+    def __init__(self, cpu: CPU, engine: Optional[Runner] = None, symbols: Optional[Mapping[str, int]] = None) -> None:
+        self.cpu = cpu
+        self.engine = engine if engine is not None else cpu
+        self.symbols = symbols or {}
+        self.breakpoints = bytearray(2**16)
+        self.read_watch = bytearray(2**16)
+        self.write_watch = bytearray(2**16)
+        self._breakpoints: set[int] = set()
+        self._watchpoints: list[tuple[int, int, str]] = []
+        self.hit: Optional[Hit] = None
+        self._resume_pc: Optional[int] = None
+
+    def armed(self) -> bool:
+        return bool(self._breakpoints or self._watchpoints)
+
+    def resolve(self, addr: Union[int, str]) -> int:
+        if isinstance(addr, int): return addr
+        if addr not in self.symbols: raise ValueError(f"Unknown symbol: {addr}")
+        return self.symbols[addr]
+
+    def add_breakpoint(self, addr: Union[int, str]) -> None:
+        addr = self.resolve(addr)
+        self._breakpoints.add(addr)
+        self.breakpoints[addr] = 1
+
+    def remove_breakpoint(self, addr: Union[int, str]) -> None:
+        addr = self.resolve(addr)
+        self._breakpoints.remove(addr)
+        self.breakpoints[addr] = 0
+
+    def add_watchpoint(self, start: Union[int, str], end: Union[int, str], kind: str = 'write') -> None:
+        # Watch memory [start, end) for 'read', 'write' or 'access' (either)
+        start, end = self.resolve(start), self.resolve(end)
+        if kind not in ('read', 'write', 'access'): raise ValueError(f"Invalid watchpoint kind: {kind}")
+        if not 0 <= start < end <= 2**16: raise IndexError
+        self._watchpoints.append((start, end, kind))
+        self._update_watch()
+
+    def remove_watchpoint(self, start: Union[int, str], end: Union[int, str], kind: str = 'write') -> None:
+        self._watchpoints.remove((self.resolve(start), self.resolve(end), kind))
+        self._update_watch()
+
+    def clear(self) -> None:
+        for addr in list(self._breakpoints): self.remove_breakpoint(addr)
+        self._watchpoints.clear()
+        self._update_watch()
+
+    def _update_watch(self) -> None:
+        # rebuild both bitmaps so overlapping watchpoints can be removed independently
+        self.read_watch[:] = self.write_watch[:] = bytes(2**16)
+        for start, end, kind in self._watchpoints:
+            if kind != 'write': self.read_watch[start:end] = b'\x01' * (end - start)
+            if kind != 'read': self.write_watch[start:end] = b'\x01' * (end - start)
+
+    def run_cycles(self, n: int, stop_on_idle: bool = False) -> int:
+        # Equivalent to CPU.run_cycles(n), stopping early at a breakpoint or watchpoint hit. With stop_on_idle,
+        # returns early once IDL has executed. Returns the number of cycles executed.
+        self.hit = None
+        if not self.armed():
+            self._resume_pc = None
+            return self.engine.run_cycles(n, stop_on_idle)
+
+        cpu = self.cpu
+        M, R = cpu.M, cpu.R
+        fetch, execute = cpu.fetch_state, cpu.execute_state
+        dispatch = DISPATCH
+        breakpoints, read_watch, write_watch = self.breakpoints, self.read_watch, self.write_watch
+        reads, writes = READ_REGISTER, WRITE_REGISTER
+        resume_pc, self._resume_pc = self._resume_pc, None
+
+        requests = cpu.io_requested()
+
+        # inlined states are counted here and added to cycles/instructions once on the way out
+        cycle = -1
+        fetched = ticked = 0
+        try:
+            for cycle in range(n):
+                state = cpu._state
+                if state is fetch:
+                    if requests and cpu._service_request():
+                        ticked += 1
+                        continue
+                    P = cpu.P
+                    pc = R[P]
+                    opcode = M[pc]
+                    if pc != resume_pc:
+                        if breakpoints[pc]:
+                            return self._stop(Hit('break', pc, pc, opcode), cycle)
+                        if (reg := reads[opcode]) >= 0 and read_watch[addr := R[cpu.X if reg == X else reg]]:
+                            return self._stop(Hit('read', addr, pc, opcode), cycle)
+                        if (reg := writes[opcode]) >= 0 and write_watch[addr := R[cpu.X if reg == X else reg]]:
+                            return self._stop(Hit('write', addr, pc, opcode), cycle)
+                    resume_pc = None
+                    fetched += 1
+                    cpu.N2 = cpu.N1 = cpu.N0 = 0
+                    cpu.I = opcode >> 4
+                    cpu.N = opcode & 0x0F
+                    R[P] = (pc + 1) & 0xFFFF
+                    cpu._state = execute
+                elif state is execute:
+                    opcode = (cpu.I << 4) | cpu.N
+                    dispatch[opcode](cpu)
+                    if stop_on_idle and opcode == 0x00: return cycle + 1
+                else:
+                    ticked += 1
+                    cpu.tick()
+                    if stop_on_idle and cpu.is_idle(): return cycle + 1
+            return n
+        finally:
+            cpu.cycles += cycle + 1 - ticked - (self.hit is not None)
+            cpu.instructions += fetched
+
+    def _stop(self, hit: Hit, cycle: int) -> int:
+        # record a hit found before executing the fetch at `cycle`, returns the cycles executed before it
+        self.hit = hit
+        self._resume_pc = hit.pc
+        return cycle
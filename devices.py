@@ -0,0 +1,90 @@
+from __future__ import annotations
+import sys
+from collections import deque
+from typing import BinaryIO, Iterable, Optional
+
+
+PORTS = range(1, 8)     # N of OUT 1-7 and INP 9-F (N & 7)
+
+
+class Device:
+    # Peripheral on an I/O port. OUT calls write() with the byte it puts on the bus, INP calls read() for the byte
+    # to put on the bus, both while the instruction executes. Devices only see the byte: engines like jit.JIT may
+    # hold registers outside the CPU while a device is called.
+    def write(self, byte: int) -> None:
+        pass
+
+    def read(self) -> int:
+        return 0
+
+
+class QueueDevice(Device):
+    # In-memory device: reads come from bytes queued with feed() (`empty` once they run out), writes are collected
+    # until take()
+    def __init__(self, data: Iterable[int] = b'', empty: int = 0) -> None:
+        self.input: deque[int] = deque(data)
+        self.output = bytearray()
+        self.empty = empty
+
+    def feed(self, data: Iterable[int]) -> None:
+        self.input.extend(data)
+
+    def take(self) -> bytes:
+        data = bytes(self.output)
+        self.output.clear()
+        return data
+
+    def write(self, byte: int) -> None:
+        self.output.append(byte)
+
+    def read(self) -> int:
+        return self.input.popleft() if self.input else self.empty
+
+
+class StreamDevice(Device):
+    # Device on binary streams. Writes are buffered and flushed every buffer_size bytes or on flush()/close();
+    # reads take one byte from input (`eof` once it's exhausted or if there is none).
+    def __init__(self, input: Optional[BinaryIO] = None, output: Optional[BinaryIO] = None,
+                 buffer_size: int = 4096, eof: int = 0) -> None:
+        self.input = input
+        self.output = output
+        self.buffer_size = buffer_size
+        self.eof = eof
+        self._buffer = bytearray()
+
+    def write(self, byte: int) -> None:
+        if self.output is None: return
+        self._buffer.append(byte)
+        if len(self._buffer) >= self.buffer_size: self.flush()
+
+    def read(self) -> int:
+        data = self.input.read(1) if self.input is not None else b''
+        return data[0] if data else self.eof
+
+    def flush(self) -> None:
+        if self._buffer:
+            self.output.write(self._buffer)
+            self._buffer.clear()
+        if self.output is not None: self.output.flush()
+
+    def close(self) -> None:
+        self.flush()
+
+
+class StdioDevice(StreamDevice):
+    # Reads from stdin and writes to stdout, as bytes
+    def __init__(self, buffer_size: int = 4096, eof: int = 0) -> None:
+        super().__init__(sys.stdin.buffer, sys.stdout.buffer, buffer_size, eof)
+
+
+class FileDevice(StreamDevice):
+    # Reads from the file at input_path and/or writes to the file at output_path
+    def __init__(self, input_path: Optional[str] = None, output_path: Optional[str] = None,
+                 buffer_size: int = 4096, eof: int = 0) -> None:
+        super().__init__(open(input_path, 'rb') if input_path else None,
+                         open(output_path, 'wb') if output_path else None, buffer_size, eof)
+
+    def close(self) -> None:
+        super().close()
+        for stream in (self.input, self.output):
+            if stream is not None: stream.close()
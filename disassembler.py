@@ -0,0 +1,58 @@
+from __future__ import annotations
+from opcodes import BYTE, NONE, OPCODES, PORT, REGISTER, SHORT
+from typing import Mapping, NamedTuple, Optional, Sequence
+
+
+class Instruction(NamedTuple):
+    addr: int
+    data: bytes         # opcode and operand bytes
+    text: str           # mnemonic and operand, e.g. 'LDI #60', or 'DB #31' for an opcode the CPU doesn't implement
+
+    def format(self, label: str = '') -> str:
+        # A line in the style of the listings in programs/: ADDR OPCODES [LABEL:] MNEMONIC
+        head = f"{self.addr:04X} {self.data.hex().upper()}"
+        if label: head = f"{head:<10}{label + ':':>5}"
+        return f"{head:<15} {self.text}"
+
+
+def decode(M: Sequence[int], addr: int, names: Optional[Mapping[int, str]] = None) -> Instruction:
+    # The instruction at addr. Branch targets are shown as '*' when they are the instruction itself, then by name
+    # from names (address: label), then as a hex address.
+    opcode = M[addr]
+    entry = OPCODES[opcode]
+    data = bytes(M[(addr + i) & 0xFFFF] for i in range(entry.length))
+    if not entry.mnemonic: return Instruction(addr, data, f'DB #{opcode:02X}')
+    operand = entry.operand
+    if operand == NONE: return Instruction(addr, data, entry.mnemonic)
+    if operand == REGISTER: value = f'{opcode & 0x0F}' if opcode & 0x0F < 10 else f'R{opcode & 0x0F:X}'  # not a label
+    elif operand == PORT: value = f'{opcode & 0x07}'
+    elif operand == BYTE: value = f'#{data[1]:02X}'
+    else:
+        if operand == SHORT: target = ((addr + 1) & 0xFF00) | data[1]      # the page of the target byte
+        else: target = (data[1] << 8) | data[2]
+        if target == addr: value = '*'
+        elif names and target in names: value = names[target]
+        else: value = f'#{target:04X}'
+    return Instruction(addr, data, f'{entry.mnemonic} {value}')
+
+
+def disassemble(M: Sequence[int], start: int, end: int,
+                symbols: Optional[Mapping[str, int]] = None) -> list[Instruction]:
+    # Decode memory [start, end) in one pass, each instruction starting where the previous one ended. The last one
+    # may read operand bytes past end.
+    names = {addr: name for name, addr in symbols.items()} if symbols else None
+    instructions = []
+    addr = start
+    while addr < end:
+        instruction = decode(M, addr, names)
+        instructions.append(instruction)
+        addr += len(instruction.data)
+    return instructions
+
+
+def listing(M: Sequence[int], start: int, end: int, symbols: Optional[Mapping[str, int]] = None) -> str:
+    # Disassembly of memory [start, end) as a program listing, which load_listing() (and, through its mnemonic
+    # column, the assembler) reads back
+    names = {addr: name for name, addr in symbols.items()} if symbols else {}
+    return ''.join(instruction.format(names.get(instruction.addr, '')) + '\n'
+                   for instruction in disassemble(M, start, end, symbols))
@@ -0,0 +1,67 @@
+from __future__ import annotations
+import sys
+import time
+from typing import Callable, Optional, TextIO, TYPE_CHECKING
+if TYPE_CHECKING:
+    from cpu import CPU
+
+
+CLEAR_SCREEN = '\x1b[2J\x1b[H'    # erase display, cursor home
+CLEAR_LINE = '\x1b[2K\r'           # erase current line, cursor to column 1
+
+
+def column(n: int) -> str:
+    # move cursor to column n (1-based) of the current line
+    return f'\x1b[{n}G'
+
+
+# status line fields: name, column, formatter
+STATUS_FIELDS: list[tuple[str, int, Callable[[CPU], str]]] = [
+    ('bus', 1, lambda cpu: f"DATA: 0x{cpu.BUS:02X}"),
+    ('q', 14, lambda cpu: f"Q: {cpu.Q}"),
+    ('ef', 22, lambda cpu: f"EF1-4: {''.join(str(val) for val in cpu.EF)}"),
+    ('running', 35, lambda cpu: 'Running' if cpu.running else 'Paused '),
+]
+
+
+class StatusRenderer:
+    # Draws the CPU status line at most `fps` times a second, rewriting only the fields that changed since the
+    # last frame with ANSI cursor movement
+    def __init__(self, stream: Optional[TextIO] = None, fps: float = 30) -> None:
+        self.stream = stream if stream is not None else sys.stdout
+        self.frame_time = 1 / fps
+        self._next_frame = 0.0
+        self._drawn: dict[str, str] = {}
+
+    def header(self, fname: str, truncate: bool = False) -> None:
+        lines = [f"Executing {fname}"]
+        if not truncate:
+            lines += ["<Esc> to exit.",
+                      "<Space> to open main menu.",
+                      "<Ctrl+R> to reset processor.",
+                      "<Ctrl+[1:4]> to toggle external flag."]
+        self.stream.write(CLEAR_SCREEN + '\n'.join(lines) + '\n')
+        self.stream.flush()
+        self._drawn.clear()  # status line has to be redrawn in full
+
+    def render(self, cpu: CPU, force: bool = False) -> bool:
+        # Redraw changed fields if a frame is due (or force), returns whether a frame was drawn
+        now = time.perf_counter()
+        if not force and now < self._next_frame: return False
+        self._next_frame = now + self.frame_time
+
+        out = [] if self._drawn else [CLEAR_LINE]
+        for name, col, formatter in STATUS_FIELDS:
+            text = formatter(cpu)
+            if self._drawn.get(name) != text:
+                out.append(column(col) + text)
+                self._drawn[name] = text
+        if out:
+            self.stream.write(''.join(out))
+            self.stream.flush()
+        return True
+
+    def newline(self) -> None:
+        # leave the status line, e.g. before printing a menu below it
+        self.stream.write('\n')
+        self._drawn.clear()
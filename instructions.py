@@ -1,105 +1,61 @@
 from __future__ import annotations
-import states
-from typing import TYPE_CHECKING
+from alu import ADD_DF, ADD_RESULT, CARRY_IN, SHL_DF, SHL_RESULT, SHR_DF, SHR_RESULT, SUB_DF, SUB_RESULT
+from functools import partial
+from opcodes import OPCODES
+from typing import Callable, TYPE_CHECKING
 if TYPE_CHECKING:
     from cpu import CPU
 
 
 def decode(cpu: CPU, I: int, N: int):
-    match I, N:
-        case 0x0, 0x0:                      IDL(cpu)
-        case 0x0, N:                        LDN(cpu, N)
-        case 0x1, N:                        INC(cpu, N)
-        case 0x2, N:                        DEC(cpu, N)
-        case 0x3, 0x0:                      BR(cpu)
-        case 0x3, N if 0x4 <= N <= 0x7:     BN(cpu, N)
-        case 0x3, N if 0xC <= N <= 0xF:     BNN(cpu, N)
-        case 0x4, N:                        LDA(cpu, N)
-        case 0x5, N:                        STR(cpu, N)
-        case 0x6, 0x0:                      IRX(cpu)
-        case 0x6, N if 0x1 <= N <= 0x7:     OUT(cpu, N)
-        case 0x6, N if 0x9 <= N <= 0xF:     INP(cpu, N)
-        case 0x7, 0x2:                      LDXA(cpu)
-        case 0x7, 0x3:                      STXD(cpu)
-        case 0x7, 0x4:                      ADC(cpu)
-        case 0x7, 0x5:                      SDB(cpu)
-        case 0x7, 0x6:                      SHRC(cpu)
-        case 0x7, 0x7:                      SMB(cpu)
-        case 0x7, 0xA:                      REQ(cpu)
-        case 0x7, 0xB:                      SEQ(cpu)
-        case 0x7, 0xC:                      ADCI(cpu)
-        case 0x7, 0xD:                      SDBI(cpu)
-        case 0x7, 0xE:                      SHLC(cpu)
-        case 0x7, 0xF:                      SMBI(cpu)
-        case 0x8, N:                        GLO(cpu, N)
-        case 0x9, N:                        GHI(cpu, N)
-        case 0xA, N:                        PLO(cpu, N)
-        case 0xB, N:                        PHI(cpu, N)
-        case 0xC, 0x2:                      LBZ(cpu)
-        case 0xC, 0x4:                      NOP(cpu)
-        case 0xC, 0xA:                      LBNZ(cpu)
-        case 0xD, N:                        SEP(cpu, N)
-        case 0xE, N:                        SEX(cpu, N)
-        case 0xF, 0x0:                      LDX(cpu)
-        case 0xF, 0x1:                      OR(cpu)
-        case 0xF, 0x2:                      AND(cpu)
-        case 0xF, 0x3:                      XOR(cpu)
-        case 0xF, 0x4:                      ADD(cpu)
-        case 0xF, 0x5:                      SD(cpu)
-        case 0xF, 0x6:                      SHR(cpu)
-        case 0xF, 0x7:                      SM(cpu)
-        case 0xF, 0x8:                      LDI(cpu)
-        case 0xF, 0x9:                      ORI(cpu)
-        case 0xF, 0xA:                      ANI(cpu)
-        case 0xF, 0xB:                      XRI(cpu)
-        case 0xF, 0xC:                      ADI(cpu)
-        case 0xF, 0xD:                      SDI(cpu)
-        case 0xF, 0xE:                      SHL(cpu)
-        case 0xF, 0xF:                      SMI(cpu)
-        case _, _: raise NotImplementedError("Attempted to execute invalid instruction.")
+    DISPATCH[(I << 4) | N](cpu)
 
 
 def ADC(cpu: CPU):
     # Add with Carry (0x74)
     #   M(R(X))+D+DF-->DF,D
-    cpu.DF = 0 if (sum := cpu.D + cpu.M[cpu.R[cpu.X]] + cpu.DF) <= 0xFF else 1
-    cpu.D = sum & 0xFF
-    cpu.set_state(states.Fetch())
+    i = (cpu.DF << 16) | (cpu.D << 8) | cpu.M[cpu.R[cpu.X]]
+    cpu.DF = ADD_DF[i]
+    cpu.D = ADD_RESULT[i]
+    cpu._state = cpu.fetch_state
 
 
 def ADCI(cpu: CPU):
     # Add with Carry, Immediate (0x7C)
     #   M(R(P))+D+DF-->DF,D
     #   R(P)+1
-    cpu.DF = 0 if (sum := cpu.D + cpu.M[cpu.R[cpu.P]] + cpu.DF) <= 0xFF else 1
+    i = (cpu.DF << 16) | (cpu.D << 8) | cpu.M[cpu.R[cpu.P]]
     cpu.increment_program_counter()
-    cpu.D = sum & 0xFF
-    cpu.set_state(states.Fetch())
+    cpu.DF = ADD_DF[i]
+    cpu.D = ADD_RESULT[i]
+    cpu._state = cpu.fetch_state
 
 
 def ADD(cpu: CPU):
     # Add (0xF4)
     #   M(R(X))+D-->DF,D
-    cpu.DF = 0 if (sum := cpu.D + cpu.M[cpu.R[cpu.X]]) <= 0xFF else 1
-    cpu.D = sum & 0xFF
-    cpu.set_state(states.Fetch())
+    i = (cpu.D << 8) | cpu.M[cpu.R[cpu.X]]
+    cpu.DF = ADD_DF[i]
+    cpu.D = ADD_RESULT[i]
+    cpu._state = cpu.fetch_state
 
 
 def ADI(cpu: CPU):
     # Add Immediate (0xFC)
     #   M(R(P))+D-->DF,D
     #   R(P)+1
-    cpu.DF = 0 if (sum := cpu.D + cpu.M[cpu.R[cpu.P]]) <= 0xFF else 1
+    i = (cpu.D << 8) | cpu.M[cpu.R[cpu.P]]
     cpu.increment_program_counter()
-    cpu.D = sum & 0xFF
-    cpu.set_state(states.Fetch())
+    cpu.DF = ADD_DF[i]
+    cpu.D = ADD_RESULT[i]
+    cpu._state = cpu.fetch_state
 
 
 def AND(cpu: CPU):
     # AND (0xF2)
     #   M(R(X)) AND D-->D
     cpu.D &= cpu.M[cpu.R[cpu.X]]
-    cpu.set_state(states.Fetch())
+    cpu._state = cpu.fetch_state
 
 
 def ANI(cpu: CPU):
@@ -107,7 +63,7 @@ def ANI(cpu: CPU):
     #   M(R(P)) AND D-->R(P)+1
     cpu.D &= cpu.M[cpu.R[cpu.P]]
     cpu.increment_register(cpu.P)
-    cpu.set_state(states.Fetch())
+    cpu._state = cpu.fetch_state
 
 
 def BN(cpu: CPU, N: int):
@@ -115,10 +71,10 @@ def BN(cpu: CPU, N: int):
     #   IF EF(1/2/3/4)=1, M(R(P))-->R(P).0
     #   ELSE R(P)+1
     if cpu.get_external_flag(N - 3) == 1:
-        cpu.R[cpu.P] = (cpu.R[cpu.P] & 0xFF00) | (cpu.M[cpu.R[cpu.P]] & 0xFF)
+        cpu.R[cpu.P] = (cpu.R[cpu.P] & 0xFF00) | cpu.M[cpu.R[cpu.P]]
     else:
         cpu.increment_program_counter()
-    cpu.set_state(states.Fetch())
+    cpu._state = cpu.fetch_state
 
 
 def BNN(cpu: CPU, N: int):
@@ -126,69 +82,83 @@ def BNN(cpu: CPU, N: int):
     #   IF EF(1/2/3/4)=0, M(R(P))-->R(P).0
     #   ELSE R(P)+1
     if cpu.get_external_flag(N - 11) == 0:
-        cpu.R[cpu.P] = (cpu.R[cpu.P] & 0xFF00) | (cpu.M[cpu.R[cpu.P]] & 0xFF)
+        cpu.R[cpu.P] = (cpu.R[cpu.P] & 0xFF00) | cpu.M[cpu.R[cpu.P]]
     else:
         cpu.increment_program_counter()
-    cpu.set_state(states.Fetch())
+    cpu._state = cpu.fetch_state
 
 
 def BR(cpu: CPU):
     # Unconditional Short Branch (0x30)
     #   M(R(P))-->R(P).0
-    cpu.R[cpu.P] = (cpu.R[cpu.P] & 0xFF00) | (cpu.M[cpu.R[cpu.P]] & 0xFF)
-    cpu.set_state(states.Fetch())
+    cpu.R[cpu.P] = (cpu.R[cpu.P] & 0xFF00) | cpu.M[cpu.R[cpu.P]]
+    cpu._state = cpu.fetch_state
 
 
 def DEC(cpu: CPU, N: int):
     # Decrement Register N (0x2N)
     #   R(N)-1
     cpu.decrement_register(N)
-    cpu.set_state(states.Fetch())
+    cpu._state = cpu.fetch_state
+
+
+def DIS(cpu: CPU):
+    # Disable (0x71)
+    #   M(R(X))-->(X,P)
+    #   R(X)+1
+    #   0-->IE
+    _return(cpu, 0)
 
 
 def IDL(cpu: CPU):
     # Idle (0x00):
     #   M(R(0))-->BUS
+    #   repeats S1 until an interrupt or DMA request ends the instruction
     cpu.BUS = cpu.M[cpu.R[0]]
+    if cpu.DMA_IN or cpu.DMA_OUT or (cpu.INT and cpu.IE): cpu._state = cpu.fetch_state
 
 
 def INC(cpu: CPU, N: int):
     # Increment Register N (0x1N):
     #   R(N)+1
     cpu.increment_register(N)
-    cpu.set_state(states.Fetch())
+    cpu._state = cpu.fetch_state
 
 
 def INP(cpu: CPU, N: int):
     # INPUT (0x6N)
+    #   device(N & 7).read()-->BUS, if one is attached
     #   BUS-->M(R(X))
     #   BUS-->D
     cpu.N2 = 1 if N & 0x4 else 0
     cpu.N1 = 1 if N & 0x2 else 0
     cpu.N0 = 1 if N & 0x1 else 0
-    cpu.M[cpu.R[cpu.X]] = cpu.D = cpu.BUS & 0xFF
-    cpu.set_state(states.Fetch())
+    device = cpu.devices[N & 0x7]
+    if device is not None: cpu.BUS = device.read() & 0xFF
+    cpu.D = cpu.BUS & 0xFF
+    cpu.store(cpu.R[cpu.X], cpu.D)
+    cpu._state = cpu.fetch_state
 
 
 def IRX(cpu: CPU):
     # Increment Register X (0x60)
     #   R(X)+1
     cpu.increment_register(cpu.X)
-    cpu.set_state(states.Fetch())
+    cpu._state = cpu.fetch_state
 
 
 def GHI(cpu: CPU, N: int):
     # Get High Register N
     #   R(N).1-->D
     cpu.D = (cpu.R[N] >> 8) & 0xFF
-    cpu.set_state(states.Fetch())
+    cpu._state = cpu.fetch_state
 
 
 def GLO(cpu: CPU, N: int):
     # Get Low Register N
     #   R(N).0-->D
     cpu.D = cpu.R[N] & 0xFF
-    cpu.set_state(states.Fetch())
+    cpu._state = cpu.fetch_state
 
 
 def LBNZ(cpu: CPU):
@@ -196,18 +166,18 @@ def LBNZ(cpu: CPU):
     #   IF D NOT 0,M(R(P))-->R(P).1
     #       M(R(P)+1)-->R(P).0
     #   ELSE R(P)+2
-    if isinstance(cpu.get_state(), states.Execute):
+    if cpu._state is cpu.execute_state:
         # S1
         cpu.increment_program_counter()
-        cpu.set_state(states.ForceExecute())
+        cpu._state = cpu.force_execute_state
     else:
         # force S1
         if cpu.D != 0:
-            cpu.R[cpu.P] = ((cpu.M[cpu.R[cpu.P] - 1] & 0xFF) << 8) | (cpu.M[cpu.R[cpu.P]] & 0xFF)
+            cpu.R[cpu.P] = (cpu.M[cpu.R[cpu.P] - 1] << 8) | cpu.M[cpu.R[cpu.P]]
         else:
             cpu.increment_program_counter()
 
-        cpu.set_state(states.Fetch())
+        cpu._state = cpu.fetch_state
 
 
 def LBZ(cpu: CPU):
@@ -215,18 +185,18 @@ def LBZ(cpu: CPU):
     #   IF D=0,M(R(P))-->R(P).1
     #       M(R(P)+1)-->R(P).0
     #   ELSE R(P)+2
-    if isinstance(cpu.get_state(), states.Execute):
+    if cpu._state is cpu.execute_state:
         # S1
         cpu.increment_program_counter()
-        cpu.set_state(states.ForceExecute())
+        cpu._state = cpu.force_execute_state
     else:
         # force S1
         if cpu.D == 0:
-            cpu.R[cpu.P] = ((cpu.M[cpu.R[cpu.P] - 1] & 0xFF) << 8) | (cpu.M[cpu.R[cpu.P]] & 0xFF)
+            cpu.R[cpu.P] = (cpu.M[cpu.R[cpu.P] - 1] << 8) | cpu.M[cpu.R[cpu.P]]
         else:
             cpu.increment_program_counter()
 
-        cpu.set_state(states.Fetch())
+        cpu._state = cpu.fetch_state
 
 
 def LDA(cpu: CPU, N: int):
@@ -235,7 +205,7 @@ def LDA(cpu: CPU, N: int):
     #   R(N)+1
     cpu.D = cpu.M[cpu.R[N]]
     cpu.increment_register(N)
-    cpu.set_state(states.Fetch())
+    cpu._state = cpu.fetch_state
 
 
 def LDI(cpu: CPU):
@@ -244,21 +214,21 @@ def LDI(cpu: CPU):
     #   R(P)+1
     cpu.D = cpu.M[cpu.R[cpu.P]]
     cpu.increment_program_counter()
-    cpu.set_state(states.Fetch())
+    cpu._state = cpu.fetch_state
 
 
 def LDN(cpu: CPU, N: int):
     # Load via N (0x0N):
     #   M(R(N))-->D (for N>0)
     cpu.D = cpu.M[cpu.R[N]]
-    cpu.set_state(states.Fetch())
+    cpu._state = cpu.fetch_state
 
 
 def LDX(cpu: CPU):
     # Load via X (0xF0):
     #   M(R(X))-->D
     cpu.D = cpu.M[cpu.R[cpu.X]]
-    cpu.set_state(states.Fetch())
+    cpu._state = cpu.fetch_state
 
 
 def LDXA(cpu: CPU):
@@ -267,20 +237,33 @@ def LDXA(cpu: CPU):
     #   R(X)+1
     cpu.D = cpu.M[cpu.R[cpu.X]]
     cpu.increment_register(cpu.X)
-    cpu.set_state(states.Fetch())
+    cpu._state = cpu.fetch_state
+
+
+def MARK(cpu: CPU):
+    # Push X, P to Stack (0x79)
+    #   (X,P)-->T
+    #   (X,P)-->M(R(2))
+    #   P-->X
+    #   R(2)-1
+    cpu.T = (cpu.X << 4) | cpu.P
+    cpu.store(cpu.R[2], cpu.T)
+    cpu.X = cpu.P
+    cpu.decrement_register(2)
+    cpu._state = cpu.fetch_state
 
 
 def NOP(cpu: CPU):
     # No Operation (0xC4):
     #   CONTINUE
-    cpu.set_state(states.ForceExecute())
+    cpu._state = cpu.force_execute_state
 
 
 def OR(cpu: CPU):
     # OR (0xF1)
     #   M(R(X)) OR D-->D
     cpu.D |= cpu.M[cpu.R[cpu.X]]
-    cpu.set_state(states.Fetch())
+    cpu._state = cpu.fetch_state
 
 
 def ORI(cpu: CPU):
@@ -288,194 +271,220 @@ def ORI(cpu: CPU):
     #   M(R(P)) OR D-->R(P)+1
     cpu.D |= cpu.M[cpu.R[cpu.P]]
     cpu.increment_register(cpu.P)
-    cpu.set_state(states.Fetch())
+    cpu._state = cpu.fetch_state
 
 
 def OUT(cpu: CPU, N: int):
     # OUTPUT (0x6N)
     #   M(R(X))-->BUS
+    #   BUS-->device(N).write(), if one is attached
     #   R(X)+1
     cpu.N2 = 1 if N & 0x4 else 0
     cpu.N1 = 1 if N & 0x2 else 0
     cpu.N0 = 1 if N & 0x1 else 0
-    cpu.BUS = cpu.M[cpu.R[cpu.X]] & 0xFF
+    cpu.BUS = cpu.M[cpu.R[cpu.X]]
+    device = cpu.devices[N]
+    if device is not None: device.write(cpu.BUS)
     cpu.increment_register(cpu.X)
-    cpu.set_state(states.Fetch())
+    cpu._state = cpu.fetch_state
 
 
 def PHI(cpu: CPU, N: int):
     # Put High Register N
     #   D-->R(N).1
     cpu.R[N] = (cpu.R[N] & 0x00FF) | (cpu.D << 8)
-    cpu.set_state(states.Fetch())
+    cpu._state = cpu.fetch_state
 
 
 def PLO(cpu: CPU, N: int):
     # Put Low Register N
     #   D-->R(N).0
     cpu.R[N] = (cpu.R[N] & 0xFF00) | cpu.D
-    cpu.set_state(states.Fetch())
+    cpu._state = cpu.fetch_state
 
 
 def REQ(cpu: CPU):
     # Reset Q (0x7A)
     #   0-->Q
     cpu.Q = 0
-    cpu.set_state(states.Fetch())
+    cpu._state = cpu.fetch_state
+
+
+def RET(cpu: CPU):
+    # Return (0x70)
+    #   M(R(X))-->(X,P)
+    #   R(X)+1
+    #   1-->IE
+    _return(cpu, 1)
+
+
+def SAV(cpu: CPU):
+    # Save (0x78)
+    #   T-->M(R(X))
+    cpu.store(cpu.R[cpu.X], cpu.T)
+    cpu._state = cpu.fetch_state
 
 
 def SD(cpu: CPU):
     # Subtract D (0xF5)
     #   M(R(X))-D-->DF,D
-    cpu.DF = 0 if (diff := cpu.M[cpu.R[cpu.X]] + (~cpu.D & 0xFF) + 1) <= 0xFF else 1
-    cpu.D = diff & 0xFF
-    cpu.set_state(states.Fetch())
+    i = CARRY_IN | (cpu.M[cpu.R[cpu.X]] << 8) | cpu.D
+    cpu.DF = SUB_DF[i]
+    cpu.D = SUB_RESULT[i]
+    cpu._state = cpu.fetch_state
 
 
 def SDB(cpu: CPU):
     # Subtract D with Borrow (0x75)
     #   M(R(X))-D-(NOT DF)-->DF,D
-    cpu.DF = 0 if (diff := cpu.M[cpu.R[cpu.X]] + (~cpu.D & 0xFF) + cpu.DF) <= 0xFF else 1
-    cpu.D = diff & 0xFF
-    cpu.set_state(states.Fetch())
+    i = (cpu.DF << 16) | (cpu.M[cpu.R[cpu.X]] << 8) | cpu.D
+    cpu.DF = SUB_DF[i]
+    cpu.D = SUB_RESULT[i]
+    cpu._state = cpu.fetch_state
 
 
 def SDBI(cpu: CPU):
     # Subtract D with Borrow Immediate (0x7D)
     #   M(R(P))-D-(NOT DF)-->DF,D
     #   R(P)+1
-    cpu.DF = 0 if (diff := cpu.M[cpu.R[cpu.P]] + (~cpu.D & 0xFF) + cpu.DF) <= 0xFF else 1
+    i = (cpu.DF << 16) | (cpu.M[cpu.R[cpu.P]] << 8) | cpu.D
     cpu.increment_program_counter()
-    cpu.D = diff & 0xFF
-    cpu.set_state(states.Fetch())
+    cpu.DF = SUB_DF[i]
+    cpu.D = SUB_RESULT[i]
+    cpu._state = cpu.fetch_state
 
 
 def SDI(cpu: CPU):
     # Subtract D Immediate (0xFD)
     #   M(R(P))-D-->DF,D
     #   R(P)+1
-    cpu.DF = 0 if (diff := cpu.M[cpu.R[cpu.P]] + (~cpu.D & 0xFF) + 1) <= 0xFF else 1
+    i = CARRY_IN | (cpu.M[cpu.R[cpu.P]] << 8) | cpu.D
     cpu.increment_program_counter()
-    cpu.D = diff & 0xFF
-    cpu.set_state(states.Fetch())
+    cpu.DF = SUB_DF[i]
+    cpu.D = SUB_RESULT[i]
+    cpu._state = cpu.fetch_state
 
 
 def SEP(cpu: CPU, N: int):
     # Set P (0xDN)
     #   N-->P
     cpu.P = N
-    cpu.set_state(states.Fetch())
+    cpu._state = cpu.fetch_state
 
 
 def SEQ(cpu: CPU):
     # Set Q (0x7B)
     #   1-->Q
     cpu.Q = 1
-    cpu.set_state(states.Fetch())
+    cpu._state = cpu.fetch_state
 
 
 def SEX(cpu: CPU, N: int):
     # Set X (0xEN)
     #   N-->X
     cpu.X = N
-    cpu.set_state(states.Fetch())
+    cpu._state = cpu.fetch_state
 
 
 def SHL(cpu: CPU):
     # Shift Left (0xFE)
     #   Shift D Left; MSB(D)-->DF
     #   0-->LSB(D)
-    cpu.DF = cpu.D & 0x80
-    cpu.D = (cpu.D << 1) & 0xFE
-    cpu.set_state(states.Fetch())
+    cpu.DF = SHL_DF[cpu.D]
+    cpu.D = SHL_RESULT[cpu.D]
+    cpu._state = cpu.fetch_state
 
 
 def SHLC(cpu: CPU):
     # Shift Left with Carry (0x7E)
     #   Shift D Left; MSB(D)-->DF
     #   DF-->LSB(D)
-    msb = (cpu.D >> 7) & 0x01
-    cpu.D = ((cpu.D << 1) & 0xFE) | cpu.DF
-    cpu.DF = msb
-    cpu.set_state(states.Fetch())
+    i = (cpu.DF << 8) | cpu.D
+    cpu.DF = SHL_DF[i]
+    cpu.D = SHL_RESULT[i]
+    cpu._state = cpu.fetch_state
 
 
 def SHR(cpu: CPU):
     # Shift Right (0xF6)
     #   Shift D Right; LSB(D)-->DF
     #   0-->MSB(D)
-    cpu.DF = cpu.D & 0x01
-    cpu.D = (cpu.D >> 1) & 0x7F
-    cpu.set_state(states.Fetch())
+    cpu.DF = SHR_DF[cpu.D]
+    cpu.D = SHR_RESULT[cpu.D]
+    cpu._state = cpu.fetch_state
 
 
 def SHRC(cpu: CPU):
     # Shift Right with Carry (0x76)
     #   Shift D Right; LSB(D)-->DF
     #   DF-->MSB(D)
-    lsb = cpu.D & 0x01
-    cpu.D = (cpu.D >> 1) | ((cpu.DF << 7) & 0x80)
-    cpu.DF = lsb
-    cpu.set_state(states.Fetch())
+    i = (cpu.DF << 8) | cpu.D
+    cpu.DF = SHR_DF[i]
+    cpu.D = SHR_RESULT[i]
+    cpu._state = cpu.fetch_state
 
 
 def SM(cpu: CPU):
     # Subtract Memory (0xF7)
     #   D-M(R(X))-->DF,D
-    cpu.DF = 0 if (diff := cpu.D + (~cpu.M[cpu.R[cpu.X]] & 0xFF) + 1) <= 0xFF else 1
-    cpu.D = diff & 0xFF
-    cpu.set_state(states.Fetch())
+    i = CARRY_IN | (cpu.D << 8) | cpu.M[cpu.R[cpu.X]]
+    cpu.DF = SUB_DF[i]
+    cpu.D = SUB_RESULT[i]
+    cpu._state = cpu.fetch_state
 
 
 def SMB(cpu: CPU):
     # Subtract Memory with Borrow (0x77)
     #   D-M(R(X))-(NOT DF)-->DF,D
-    cpu.DF = 0 if (diff := cpu.D + (~cpu.M[cpu.R[cpu.X]] & 0xFF) + cpu.DF) <= 0xFF else 1
-    cpu.D = diff & 0xFF
-    cpu.set_state(states.Fetch())
+    i = (cpu.DF << 16) | (cpu.D << 8) | cpu.M[cpu.R[cpu.X]]
+    cpu.DF = SUB_DF[i]
+    cpu.D = SUB_RESULT[i]
+    cpu._state = cpu.fetch_state
 
 
 def SMBI(cpu: CPU):
     # Subtract Memory with Borrow Immediate (0x7F)
     #   D-M(R(P))-(NOT DF)-->DF,D
     #   R(P)+1
-    cpu.DF = 0 if (diff := cpu.D + (~cpu.M[cpu.R[cpu.P]] & 0xFF) + cpu.DF) <= 0xFF else 1
+    i = (cpu.DF << 16) | (cpu.D << 8) | cpu.M[cpu.R[cpu.P]]
     cpu.increment_program_counter()
-    cpu.D = diff & 0xFF
-    cpu.set_state(states.Fetch())
+    cpu.DF = SUB_DF[i]
+    cpu.D = SUB_RESULT[i]
+    cpu._state = cpu.fetch_state
 
 
 def SMI(cpu: CPU):
     # Subtract Memory Immediate (0xFF)
     #   D-M(R(P))-->DF,D
     #   R(P)+1
-    cpu.DF = 0 if (diff := cpu.D + (~cpu.M[cpu.R[cpu.P]] & 0xFF) + 1) <= 0xFF else 1
+    i = CARRY_IN | (cpu.D << 8) | cpu.M[cpu.R[cpu.P]]
     cpu.increment_program_counter()
-    cpu.D = diff & 0xFF
-    cpu.set_state(states.Fetch())
+    cpu.DF = SUB_DF[i]
+    cpu.D = SUB_RESULT[i]
+    cpu._state = cpu.fetch_state
 
 
 def STR(cpu: CPU, N: int):
     # Store via N (0x5N)
     #   D-->M(R(N))
-    cpu.M[cpu.R[N]] = cpu.D
-    cpu.set_state(states.Fetch())
+    cpu.store(cpu.R[N], cpu.D)
+    cpu._state = cpu.fetch_state
 
 
 def STXD(cpu: CPU):
     # Store via X and Decrement (0x73)
     #   D-->M(R(X))
     #   R(X)-1
-    cpu.M[cpu.R[cpu.X]] = cpu.D
+    cpu.store(cpu.R[cpu.X], cpu.D)
     cpu.decrement_register(cpu.X)
-    cpu.set_state(states.Fetch())
+    cpu._state = cpu.fetch_state
 
 
 def XOR(cpu: CPU):
     # Exclusive-OR
     #   M(R(X)) XOR D-->D
     cpu.D ^= cpu.M[cpu.R[cpu.X]]
-    cpu.set_state(states.Fetch())
+    cpu._state = cpu.fetch_state
 
 
 def XRI(cpu: CPU):
@@ -484,4 +493,53 @@ def XRI(cpu: CPU):
     #   R(P)+1
     cpu.D ^= cpu.M[cpu.R[cpu.P]]
     cpu.increment_register(cpu.P)
-    cpu.set_state(states.Fetch())
+    cpu._state = cpu.fetch_state
+
+
+def _return(cpu: CPU, IE: int):
+    # RET and DIS, which only differ in IE
+    XP = cpu.M[cpu.R[cpu.X]]
+    cpu.increment_register(cpu.X)
+    cpu.X = XP >> 4
+    cpu.P = XP & 0x0F
+    cpu.IE = IE
+    cpu._state = cpu.fetch_state
+
+
+def _invalid(cpu: CPU):
+    raise NotImplementedError("Attempted to execute invalid instruction.")
+
+
+def _build_dispatch_table() -> list:
+    # one handler per full opcode (I << 4 | N) of opcodes.OPCODES, with N pre-bound where the instruction uses it
+    handlers = globals()
+    table = []
+    for opcode, entry in enumerate(OPCODES):
+        if not entry.mnemonic:
+            table.append(_invalid)
+            continue
+        handler = handlers[_HANDLER_NAMES.get(entry.mnemonic, entry.mnemonic)]
+        takes_n = 'N' in handler.__code__.co_varnames[:handler.__code__.co_argcount]
+        table.append(partial(handler, N=opcode & 0x0F) if takes_n else handler)
+    return table
+
+
+_HANDLER_NAMES = {**{f'B{flag}': 'BN' for flag in range(1, 5)},      # mnemonics sharing one handler
+                  **{f'BN{flag}': 'BNN' for flag in range(1, 5)}}
+DISPATCH = _build_dispatch_table()  # indexed by full opcode, built once at import
+CYCLES = [entry.cycles for entry in OPCODES]    # machine cycles per instruction
+
+
+def _spin_table() -> dict[int, Callable[[CPU], bool]]:
+    # branches that can jump to themselves, with the condition for taking them. The conditions only read D and the
+    # external flags, which nothing but an external event changes while the branch spins (see CPU.fast_forward).
+    table = {0x30: lambda cpu: True,                                # BR
+             0xC2: lambda cpu: cpu.D == 0,                          # LBZ
+             0xCA: lambda cpu: cpu.D != 0}                          # LBNZ
+    for flag in range(4):
+        table[0x34 + flag] = lambda cpu, flag=flag: cpu.EF[flag] == 1   # B1-B4
+        table[0x3C + flag] = lambda cpu, flag=flag: cpu.EF[flag] == 0   # BN1-BN4
+    return table
+
+
+SPINS = _spin_table()
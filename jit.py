@@ -0,0 +1,355 @@
+from __future__ import annotations
+from alu import CARRY_IN, TABLES
+from blocks import Block, BlockCache, MAX_BLOCK_LENGTH, PORT_IO
+from typing import Callable, Optional, TYPE_CHECKING
+if TYPE_CHECKING:
+    from cpu import CPU
+
+
+HOT_THRESHOLD = 16      # interpreted executions before a block is compiled
+
+
+class JIT(BlockCache):
+    # Block cache that compiles hot blocks into specialized Python functions. Each function is specialized for
+    # the P and X the block was entered with, keeps D, DF and the registers it touches in locals, and returns
+    # the machine cycles it executed (never more than the budget it is given). Cold blocks, and blocks entered with
+    # another P/X, run interpreted.
+    def __init__(self, cpu: CPU, threshold: int = HOT_THRESHOLD, max_block_length: int = MAX_BLOCK_LENGTH) -> None:
+        super().__init__(cpu, max_block_length)
+        self.threshold = threshold
+
+    def compile(self, block: Block, P: int, X: int) -> Callable[[CPU, int], int]:
+        source = _BlockCompiler(block, P, X).generate()
+        namespace = {'block': block, 'code': self._code, 'hooks': (self.invalidate,), 'CARRY_IN': CARRY_IN, **TABLES}
+        exec(compile(source, f'<jit {block.start:04X} P={P:X} X={X:X}>', 'exec'), namespace)
+        fn = namespace['run']
+        if block.compiled is None: block.compiled = {}
+        block.compiled[(P << 4) | X] = fn
+        return fn
+
+    def run_cycles(self, n: int, stop_on_idle: bool = False) -> int:
+        # Equivalent to CPU.run_cycles(n), see BlockCache.run_cycles
+        cpu = self.cpu
+        R = cpu.R
+        fetch = cpu.fetch_state
+        blocks = self._blocks
+        threshold = self.threshold
+        remaining = n
+        if cpu.io_requested(): return cpu.run_cycles(n, stop_on_idle)  # DMA and interrupts need the reference path
+
+        while remaining > 0:
+            if cpu._state is fetch:
+                P = cpu.P
+                pc = R[P]
+                block = blocks.get(pc) or self.lookup(pc)
+                if block is not None and block.spins and (skipped := cpu.fast_forward(remaining)):
+                    remaining -= skipped
+                    continue
+                if block is not None and block.cycles <= remaining:
+                    compiled = block.compiled
+                    if compiled is not None:
+                        fn = compiled.get((P << 4) | cpu.X)
+                        if fn is not None:
+                            remaining -= fn(cpu, remaining)
+                            continue
+                    block.hits += 1
+                    if block.hits >= threshold:
+                        remaining -= self.compile(block, P, cpu.X)(cpu, remaining)
+                    else:
+                        remaining -= self.execute(block)
+                    continue
+                step = min(remaining, 2)
+                cpu.run_cycles(step)
+                remaining -= step
+                if stop_on_idle and cpu.is_idle(): return n - remaining
+            else:
+                if not stop_on_idle and (skipped := cpu.fast_forward(remaining)):
+                    remaining -= skipped
+                    continue
+                cpu.tick()
+                remaining -= 1
+                if stop_on_idle and cpu.is_idle(): return n - remaining
+        return n
+
+
+class _BlockCompiler:
+    # Generates the source of `run(cpu, budget)` for one block. P and X are constants; R(P) is never held in a
+    # local, its value is tracked here at compile time and only written back on exit. A block whose closing
+    # branch may jump back to its own start is compiled as a loop that keeps going while it fits in budget.
+    def __init__(self, block: Block, P: int, X: int) -> None:
+        self.block = block
+        self.P = P
+        self.X = X
+        self.looping = False
+        self.start_pass(set())
+
+    def start_pass(self, dirty: set[int]) -> None:
+        self.lines: list[str] = []
+        self.used: set[int] = set(dirty)    # registers loaded into locals at entry
+        self.dirty: set[int] = set(dirty)   # registers written back on exit
+        self.pc = 0                         # compile-time value of R(P)
+        self.dynamic_pc = False             # R(P) was modified by the instruction and lives in local `pc`
+        self.indent = 2 if self.looping else 1
+
+    def reg(self, n: int) -> str:
+        if n == self.P: return f'0x{self.pc:04X}'
+        self.used.add(n)
+        return f'r{n}'
+
+    def set_reg(self, n: int, expr: str) -> None:
+        if n == self.P:
+            self.emit(f'pc = {expr}')
+            self.dynamic_pc = True
+        else:
+            self.used.add(n)
+            self.dirty.add(n)
+            self.emit(f'r{n} = {expr}')
+
+    def emit(self, line: str, indent: int = 0) -> None:
+        self.lines.append('    ' * (self.indent + indent) + line)
+
+    def exit(self, opcode: int, cycles: int, executed: int, indent: int = 0, X: Optional[int] = None) -> None:
+        # write back the architectural state as it is after `executed` instructions (`cycles` machine cycles) of
+        # the current pass through the block; loops add the completed passes counted in local `cycles`
+        if self.looping:
+            passes = f'cycles // {self.block.cycles} * {len(self.block.ops)}'
+            cycles_expr = f'cycles + {cycles}' if cycles else 'cycles'
+            executed_expr = f'{passes} + {executed}' if executed else passes
+        else:
+            cycles_expr, executed_expr = str(cycles), str(executed)
+        self.emit('cpu.D = d', indent)
+        self.emit('cpu.DF = df', indent)
+        for n in sorted(self.dirty): self.emit(f'R[{n}] = r{n}', indent)
+        self.emit(f'R[{self.P}] = {"pc" if self.dynamic_pc else f"0x{self.pc:04X}"}', indent)
+        if X is not None and X != self.X: self.emit(f'cpu.X = {X}', indent)
+        self.emit(f'cpu.I = {opcode >> 4}', indent)
+        self.emit(f'cpu.N = {opcode & 0x0F}', indent)
+        N = opcode & 0x7 if opcode in PORT_IO else 0
+        self.emit(f'cpu.N2 = {N >> 2 & 1}', indent)
+        self.emit(f'cpu.N1 = {N >> 1 & 1}', indent)
+        self.emit(f'cpu.N0 = {N & 1}', indent)
+        self.emit(f'cpu.cycles += {cycles_expr}', indent)
+        self.emit(f'cpu.instructions += {executed_expr}', indent)
+        self.emit(f'return {cycles_expr}', indent)
+
+    def body(self) -> bool:
+        # emit every instruction of the block, returns True if the block may loop back on itself
+        X = self.X
+        cycles = 0
+        opcode = 0
+        compiled = 0
+
+        for addr, next_pc, I, N, handler, cost, clear_n, writes in self.block.ops:
+            opcode = (I << 4) | N
+            self.pc = next_pc
+            cycles += cost
+            compiled += 1
+            self.emit(f'# {addr:04X}: {opcode:02X}')
+            terminate = self.instruction(opcode, I, N, X)
+            if opcode >> 4 == 0xE: X = N
+            if opcode == 0x79: X = self.P
+            if opcode in (0x70, 0x71): X = None     # set from memory, already written to cpu.X
+            if opcode >> 4 == 0xD: self.emit(f'cpu.P = {N}')
+            if terminate or self.dynamic_pc: break
+            if writes:
+                self.emit('if not block.valid:')
+                self.exit(opcode, cycles, compiled, indent=1, X=X)
+
+        if self.looping:
+            self.emit(f'cycles += {cycles}')
+            self.emit(f'if pc != 0x{self.block.start:04X} or cycles + {cycles} > budget:')
+            self.exit(opcode, 0, 0, indent=1, X=X)
+        else:
+            self.exit(opcode, cycles, compiled, X=X)
+        return compiled == len(self.block.ops) and opcode in _LOOPING_BRANCHES and X == self.X
+
+    def generate(self) -> str:
+        if self.body():
+            # recompile as a loop, where every exit has to write back registers dirtied anywhere in the body
+            self.looping = True
+            self.start_pass(self.dirty)
+            self.body()
+
+        header = ['def run(cpu, budget):', '    M = cpu.M', '    R = cpu.R', '    store = cpu.store',
+                  '    direct = cpu._write_hooks == hooks', '    devices = cpu.devices',
+                  '    d = cpu.D', '    df = cpu.DF']
+        header += [f'    r{n} = R[{n}]' for n in sorted(self.used)]
+        if self.looping: header += ['    cycles = 0', '    while True:']
+        return '\n'.join(header + self.lines) + '\n'
+
+    def immediate(self) -> str:
+        # M(R(P)) then R(P)+1
+        operand = f'M[0x{self.pc:04X}]'
+        self.pc = (self.pc + 1) & 0xFFFF
+        return operand
+
+    def instruction(self, opcode: int, I: int, N: int, X: int) -> bool:
+        # emit one instruction, returns True if it ends the block
+        emit, reg, set_reg = self.emit, self.reg, self.set_reg
+        rx = None if I == 0xE else reg(X) if opcode in _USES_X else None
+
+        if I == 0x0:                                    # LDN
+            emit(f'd = M[{reg(N)}]')
+        elif I == 0x1:                                  # INC
+            set_reg(N, f'({reg(N)} + 1) & 0xFFFF')
+        elif I == 0x2:                                  # DEC
+            set_reg(N, f'({reg(N)} - 1) & 0xFFFF')
+        elif opcode == 0x30:                            # BR
+            self.branch_short('True')
+            return True
+        elif I == 0x3 and 0x4 <= N <= 0x7:              # B1-B4
+            self.branch_short(f'cpu.EF[{N - 4}] == 1')
+            return True
+        elif I == 0x3 and 0xC <= N <= 0xF:              # BN1-BN4
+            self.branch_short(f'cpu.EF[{N - 12}] == 0')
+            return True
+        elif I == 0x4:                                  # LDA
+            emit(f'd = M[{reg(N)}]')
+            set_reg(N, f'({reg(N)} + 1) & 0xFFFF')
+        elif I == 0x5:                                  # STR
+            self.store(reg(N), 'd')
+        elif opcode == 0x60:                            # IRX
+            set_reg(X, f'({rx} + 1) & 0xFFFF')
+        elif I == 0x6 and N <= 0x7:                     # OUT
+            emit(f'cpu.BUS = t = M[{rx}]')
+            emit(f'device = devices[{N}]')
+            emit('if device is not None: device.write(t)')
+            set_reg(X, f'({rx} + 1) & 0xFFFF')
+        elif I == 0x6:                                  # INP
+            emit(f'device = devices[{N & 0x7}]')
+            emit('if device is not None: cpu.BUS = d = device.read() & 0xFF')
+            emit('else: d = cpu.BUS & 0xFF')
+            self.store(rx, 'd')
+        elif opcode in (0x70, 0x71):                    # RET, DIS
+            emit(f't = M[{rx}]')
+            set_reg(X, f'({rx} + 1) & 0xFFFF')
+            emit(f'cpu.IE = {1 if opcode == 0x70 else 0}')
+            emit('cpu.X = t >> 4')
+            emit('cpu.P = t & 0x0F')
+            return True
+        elif opcode == 0x72:                            # LDXA
+            emit(f'd = M[{rx}]')
+            set_reg(X, f'({rx} + 1) & 0xFFFF')
+        elif opcode == 0x73:                            # STXD
+            self.store(rx, 'd')
+            set_reg(X, f'({rx} - 1) & 0xFFFF')
+        elif opcode == 0x74:                            # ADC
+            self.alu('ADD', 'df << 16', 'd', f'M[{rx}]')
+        elif opcode == 0x75:                            # SDB
+            self.alu('SUB', 'df << 16', f'M[{rx}]', 'd')
+        elif opcode == 0x76:                            # SHRC
+            self.shift('SHR', 'df << 8')
+        elif opcode == 0x77:                            # SMB
+            self.alu('SUB', 'df << 16', 'd', f'M[{rx}]')
+        elif opcode == 0x78:                            # SAV
+            self.store(rx, 'cpu.T')
+        elif opcode == 0x79:                            # MARK
+            emit(f'cpu.T = 0x{(X << 4) | self.P:02X}')
+            self.store(reg(2), f'0x{(X << 4) | self.P:02X}')
+            set_reg(2, f'({reg(2)} - 1) & 0xFFFF')
+        elif opcode == 0x7A:                            # REQ
+            emit('cpu.Q = 0')
+        elif opcode == 0x7B:                            # SEQ
+            emit('cpu.Q = 1')
+        elif opcode == 0x7C:                            # ADCI
+            self.alu('ADD', 'df << 16', 'd', self.immediate())
+        elif opcode == 0x7D:                            # SDBI
+            self.alu('SUB', 'df << 16', self.immediate(), 'd')
+        elif opcode == 0x7E:                            # SHLC
+            self.shift('SHL', 'df << 8')
+        elif opcode == 0x7F:                            # SMBI
+            self.alu('SUB', 'df << 16', 'd', self.immediate())
+        elif I == 0x8:                                  # GLO
+            emit(f'd = {reg(N)} & 0xFF')
+        elif I == 0x9:                                  # GHI
+            emit(f'd = ({reg(N)} >> 8) & 0xFF')
+        elif I == 0xA:                                  # PLO
+            set_reg(N, f'({reg(N)} & 0xFF00) | d')
+        elif I == 0xB:                                  # PHI
+            set_reg(N, f'({reg(N)} & 0x00FF) | (d << 8)')
+        elif opcode in (0xC2, 0xCA):                    # LBZ, LBNZ
+            high, low = self.pc, (self.pc + 1) & 0xFFFF
+            emit(f'if d {"==" if opcode == 0xC2 else "!="} 0:')
+            emit(f'pc = (M[0x{high:04X}] << 8) | M[0x{low:04X}]', 1)
+            emit('else:')
+            emit(f'pc = 0x{(self.pc + 2) & 0xFFFF:04X}', 1)
+            self.dynamic_pc = True
+            return True
+        elif opcode == 0xC4:                            # NOP
+            pass
+        elif I == 0xD:                                  # SEP
+            return True
+        elif I == 0xE:                                  # SEX
+            pass
+        elif opcode == 0xF0:                            # LDX
+            emit(f'd = M[{rx}]')
+        elif opcode == 0xF1:                            # OR
+            emit(f'd |= M[{rx}]')
+        elif opcode == 0xF2:                            # AND
+            emit(f'd &= M[{rx}]')
+        elif opcode == 0xF3:                            # XOR
+            emit(f'd ^= M[{rx}]')
+        elif opcode == 0xF4:                            # ADD
+            self.alu('ADD', None, 'd', f'M[{rx}]')
+        elif opcode == 0xF5:                            # SD
+            self.alu('SUB', 'CARRY_IN', f'M[{rx}]', 'd')
+        elif opcode == 0xF6:                            # SHR
+            self.shift('SHR')
+        elif opcode == 0xF7:                            # SM
+            self.alu('SUB', 'CARRY_IN', 'd', f'M[{rx}]')
+        elif opcode == 0xF8:                            # LDI
+            emit(f'd = {self.immediate()}')
+        elif opcode == 0xF9:                            # ORI
+            emit(f'd |= {self.immediate()}')
+        elif opcode == 0xFA:                            # ANI
+            emit(f'd &= {self.immediate()}')
+        elif opcode == 0xFB:                            # XRI
+            emit(f'd ^= {self.immediate()}')
+        elif opcode == 0xFC:                            # ADI
+            self.alu('ADD', None, 'd', self.immediate())
+        elif opcode == 0xFD:                            # SDI
+            self.alu('SUB', 'CARRY_IN', self.immediate(), 'd')
+        elif opcode == 0xFE:                            # SHL
+            self.shift('SHL')
+        elif opcode == 0xFF:                            # SMI
+            self.alu('SUB', 'CARRY_IN', 'd', self.immediate())
+        else:
+            raise NotImplementedError("Attempted to compile invalid instruction.")
+        return False
+
+    def store(self, addr: str, value: str) -> None:
+        # CPU.store(), writing directly when the JIT's own invalidation is the only write hook and addr isn't code
+        self.emit(f'if direct and not code[{addr}]: M[{addr}] = {value}')
+        self.emit(f'else: store({addr}, {value})')
+
+    def alu(self, table: str, carry: Optional[str], a: str, b: str) -> None:
+        # D and DF from an alu table (ADD or SUB) of a, b and the carry in, if any
+        self.emit(f't = {carry + " | " if carry else ""}({a} << 8) | {b}')
+        self.emit(f'df = {table}_DF[t]')
+        self.emit(f'd = {table}_RESULT[t]')
+
+    def shift(self, table: str, carry: Optional[str] = None) -> None:
+        # D and DF from an alu shift table (SHL or SHR) of D and the carry in, if any
+        self.emit(f't = {carry} | d' if carry else 't = d')
+        self.emit(f'df = {table}_DF[t]')
+        self.emit(f'd = {table}_RESULT[t]')
+
+    def branch_short(self, condition: str) -> None:
+        # IF condition, M(R(P))-->R(P).0 ELSE R(P)+1
+        operand = self.pc
+        if condition == 'True':
+            self.emit(f'pc = 0x{operand & 0xFF00:04X} | M[0x{operand:04X}]')
+        else:
+            self.emit(f'if {condition}:')
+            self.emit(f'pc = 0x{operand & 0xFF00:04X} | M[0x{operand:04X}]', 1)
+            self.emit('else:')
+            self.emit(f'pc = 0x{(operand + 1) & 0xFFFF:04X}', 1)
+        self.dynamic_pc = True
+
+
+# branches that can close a loop back to the start of their own block
+_LOOPING_BRANCHES = frozenset([0x30, *range(0x34, 0x38), *range(0x3C, 0x40), 0xC2, 0xCA])
+
+# opcodes that address memory or a register through R(X)
+_USES_X = frozenset([*range(0x60, 0x68), *range(0x69, 0x70), 0x70, 0x71, 0x72, 0x73, 0x74, 0x75, 0x77, 0x78,
+                     0xF0, 0xF1, 0xF2, 0xF3, 0xF4, 0xF5, 0xF7])
@@ -0,0 +1,158 @@
+from __future__ import annotations
+from array import array
+from instructions import CYCLES
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from cpu import CPU
+
+
+JOURNAL_SIZE = 2**16    # instructions kept by default
+
+
+class Journal:
+    # Execution engine that records, before each instruction, what that instruction can overwrite: the packed
+    # scalar registers, R(P), R(X), R(N) and R(2), the counters and the old value of any byte it stores. Entries
+    # live in fixed-size arrays used as a ring buffer, so memory is bounded by `size` and the oldest instructions
+    # are forgotten first. step_back() undoes instructions newest first.
+    #
+    # Only instructions run through this engine are journaled. Instructions run any other way, resets and host
+    # writes (load()) can't be undone, so they clear the journal. Nothing is recorded unless a Journal is attached.
+    def __init__(self, cpu: CPU, size: int = JOURNAL_SIZE) -> None:
+        self.cpu = cpu
+        self.size = size
+        self._regs = array('Q', bytes(8 * size))        # D, DF, B, T, BUS, P, X, I, N, Q, IE, N0-N2 packed by _record()
+        self._r = array('H', bytes(2 * 4 * size))       # R(P), R(X), R(N), R(2) before the instruction
+        self._opcode = array('B', bytes(size))
+        self._cycles = array('Q', bytes(8 * size))
+        self._instructions = array('Q', bytes(8 * size))
+        self._write_addr = array('l', [-1] * size)     # address stored to by the instruction, -1 for none
+        self._write_old = array('B', bytes(size))
+        self._head = 0          # slot the next entry goes in
+        self._count = 0
+        self._undoing = False
+        cpu.add_write_hook(self._on_write)
+
+    def close(self) -> None:
+        self.cpu.remove_write_hook(self._on_write)
+        self.clear()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def clear(self) -> None:
+        self._count = 0
+
+    def _on_write(self, start: int, end: int) -> None:
+        if self._undoing: return
+        cpu = self.cpu
+        # single byte stores during S1 belong to the newest entry, anything else is a write we can't undo
+        if self._count and end - start == 1 and cpu._state is not cpu.fetch_state:
+            i = (self._head - 1) % self.size
+            if self._write_addr[i] < 0:
+                self._write_addr[i] = start
+                self._write_old[i] = cpu.M[start]
+                return
+        self.clear()
+
+    def _record(self, opcode: int) -> None:
+        cpu = self.cpu
+        R = cpu.R
+        if self._count and cpu.instructions != self._instructions[(self._head - 1) % self.size]:
+            self.clear()  # instructions ran outside the journal since the last entry
+        i = self._head
+        self._regs[i] = (cpu.D | cpu.DF << 8 | cpu.B << 16 | cpu.T << 24 | cpu.BUS << 32 | cpu.P << 40 |
+                         cpu.X << 44 | cpu.I << 48 | cpu.N << 52 | cpu.Q << 56 | cpu.IE << 57 |
+                         cpu.N0 << 58 | cpu.N1 << 59 | cpu.N2 << 60)
+        r, j = self._r, i * 4
+        r[j] = R[cpu.P]
+        r[j + 1] = R[cpu.X]
+        r[j + 2] = R[opcode & 0x0F]
+        r[j + 3] = R[2]
+        self._opcode[i] = opcode
+        self._cycles[i] = cpu.cycles
+        self._instructions[i] = cpu.instructions + 1
+        self._write_addr[i] = -1
+        self._head = (i + 1) % self.size
+        if self._count < self.size: self._count += 1
+
+    def run_cycles(self, n: int, stop_on_idle: bool = False) -> int:
+        # Equivalent to CPU.run_cycles(n), journaling each instruction started. With stop_on_idle, returns early
+        # once IDL has executed. Returns the number of cycles executed.
+        cpu = self.cpu
+        fetch, execute, force = cpu.fetch_state, cpu.execute_state, cpu.force_execute_state
+        done = 0
+        while done < n:
+            state = cpu._state
+            if cpu.io_requested() and (state is fetch or cpu.is_idle()):
+                self.clear()  # DMA and interrupt cycles can't be undone
+                step = 1
+            elif state is fetch:
+                opcode = cpu.M[cpu.R[cpu.P]]
+                self._record(opcode)
+                step = min(CYCLES[opcode], n - done)
+            elif cpu.is_idle():
+                step = n - done  # IDL repeats S1 without touching anything the journal keeps
+            elif state is execute or state is force:
+                step = 1  # finishing an instruction started by an earlier call
+            else:
+                self.clear()  # reset, initialization or pause
+                step = 1
+            done += cpu.run_cycles(step, stop_on_idle)
+            if stop_on_idle and cpu.is_idle(): return done
+        return done
+
+    def step_back(self, n: int = 1) -> int:
+        # Undo the last n instructions (including one still in progress), leaving the CPU in S0 of the oldest
+        # one undone. Returns the number of instructions undone, less than n if the journal runs out.
+        undone = 0
+        self._undoing = True
+        try:
+            while undone < n and self._count:
+                self._undo()
+                undone += 1
+        finally:
+            self._undoing = False
+        return undone
+
+    def back_to_write(self, addr: int) -> bool:
+        # Step back to just before the most recent journaled instruction that wrote addr. Returns False, without
+        # moving, if there isn't one.
+        for depth in range(self._count):
+            if self._write_addr[(self._head - 1 - depth) % self.size] == addr:
+                self.step_back(depth + 1)
+                return True
+        return False
+
+    def _undo(self) -> None:
+        cpu = self.cpu
+        R = cpu.R
+        i = (self._head - 1) % self.size
+        self._head = i
+        self._count -= 1
+
+        addr = self._write_addr[i]
+        if addr >= 0: cpu.store(addr, self._write_old[i])  # through store() so block caches see it
+        regs = self._regs[i]
+        cpu.D = regs & 0xFF
+        cpu.DF = regs >> 8 & 0xFF
+        cpu.B = regs >> 16 & 0xFF
+        cpu.T = regs >> 24 & 0xFF
+        cpu.BUS = regs >> 32 & 0xFF
+        cpu.P = regs >> 40 & 0x0F
+        cpu.X = regs >> 44 & 0x0F
+        cpu.I = regs >> 48 & 0x0F
+        cpu.N = regs >> 52 & 0x0F
+        cpu.Q = regs >> 56 & 1
+        cpu.IE = regs >> 57 & 1
+        cpu.N0 = regs >> 58 & 1
+        cpu.N1 = regs >> 59 & 1
+        cpu.N2 = regs >> 60 & 1
+        # all four were saved before the instruction, so a register saved more than once gets the same value back
+        j = i * 4
+        R[2] = self._r[j + 3]
+        R[self._opcode[i] & 0x0F] = self._r[j + 2]
+        R[cpu.X] = self._r[j + 1]
+        R[cpu.P] = self._r[j]
+        cpu.cycles = self._cycles[i]
+        cpu.instructions = self._instructions[i] - 1
+        cpu._state = cpu.fetch_state
@@ -0,0 +1,125 @@
+from __future__ import annotations
+import mmap
+import os
+import re
+from assembler import assemble_file
+from typing import Iterable, Optional, TYPE_CHECKING
+if TYPE_CHECKING:
+    from cpu import CPU
+
+
+MEMORY_SIZE = 2**16
+BINARY_EXTENSIONS = ('.bin', '.rom', '.img')
+HEX_EXTENSIONS = ('.hex', '.ihx')
+LISTING_LINE = re.compile(r'[0-9A-Fa-f]{4}\s+(?:[0-9A-Fa-f]{2})+(?:\s|$)')     # ADDR OPCODES ... of a listing
+
+# Intel HEX record types
+HEX_DATA = 0x00
+HEX_EOF = 0x01
+HEX_SEGMENT = 0x02          # extended segment address, only segment 0 fits in 64 KB
+HEX_START_SEGMENT = 0x03    # start addresses are ignored
+HEX_LINEAR = 0x04           # extended linear address, only 0 fits in 64 KB
+HEX_START_LINEAR = 0x05
+
+
+class LoadError(SyntaxError):
+    pass
+
+
+class _Runs:
+    # Collects bytes by address and writes each contiguous run to the CPU with one CPU.load()
+    def __init__(self, cpu: CPU) -> None:
+        self.cpu = cpu
+        self.start = 0
+        self.data = bytearray()
+
+    def add(self, addr: int, data: bytes, line: int) -> None:
+        if addr + len(data) > MEMORY_SIZE:
+            raise LoadError(f"Line {line}: {len(data)} bytes at {addr:04X} run past the end of memory")
+        if addr != self.start + len(self.data): self.flush()
+        if not self.data: self.start = addr
+        self.data += data
+
+    def flush(self) -> None:
+        if self.data: self.cpu.load(self.start, self.data)
+        self.data = bytearray()
+
+
+def load_binary(path: str, cpu: CPU, addr: int = 0) -> int:
+    # Load a raw memory image at addr, mapped rather than read. Returns its size.
+    size = os.path.getsize(path)
+    if not 0 <= addr <= addr + size <= MEMORY_SIZE:
+        raise LoadError(f"{path}: {size} bytes at {addr:04X} run past the end of memory")
+    if not size: return 0
+    with open(path, 'rb') as image_file, mmap.mmap(image_file.fileno(), 0, access=mmap.ACCESS_READ) as image:
+        with memoryview(image) as view:
+            cpu.load(addr, view)
+    return size
+
+
+def load_intel_hex(source: Iterable[str], cpu: CPU) -> None:
+    # Load Intel HEX records from source (an open file or lines), checking each record's length and checksum
+    runs = _Runs(cpu)
+    for number, line in enumerate(source, 1):
+        line = line.strip()
+        if not line: continue
+        if line[0] != ':': raise LoadError(f"Line {number}: Intel HEX records start with ':'")
+        try:
+            record = bytes.fromhex(line[1:])
+        except ValueError:
+            raise LoadError(f"Line {number}: Invalid hex digits") from None
+        if len(record) < 5 or len(record) != record[0] + 5: raise LoadError(f"Line {number}: Invalid record length")
+        if sum(record) & 0xFF: raise LoadError(f"Line {number}: Checksum mismatch")
+        kind, data = record[3], record[4:-1]
+        if kind == HEX_DATA:
+            runs.add((record[1] << 8) | record[2], data, number)
+        elif kind == HEX_EOF:
+            break
+        elif kind in (HEX_SEGMENT, HEX_LINEAR):
+            if any(data): raise LoadError(f"Line {number}: Addresses above 64 KB aren't supported")
+        elif kind not in (HEX_START_SEGMENT, HEX_START_LINEAR):
+            raise LoadError(f"Line {number}: Unknown record type {kind:02X}")
+    runs.flush()
+
+
+def load_listing(source: Iterable[str], cpu: CPU, listing: Optional[dict[int, str]] = None) -> None:
+    # Load a program listing (ADDR OPCODES [text] per line, ';' comment lines) from source. If listing is given, it
+    # is filled with each line's text after the opcodes (mnemonic and comment) by address.
+    runs = _Runs(cpu)
+    for number, line in enumerate(source, 1):
+        if line.startswith(';') or not line.strip(): continue
+        tokens = line.split(None, 2)
+        if len(tokens) < 2:
+            raise LoadError(f"Line {number}: Lines must contain at least memory address and opcode.")
+        try:
+            addr = int(tokens[0], 16)
+            data = bytes.fromhex(tokens[1])
+        except ValueError:
+            raise LoadError(f"Line {number}: Invalid syntax: {line.rstrip()}") from None
+        if not 0 <= addr < MEMORY_SIZE: raise LoadError(f"Line {number}: Address out of range: {tokens[0]}")
+        runs.add(addr, data, number)
+        if listing is not None: listing[addr] = tokens[2].rstrip() if len(tokens) > 2 else ''
+    runs.flush()
+
+
+def load_program(path: str, cpu: CPU, listing: Optional[dict[int, str]] = None) -> dict[str, int]:
+    # Load a program in any format: raw binary and Intel HEX by extension (or a leading ':' for HEX), listings and
+    # mnemonic source (through the assembler and its image cache) by their first line of code. Returns the program's
+    # symbol table, empty for anything but source.
+    extension = os.path.splitext(path)[1].lower()
+    if extension in BINARY_EXTENSIONS:
+        load_binary(path, cpu)
+        return {}
+    with open(path) as source_file:
+        first = next((line for line in source_file if line.strip() and not line.lstrip().startswith(';')), '')
+        source_file.seek(0)
+        if extension in HEX_EXTENSIONS or first.startswith(':'):
+            load_intel_hex(source_file, cpu)
+            return {}
+        if LISTING_LINE.match(first):
+            load_listing(source_file, cpu, listing)
+            return {}
+    image = assemble_file(path)
+    image.load(cpu)
+    if listing is not None: listing.update(image.listing)
+    return image.symbols
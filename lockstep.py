@@ -0,0 +1,182 @@
+from __future__ import annotations
+import zlib
+from collections import deque
+from disassembler import decode
+from typing import Callable, NamedTuple, Optional, TYPE_CHECKING
+if TYPE_CHECKING:
+    from cpu import CPU
+    from pacing import Runner
+
+
+CHECK_INTERVAL = 50_000     # instructions between state comparisons
+CONTEXT = 8                 # instructions shown before and after a divergence
+MEMORY_DIFFERENCES = 8      # differing addresses listed in a Divergence
+REGISTERS = ('D', 'DF', 'P', 'X', 'I', 'N', 'T', 'IE', 'Q', 'BUS', 'N0', 'N1', 'N2', 'cycles', 'instructions')
+
+
+class StateMachine:
+    # Execution engine ticking the states.py state machine one machine cycle at a time, with nothing inlined or
+    # fast-forwarded. It is the reference faster engines are checked against.
+    def __init__(self, cpu: CPU) -> None:
+        self.cpu = cpu
+
+    def run_cycles(self, n: int, stop_on_idle: bool = False) -> int:
+        cpu = self.cpu
+        tick = cpu.tick
+        for cycle in range(n):
+            idle = cpu.is_idle()    # IDL fetched, this cycle executes it
+            tick()
+            if stop_on_idle and idle: return cycle + 1
+        return n
+
+
+class Divergence(NamedTuple):
+    cycle: int          # CPU.cycles once the first machine cycle whose outcome differs has run
+    instruction: int    # CPU.instructions of the reference by then, the divergent instruction's number
+    pc: int             # address of the divergent instruction
+    differences: dict[str, tuple]   # (reference, engine) by register, 'R3', 'M[0040]', 'state' or 'error'
+    context: str        # disassembly around pc, the divergent instruction marked with '>'
+
+    def __str__(self) -> str:
+        lines = [f"Engines diverged in instruction {self.instruction} at {self.pc:04X}, cycle {self.cycle}:"]
+        lines += [f"  {name}: reference {expected}, engine {actual}"
+                  for name, (expected, actual) in self.differences.items()]
+        return '\n'.join(lines) + '\n' + self.context
+
+
+def state_digest(cpu: CPU) -> tuple:
+    # Architectural state in a form that is cheap to compare, memory as a CRC
+    return (*(getattr(cpu, name) for name in REGISTERS), *cpu.R, type(cpu.get_state()).__name__, zlib.crc32(cpu.M))
+
+
+class Lockstep:
+    # Runs engine and a reference engine side by side on two CPUs made alike by make_cpu(), comparing their
+    # state_digest() every interval instructions. At the first mismatch both are restored to the last matching
+    # snapshot and the divergent machine cycle is found by bisection, then kept as a Divergence. Devices aren't
+    # part of a snapshot, so they should be stateless (or absent) for bisection to replay faithfully.
+    def __init__(self, make_cpu: Callable[[], CPU], engine: Callable[[CPU], Runner],
+                 reference: Callable[[CPU], Runner] = StateMachine, interval: int = CHECK_INTERVAL,
+                 symbols: Optional[dict[str, int]] = None) -> None:
+        if interval < 1: raise ValueError("The check interval must be at least one instruction.")
+        self.expected = make_cpu()
+        self.actual = make_cpu()
+        self.reference = reference(self.expected)
+        self.engine = engine(self.actual)
+        self.interval = interval
+        self.symbols = symbols
+        self.divergence: Optional[Divergence] = None
+
+    def run_cycles(self, n: int, stop_on_idle: bool = False) -> int:
+        # Run both engines n cycles, or with stop_on_idle until the reference has executed IDL (or fetched it as an
+        # interval ends). Returns the number of cycles checked, stopping short at a divergence, which is left in
+        # self.divergence. An error both engines raise alike (e.g. on an invalid opcode) is the program's, and is
+        # raised.
+        done = 0
+        while done < n and self.divergence is None:
+            snapshot = self.expected.snapshot()
+            expected, actual, ran, error = self._run_both(n - done, stop_on_idle, self.interval)
+            if expected != actual:
+                self.divergence = self._bisect(snapshot, ran)
+                break
+            if error is not None: raise error
+            done += ran
+            if stop_on_idle and self.expected.is_idle(): break
+        return done
+
+    def _run_both(self, n: int, stop_on_idle: bool = False,
+                  instructions: Optional[int] = None) -> tuple[tuple, tuple, int, Optional[Exception]]:
+        # Run the reference n cycles (or until it has fetched instructions more, see _run_instructions) and the engine
+        # as many as the reference did. Returns the outcome of each (its state_digest() and the error it raised, if
+        # any), the cycles run and the reference's error.
+        if instructions is None: ran, error = _run(self.reference, self.expected, n, stop_on_idle)
+        else: ran, error = _run_instructions(self.reference, self.expected, n, instructions, stop_on_idle)
+        _, engine_error = _run(self.engine, self.actual, ran)
+        return _outcome(self.expected, error), _outcome(self.actual, engine_error), ran, error
+
+    def _restore(self, snapshot: bytes) -> None:
+        self.expected.restore(snapshot)
+        self.actual.restore(snapshot)
+
+    def _bisect(self, snapshot: bytes, n: int) -> Divergence:
+        # the engines agree 0 cycles after snapshot and differ n cycles after it, narrow that down to one cycle
+        low, high = 0, n
+        while high - low > 1:
+            middle = (low + high) // 2
+            self._restore(snapshot)
+            expected, actual, _, _ = self._run_both(middle)
+            if expected != actual: high = middle
+            else: low = middle
+
+        # run up to and including the divergent cycle, the reference a cycle at a time to see which instructions
+        # led there
+        self._restore(snapshot)
+        cpu = self.expected
+        recent = deque(maxlen=CONTEXT + 1)
+        if cpu.get_state() is cpu.execute_state: recent.append((cpu.R[cpu.P] - 1) & 0xFFFF)
+        elif cpu.get_state() is cpu.force_execute_state: recent.append((cpu.R[cpu.P] - 2) & 0xFFFF)
+        error = None
+        for _ in range(high):
+            pc, instructions = cpu.R[cpu.P], cpu.instructions
+            _, error = _run(self.reference, cpu, 1)
+            if cpu.instructions != instructions: recent.append(pc)
+            if error is not None: break
+        _, engine_error = _run(self.engine, self.actual, high)
+        differences = self._differences()
+        if _describe(error) != _describe(engine_error):
+            differences['error'] = (_describe(error), _describe(engine_error))
+        pc = recent[-1] if recent else cpu.R[cpu.P]
+        return Divergence(cpu.cycles, cpu.instructions, pc, differences, self._context(list(recent) or [pc]))
+
+    def _differences(self) -> dict[str, tuple]:
+        expected, actual = self.expected, self.actual
+        differences = {name: (getattr(expected, name), getattr(actual, name)) for name in REGISTERS
+                       if getattr(expected, name) != getattr(actual, name)}
+        differences.update({f'R{i:X}': (expected.R[i], actual.R[i]) for i in range(16) if expected.R[i] != actual.R[i]})
+        if type(expected.get_state()) is not type(actual.get_state()):
+            differences['state'] = (type(expected.get_state()).__name__, type(actual.get_state()).__name__)
+        if expected.M != actual.M:
+            addrs = [addr for addr in range(len(expected.M)) if expected.M[addr] != actual.M[addr]]
+            differences.update({f'M[{addr:04X}]': (expected.M[addr], actual.M[addr])
+                                for addr in addrs[:MEMORY_DIFFERENCES]})
+        return differences
+
+    def _context(self, recent: list[int]) -> str:
+        # the instructions that led up to the divergent one (the last of recent), it and the ones after it
+        M = self.expected.M
+        names = {addr: name for name, addr in self.symbols.items()} if self.symbols else {}
+        instructions = [decode(M, addr, names) for addr in recent]
+        for _ in range(CONTEXT):
+            instructions.append(decode(M, (instructions[-1].addr + len(instructions[-1].data)) & 0xFFFF, names))
+        return ''.join(f"{'>' if i == len(recent) - 1 else ' '} {instruction.format(names.get(instruction.addr, ''))}\n"
+                       for i, instruction in enumerate(instructions))
+
+
+def _run(engine: Runner, cpu: CPU, n: int, stop_on_idle: bool = False) -> tuple[int, Optional[Exception]]:
+    # (cycles run, error raised or None) for engine.run_cycles(n)
+    start = cpu.cycles
+    try:
+        return engine.run_cycles(n, stop_on_idle), None
+    except Exception as e:
+        return cpu.cycles - start, e
+
+
+def _run_instructions(engine: Runner, cpu: CPU, n: int, instructions: int,
+                      stop_on_idle: bool = False) -> tuple[int, Optional[Exception]]:
+    # (cycles run, error raised or None) running engine until cpu has fetched instructions more, n cycles have run or
+    # a batch fetches nothing (the CPU is idle or serving DMA). Every instruction takes two machine cycles or more,
+    # so a batch of twice the instructions left can't overshoot.
+    target, ran = cpu.instructions + instructions, 0
+    while ran < n and cpu.instructions < target:
+        fetched, batch = cpu.instructions, min(n - ran, 2 * (target - cpu.instructions))
+        batch_ran, error = _run(engine, cpu, batch, stop_on_idle)
+        ran += batch_ran
+        if error is not None or batch_ran < batch or cpu.instructions == fetched: return ran, error
+    return ran, None
+
+
+def _outcome(cpu: CPU, error: Optional[Exception]) -> tuple:
+    return (*state_digest(cpu), _describe(error))
+
+
+def _describe(error: Optional[Exception]) -> Optional[str]:
+    return None if error is None else f'{type(error).__name__}: {error}'
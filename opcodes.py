@@ -0,0 +1,80 @@
+from __future__ import annotations
+from typing import NamedTuple
+
+
+# operand kinds
+NONE = 'none'
+REGISTER = 'register'   # R0-RF in the N nibble
+PORT = 'port'           # I/O port 1-7 in the N nibble
+BYTE = 'byte'           # immediate byte following the opcode
+SHORT = 'short'         # branch target in the page of the target byte, low byte follows the opcode
+LONG = 'long'           # branch target, high then low byte follow the opcode
+OPERAND_BYTES = {NONE: 0, REGISTER: 0, PORT: 0, BYTE: 1, SHORT: 1, LONG: 2}
+
+# branch kinds, how an instruction leaves PC
+NEXT = 'next'           # falls through to the next instruction
+JUMP = 'jump'           # always branches to its operand
+BRANCH = 'branch'       # branches to its operand or falls through on a condition
+SWITCH = 'switch'       # changes P (and X) to a register picked at run time: SEP, RET, DIS
+WAIT = 'wait'           # stays put until an interrupt or DMA request: IDL
+
+
+class Opcode(NamedTuple):
+    mnemonic: str       # '' for opcodes the CPU doesn't implement
+    operand: str        # operand kind
+    cycles: int         # machine cycles: S0 + S1, plus a second S1 for the long branches and NOP
+    branch: str         # branch kind
+
+    @property
+    def length(self) -> int:
+        return 1 + OPERAND_BYTES[self.operand]
+
+
+INVALID = Opcode('', NONE, 2, NEXT)
+
+
+def _build_opcode_table() -> tuple[Opcode, ...]:
+    # The instruction set as implemented, one entry per full opcode (I << 4 | N). instructions.DISPATCH, the
+    # assembler, block translation and the disassembler are all derived from it.
+    table = [INVALID] * 0x100
+
+    def define(opcodes, mnemonic: str, operand: str = NONE, branch: str = NEXT, cycles: int = 2) -> None:
+        for opcode in opcodes: table[opcode] = Opcode(mnemonic, operand, cycles, branch)
+
+    define(range(0x01, 0x10), 'LDN', REGISTER)      # 0x00 is IDL rather than LDN 0
+    define(range(0x10, 0x20), 'INC', REGISTER)
+    define(range(0x20, 0x30), 'DEC', REGISTER)
+    define(range(0x40, 0x50), 'LDA', REGISTER)
+    define(range(0x50, 0x60), 'STR', REGISTER)
+    define(range(0x80, 0x90), 'GLO', REGISTER)
+    define(range(0x90, 0xA0), 'GHI', REGISTER)
+    define(range(0xA0, 0xB0), 'PLO', REGISTER)
+    define(range(0xB0, 0xC0), 'PHI', REGISTER)
+    define(range(0xD0, 0xE0), 'SEP', REGISTER, SWITCH)
+    define(range(0xE0, 0xF0), 'SEX', REGISTER)
+    for flag in range(1, 5):
+        define([0x33 + flag], f'B{flag}', SHORT, BRANCH)
+        define([0x3B + flag], f'BN{flag}', SHORT, BRANCH)
+    define(range(0x61, 0x68), 'OUT', PORT)
+    define(range(0x69, 0x70), 'INP', PORT)
+
+    define([0x00], 'IDL', branch=WAIT)
+    define([0x30], 'BR', SHORT, JUMP)
+    define([0x60], 'IRX')
+    define([0x70], 'RET', branch=SWITCH)
+    define([0x71], 'DIS', branch=SWITCH)
+    define([0xC2], 'LBZ', LONG, BRANCH, cycles=3)
+    define([0xC4], 'NOP', cycles=3)
+    define([0xCA], 'LBNZ', LONG, BRANCH, cycles=3)
+    for opcode, mnemonic in [(0x72, 'LDXA'), (0x73, 'STXD'), (0x74, 'ADC'), (0x75, 'SDB'), (0x76, 'SHRC'),
+                             (0x77, 'SMB'), (0x78, 'SAV'), (0x79, 'MARK'), (0x7A, 'REQ'), (0x7B, 'SEQ'),
+                             (0x7E, 'SHLC'), (0xF0, 'LDX'), (0xF1, 'OR'), (0xF2, 'AND'), (0xF3, 'XOR'),
+                             (0xF4, 'ADD'), (0xF5, 'SD'), (0xF6, 'SHR'), (0xF7, 'SM'), (0xFE, 'SHL')]:
+        define([opcode], mnemonic)
+    for opcode, mnemonic in [(0x7C, 'ADCI'), (0x7D, 'SDBI'), (0x7F, 'SMBI'), (0xF8, 'LDI'), (0xF9, 'ORI'),
+                             (0xFA, 'ANI'), (0xFB, 'XRI'), (0xFC, 'ADI'), (0xFD, 'SDI'), (0xFF, 'SMI')]:
+        define([opcode], mnemonic, BYTE)
+    return tuple(table)
+
+
+OPCODES = _build_opcode_table()
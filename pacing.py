@@ -0,0 +1,71 @@
+from __future__ import annotations
+import time
+from typing import Callable, Protocol
+
+
+CLOCK_HZ = 1_760_000        # crystal frequency of a typical 1802 board
+CLOCKS_PER_CYCLE = 8        # every machine cycle (S0, S1, ...) takes eight clock pulses
+
+
+class Runner(Protocol):
+    # CPU, BlockCache and JIT all run this way
+    def run_cycles(self, n: int, stop_on_idle: bool = False) -> int: ...
+
+
+class ClockPacer:
+    # Paces batches of machine cycles to a target clock rate. Sleeps are scheduled against an absolute
+    # timeline (start + cycles / rate), so rounding and oversleeping don't accumulate as drift. When the host
+    # falls more than max_lag seconds behind, the timeline is moved up to now and the missed time is dropped
+    # instead of being made up later with a burst of unpaced cycles.
+    def __init__(self, clock_hz: float = CLOCK_HZ, clocks_per_cycle: int = CLOCKS_PER_CYCLE,
+                 batch_time: float = 0.01, max_lag: float = 0.1,
+                 clock: Callable[[], float] = time.perf_counter, sleep: Callable[[float], None] = time.sleep) -> None:
+        self.cycle_rate = clock_hz / clocks_per_cycle
+        self.batch_cycles = max(1, round(self.cycle_rate * batch_time))
+        self.max_lag = max_lag
+        self._clock = clock
+        self._sleep = sleep
+        self.restart()
+
+    def restart(self) -> None:
+        self.cycles = 0         # cycles paced since restart
+        self.slips = 0          # times the timeline was dropped because the host couldn't keep up
+        self._start = self._clock()
+        self._epoch = self._start
+        self._epoch_cycles = 0
+
+    def resync(self) -> None:
+        # Continue the timeline from now, e.g. after emulation was suspended on purpose
+        self._epoch = self._clock()
+        self._epoch_cycles = self.cycles
+
+    def pace(self, cycles: int) -> None:
+        # Account for cycles just executed and sleep until they are due
+        self.cycles += cycles
+        due = self._epoch + (self.cycles - self._epoch_cycles) / self.cycle_rate
+        now = self._clock()
+        if due > now:
+            self._sleep(due - now)
+        elif now - due > self.max_lag:
+            self.slips += 1
+            self.resync()
+
+    def run(self, runner: Runner, cycles: int, stop_on_idle: bool = False) -> int:
+        # Run up to cycles in paced batches, returns cycles executed
+        done = 0
+        while done < cycles:
+            batch = min(self.batch_cycles, cycles - done)
+            executed = runner.run_cycles(batch, stop_on_idle)
+            done += executed
+            self.pace(executed)
+            if executed < batch: break
+        return done
+
+    def achieved_rate(self) -> float:
+        elapsed = self._clock() - self._start
+        return self.cycles / elapsed if elapsed > 0 else 0.0
+
+    def report(self) -> dict:
+        achieved = self.achieved_rate()
+        return {'target_cycles_per_s': self.cycle_rate, 'achieved_cycles_per_s': achieved,
+                'ratio': achieved / self.cycle_rate, 'slips': self.slips}
@@ -0,0 +1,147 @@
+from __future__ import annotations
+from array import array
+from instructions import DISPATCH
+from opcodes import BRANCH, JUMP, OPCODES
+from typing import Mapping, Optional, TYPE_CHECKING
+if TYPE_CHECKING:
+    from cpu import CPU
+
+# 1 for opcodes that can branch to their operand, the only way a loop is closed
+LOOP_BRANCHES = bytes(opcode.branch in (JUMP, BRANCH) for opcode in OPCODES)
+
+
+class Profiler:
+    # Execution engine counting executions per address (at Fetch), executions and machine cycles per opcode, and
+    # backward (or self) branches taken, which are reported as loops spanning [target, source]. Other backward
+    # transfers, such as SEP returns and interrupts, aren't loops. Counts accumulate over every run_cycles() call
+    # until clear().
+    def __init__(self, cpu: CPU) -> None:
+        self.cpu = cpu
+        self.counts = array('Q', bytes(8 * 2**16))         # instructions fetched from each address
+        self.opcode_counts = array('Q', bytes(8 * 256))
+        self.opcode_cycles = array('Q', bytes(8 * 256))
+        self.loops: dict[tuple[int, int], int] = {}         # (source, target) of backward branches: times taken
+        self._last = (-1, -1, False)                        # PC, P and whether it was a branch, last fetch
+
+    def clear(self) -> None:
+        for counters in (self.counts, self.opcode_counts, self.opcode_cycles):
+            counters[:] = array(counters.typecode, bytes(counters.itemsize * len(counters)))
+        self.loops.clear()
+        self._last = (-1, -1, False)
+
+    def run_cycles(self, n: int, stop_on_idle: bool = False) -> int:
+        # Equivalent to CPU.run_cycles(n), counting as it goes. With stop_on_idle, returns early once IDL has
+        # executed. Returns the number of cycles executed.
+        cpu = self.cpu
+        M, R = cpu.M, cpu.R
+        fetch, execute, force = cpu.fetch_state, cpu.execute_state, cpu.force_execute_state
+        dispatch = DISPATCH
+        counts, opcode_counts, opcode_cycles, loops = self.counts, self.opcode_counts, self.opcode_cycles, self.loops
+        loop_branches = LOOP_BRANCHES
+        last_pc, last_p, branched = self._last
+
+        requests = cpu.io_requested()
+
+        # inlined states are counted here and added to cycles/instructions once on the way out
+        cycle = -1
+        fetched = ticked = 0
+        try:
+            for cycle in range(n):
+                state = cpu._state
+                if state is fetch:
+                    if requests and cpu._service_request():
+                        ticked += 1
+                        continue
+                    fetched += 1
+                    cpu.N2 = cpu.N1 = cpu.N0 = 0
+                    P = cpu.P
+                    pc = R[P]
+                    if pc <= last_pc and branched and P == last_p:
+                        loops[last_pc, pc] = loops.get((last_pc, pc), 0) + 1
+                    counts[pc] += 1
+                    opcode = M[pc]
+                    last_pc, last_p, branched = pc, P, loop_branches[opcode]
+                    opcode_counts[opcode] += 1
+                    opcode_cycles[opcode] += 1
+                    cpu.I = opcode >> 4
+                    cpu.N = opcode & 0x0F
+                    R[P] = (pc + 1) & 0xFFFF
+                    cpu._state = execute
+                elif state is execute:
+                    opcode = (cpu.I << 4) | cpu.N
+                    opcode_cycles[opcode] += 1
+                    dispatch[opcode](cpu)
+                    if stop_on_idle and opcode == 0x00: return cycle + 1
+                else:
+                    ticked += 1
+                    if state is force: opcode_cycles[(cpu.I << 4) | cpu.N] += 1
+                    cpu.tick()
+                    if stop_on_idle and cpu.is_idle(): return cycle + 1
+            return n
+        finally:
+            self._last = (last_pc, last_p, branched)
+            cpu.cycles += cycle + 1 - ticked
+            cpu.instructions += fetched
+
+    def hot_addresses(self, top: int = 20) -> list[tuple[int, int]]:
+        # (address, executions) of the most executed addresses, most executed first
+        counts = self.counts
+        hot = sorted((addr for addr in range(len(counts)) if counts[addr]), key=counts.__getitem__, reverse=True)
+        return [(addr, counts[addr]) for addr in hot[:top]]
+
+    def hot_loops(self, top: int = 10) -> list[tuple[int, int, int, int]]:
+        # (start, end, iterations, instructions executed in [start, end]) of the loops that ran the most
+        # instructions, for loops closed by a jump from end back to start
+        counts = self.counts
+        loops = [(target, source, taken, sum(counts[target:source + 1]))
+                 for (source, target), taken in self.loops.items()]
+        loops.sort(key=lambda loop: loop[3], reverse=True)
+        return loops[:top]
+
+    def report(self, listing: Optional[Mapping[int, str]] = None, top: int = 20) -> str:
+        # Text report of the hottest addresses, loops and opcodes, annotated with listing text by address
+        listing = listing or {}
+        instructions = sum(self.opcode_counts)
+        cycles = sum(self.opcode_cycles)
+        lines = [f"{instructions} instructions, {cycles} machine cycles", "", "Hot addresses",
+                 "  ADDR        COUNT       %  LISTING"]
+        for addr, count in self.hot_addresses(top):
+            lines.append(f"  {addr:04X} {count:12} {percent(count, instructions):>7}  {listing.get(addr, '')}")
+        lines += ["", "Hot loops", "  RANGE       ITERATIONS  INSTRUCTIONS       %  LISTING"]
+        for start, end, taken, count in self.hot_loops(top):
+            lines.append(f"  {start:04X}-{end:04X} {taken:12} {count:13} {percent(count, instructions):>7}  "
+                         f"{listing.get(start, '')}")
+        lines += ["", "Opcodes", "  OP  NAME        COUNT       CYCLES       %"]
+        for opcode in sorted(range(256), key=self.opcode_cycles.__getitem__, reverse=True)[:top]:
+            if not self.opcode_counts[opcode]: break
+            lines.append(f"  {opcode:02X}  {OPCODES[opcode].mnemonic or '?':<4} {self.opcode_counts[opcode]:12} "
+                         f"{self.opcode_cycles[opcode]:12} {percent(self.opcode_cycles[opcode], cycles):>7}")
+        return '\n'.join(lines) + '\n'
+
+    def collapsed(self, listing: Optional[Mapping[int, str]] = None, root: str = 'program',
+                  symbols: Optional[Mapping[str, int]] = None) -> str:
+        # Executions per address in collapsed-stack format ("root;label;instruction count" per line) for flame
+        # graph tools. Instructions are grouped under the nearest label at or before them in listing, or in the
+        # symbol table (e.g. assembler.Image.symbols) when there is one.
+        listing = listing or {}
+        labels = {addr: label for addr, text in listing.items() if (label := listing_label(text))}
+        if symbols: labels.update({addr: name for name, addr in symbols.items()})
+        label = None
+        lines = []
+        for addr, count in enumerate(self.counts):
+            label = labels.get(addr, label)
+            if not count: continue
+            text = ' '.join(listing.get(addr, '').split(';')[0].split()) or f'{self.cpu.M[addr]:02X}'
+            frames = [root, label or '(start)', f'{addr:04X} {text}']
+            lines.append(f"{';'.join(frame.replace(';', ',') for frame in frames)} {count}")
+        return '\n'.join(lines) + '\n' if lines else ''
+
+
+def percent(part: int, whole: int) -> str:
+    return f'{100 * part / whole:.1f}%' if whole else '-'
+
+
+def listing_label(text: str) -> Optional[str]:
+    # 'LOOP' for listing text like 'LOOP: BN4 *  ; WAIT FOR IT'
+    tokens = text.split(';')[0].split()
+    return tokens[0][:-1] if tokens and tokens[0].endswith(':') else None
@@ -1,52 +1,251 @@
 import io
 import os
 import sys
+import json
+import time
+import threading
 import argparse
+import re
+from concurrent.futures import ProcessPoolExecutor
+from assembler import AssemblyError, symbolize
+from blocks import BlockCache
 from cpu import CPU
-import keyboard
+from debugger import Debugger, Hit
+from disassembler import listing
+from display import StatusRenderer
+from jit import JIT
+from loader import LoadError, load_listing, load_program
+from lockstep import CHECK_INTERVAL, Lockstep
+from pacing import ClockPacer, CLOCKS_PER_CYCLE
+from profiler import Profiler
+from scheduler import Scheduler
+from stimuli import StimulusRecorder, replay
+from tracer import TraceRecorder
+from typing import Union
 
+ENGINES = {'reference': lambda cpu: cpu, 'blocks': BlockCache, 'jit': JIT}
+
+
+def main(source_file: io.TextIOWrapper, engine: str = 'jit', batch_cycles: int = 10_000, fps: float = 30,
+         clock_hz: float = None, record: str = None, replay_path: str = None) -> None:
+    # With record, flag toggles, BUS writes and resets are logged there by cycle. With replay_path, a recording
+    # is played back on top of any input.
+    import keyboard  # only the interactive mode needs (and may have permission to use) the keyboard hooks
 
-def main(source_file: io.TextIOWrapper) -> None:
     cpu = CPU()
-    load_mem(source_file, cpu)
-    disp_header(source_file.name)
+    source_file.close()
+    symbols = load_program(source_file.name, cpu)
+    runner = ENGINES[engine](cpu)
+    if replay_path:
+        runner = Scheduler(cpu, runner)
+        replay(replay_path, runner)
+    # input goes through the recorder so it lands between batches, on a cycle a replay can reproduce
+    stimuli = StimulusRecorder(cpu, runner, record)
+    pacer = ClockPacer(clock_hz, CLOCKS_PER_CYCLE) if clock_hz else None
+    display = StatusRenderer(fps=fps)
+    display.header(source_file.name)
 
-    keyboard.add_hotkey('ctrl+1', lambda: cpu.toggle_external_flag(1))
-    keyboard.add_hotkey('ctrl+2', lambda: cpu.toggle_external_flag(2))
-    keyboard.add_hotkey('ctrl+3', lambda: cpu.toggle_external_flag(3))
-    keyboard.add_hotkey('ctrl+4', lambda: cpu.toggle_external_flag(4))
+    flag_toggled = threading.Event()
+
+    def toggle_flag(id: int) -> None:
+        stimuli.toggle_flag(id)
+        flag_toggled.set()
+
+    keyboard.add_hotkey('ctrl+1', lambda: toggle_flag(1))
+    keyboard.add_hotkey('ctrl+2', lambda: toggle_flag(2))
+    keyboard.add_hotkey('ctrl+3', lambda: toggle_flag(3))
+    keyboard.add_hotkey('ctrl+4', lambda: toggle_flag(4))
 
     cpu.run()
     while True:
-        cpu.tick()
-        disp_cpu_status(cpu)
+        # emulate in batches, the display samples CPU state at its own frame rate
+        emulate(cpu, stimuli, batch_cycles, display.frame_time, flag_toggled, pacer)
+        display.render(cpu)
 
         if keyboard.is_pressed('space'):
-            main_menu(cpu, source_file.name)
+            main_menu(cpu, source_file.name, display, pacer, stimuli, symbols)
+            if pacer: pacer.resync()
 
-        if keyboard.is_pressed('esc'): exit(0)
+        if keyboard.is_pressed('esc'):
+            stimuli.close()
+            exit(0)
 
         if keyboard.is_pressed('ctrl+r'):
-            cpu.reset()
-            cpu.run()
+            stimuli.reset()
+            stimuli.apply()
 
 
-def load_mem(source_file: io.TextIOWrapper, cpu: CPU) -> None:
-    for line in source_file:
-        if line.startswith(';'): continue
-        tokens = line.split()
-        if len(tokens) < 2: raise SyntaxError("Lines must contain at least memory address and opcode.")
+def emulate(cpu: CPU, stimuli: StimulusRecorder, batch_cycles: int, frame_time: float,
+            flag_toggled: threading.Event, pacer: ClockPacer = None) -> None:
+    # Emulation between two frames of the interactive mode. While paused nothing runs, but a toggled flag still takes
+    # effect at once, as it would on a stopped CPU.
+    if cpu.running and pacer:
+        pacer.run(stimuli, pacer.batch_cycles)
+    elif cpu.running:
+        stimuli.run_cycles(batch_cycles)
+        if cpu.waiting():
+            # only a flag can end the wait, block on it (or the next frame) instead of spinning batches
+            flag_toggled.wait(frame_time)
+        flag_toggled.clear()
+    else:
+        flag_toggled.wait(frame_time)
+        flag_toggled.clear()
+        stimuli.apply()
 
-        try:
-            addr = int(tokens[0], 16)
-            opcodes = [int(tokens[1][i:i + 2], 16) for i in range(0, len(tokens[1]), 2)]
-        except ValueError:
-            print(f'Invalid syntax: {line}')
-            exit(1)
-
-        for i, opcode in enumerate(opcodes):
-            cpu.M[addr + i] = opcode
-    source_file.close()
+
+def load_mem(source_file: io.TextIOWrapper, cpu: CPU, listing: dict[int, str] = None) -> None:
+    # Load a program listing into memory and close it, see loader.load_listing
+    try:
+        load_listing(source_file, cpu, listing)
+    finally:
+        source_file.close()
+
+
+def run_headless(path: str, max_cycles: int, memory_ranges: list[tuple[int, int]], engine: str = 'jit',
+                 clock_hz: float = None, trace: str = None, profile: bool = False, breakpoints: list[int] = (),
+                 watchpoints: list[tuple[int, int, str]] = (), replay_path: str = None) -> dict:
+    # Run one program without keyboard or console until IDL or max_cycles, return its final state. With trace, the
+    # run is recorded instruction by instruction instead of using engine (xz compressed if trace ends in .xz). With
+    # profile, it is profiled instead and the result includes the report and collapsed stacks. The run also stops at
+    # the first breakpoint or (start, end, kind) watchpoint hit, which is included in the result. With replay_path,
+    # the stimuli recorded there are applied on their cycles, and IDL only ends the run once none are left.
+    if trace and profile: raise ValueError("A run can't be traced and profiled at once.")
+    if (trace or profile) and (breakpoints or watchpoints):
+        raise ValueError("Breakpoints and watchpoints can't be combined with tracing or profiling.")
+    cpu = CPU()
+    listing = {}
+    symbols = load_program(path, cpu, listing)
+    cpu.run()
+
+    if trace:
+        runner = TraceRecorder(cpu, trace, 'lzma' if trace.endswith('.xz') else 'zlib')
+        engine = 'trace'
+    elif profile:
+        runner = Profiler(cpu)
+        engine = 'profile'
+    else:
+        runner = debugger = Debugger(cpu, ENGINES[engine](cpu), symbols)
+        for addr in breakpoints: debugger.add_breakpoint(addr)
+        for start, end, kind in watchpoints: debugger.add_watchpoint(start, end, kind)
+    scheduler = Scheduler(cpu, runner)
+    if replay_path: replay(replay_path, scheduler)
+    pacer = ClockPacer(clock_hz, CLOCKS_PER_CYCLE) if clock_hz else None
+    start = time.perf_counter()
+    if pacer:
+        cycles = pacer.run(scheduler, max_cycles, stop_on_idle=True)
+    else:
+        cycles = scheduler.run_cycles(max_cycles, stop_on_idle=True)
+    if trace: runner.close()
+    elapsed = time.perf_counter() - start
+
+    return {
+        'file': path,
+        'engine': engine,
+        'cycles': cycles,
+        'instructions': cpu.instructions,
+        'idle': cpu.is_idle(),
+        'elapsed': elapsed,
+        'registers': {'D': cpu.D, 'DF': cpu.DF, 'P': cpu.P, 'X': cpu.X, 'Q': cpu.Q, 'T': cpu.T, 'IE': cpu.IE,
+                      'BUS': cpu.BUS, 'EF': list(cpu.EF), 'R': list(cpu.R)},
+        'memory': {f'{start:04X}-{end - 1:04X}': cpu.dump(start, end).hex().upper() for start, end in memory_ranges},
+        'clock': pacer.report() if pacer else None,
+        'profile': {'report': runner.report(listing),
+                    'collapsed': runner.collapsed(listing, os.path.basename(path), symbols)} if profile else None,
+        'hit': runner.hit._asdict() if isinstance(runner, Debugger) and runner.hit else None,
+    }
+
+
+def main_headless(paths: list[str], max_cycles: int, memory_ranges: list[tuple[int, int]], engine: str,
+                  dump_state: str = None, jobs: int = None, clock_hz: float = None, trace: str = None,
+                  profile: bool = False, collapsed: str = None, breakpoints: list[int] = (),
+                  watchpoints: list[tuple[int, int, str]] = (), replay_path: str = None) -> list[dict]:
+    # Run every program, one per worker process when there is more than one. With profile, each program's profile
+    # report is printed, and with collapsed their collapsed stacks are written there.
+    if trace and len(paths) > 1: raise ValueError("Only one program can be traced at a time.")
+    profile = profile or bool(collapsed)
+    args = [(path, max_cycles, memory_ranges, engine, clock_hz, trace, profile, breakpoints, watchpoints, replay_path)
+            for path in paths]
+    if len(paths) == 1:
+        results = [run_headless(*args[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(run_headless, *zip(*args)))
+
+    for result in results:
+        print(f"{result['file']}: {result['cycles']} cycles in {result['elapsed']:.3f}s"
+              f"{' (idle)' if result['idle'] else ''}")
+        if result['hit']: print(f"  stopped: {Hit(**result['hit'])}")
+        if profile: print(result['profile']['report'])
+    if collapsed:
+        with open(collapsed, 'w') as out_file:
+            out_file.writelines(result['profile']['collapsed'] for result in results)
+    if dump_state:
+        with open(dump_state, 'w') as out_file:
+            json.dump(results, out_file, indent=2)
+    return results
+
+
+def check_headless(path: str, max_cycles: int, engine: str = 'jit', interval: int = CHECK_INTERVAL) -> dict:
+    # Run one program on engine and the reference state machine in lockstep until IDL or max_cycles, return how far
+    # they got and the first divergence as text, if there was one
+    symbols = {}
+
+    def make_cpu() -> CPU:
+        cpu = CPU()
+        symbols.update(load_program(path, cpu))
+        cpu.run()
+        return cpu
+
+    lockstep = Lockstep(make_cpu, ENGINES[engine], interval=interval, symbols=symbols)
+    start = time.perf_counter()
+    cycles = lockstep.run_cycles(max_cycles, stop_on_idle=True)
+    return {
+        'file': path,
+        'engine': engine,
+        'cycles': cycles,
+        'instructions': lockstep.expected.instructions,
+        'elapsed': time.perf_counter() - start,
+        'divergence': str(lockstep.divergence) if lockstep.divergence else None,
+    }
+
+
+def main_check(paths: list[str], max_cycles: int, engine: str, jobs: int = None,
+               interval: int = CHECK_INTERVAL) -> bool:
+    # Check engine against the reference on every program, one per worker process when there is more than one.
+    # Returns whether they all matched.
+    args = [(path, max_cycles, engine, interval) for path in paths]
+    if len(paths) == 1:
+        results = [check_headless(*args[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(check_headless, *zip(*args)))
+
+    for result in results:
+        print(f"{result['file']}: {result['instructions']} instructions in {result['elapsed']:.3f}s, "
+              f"{'diverged' if result['divergence'] else 'matched'}")
+        if result['divergence']: print(result['divergence'])
+    return not any(result['divergence'] for result in results)
+
+
+def address(text: str) -> Union[int, str]:
+    # ADDR in hex, or a label of an assembled program
+    try:
+        addr = int(text, 16)
+    except ValueError:
+        if re.fullmatch(r'[A-Za-z_.][A-Za-z0-9_.]*', text): return text
+        raise argparse.ArgumentTypeError(f"Invalid address: {text}")
+    if not 0 <= addr <= 0xFFFF: raise argparse.ArgumentTypeError(f"Invalid address: {text}")
+    return addr
+
+
+def memory_range(text: str) -> tuple[int, int]:
+    # START:END in hex, inclusive of END
+    try:
+        start, end = (int(token, 16) for token in text.split(':'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid memory range: {text}")
+    if not 0 <= start <= end <= 0xFFFF: raise argparse.ArgumentTypeError(f"Invalid memory range: {text}")
+    return start, end + 1
 
 
 def flush_input():
@@ -66,35 +265,24 @@ def exit(val):
     sys.exit(val)
 
 
-def clear():
-    os.system('cls')
-
-
-def disp_header(fname, truncate=False):
-    clear()
-    print(f"Executing {fname}")
-    if not truncate:
-        print("<Esc> to exit.")
-        print("<Space> to open main menu.")
-        print("<Ctrl+R> to reset processor.")
-        print("<Ctrl+[1:4]> to toggle external flag.")
-
-
-def disp_cpu_status(cpu):
-    print(f"DATA: 0x{'{:02X}'.format(cpu.BUS)}\tQ: {cpu.Q}\tEF1-4: {''.join([str(val) for val in cpu.EF])}"
-          f"\t{'Running' if cpu.running else 'Paused'}", end='\r')
-
-
-def main_menu(cpu, fname):
+def main_menu(cpu, fname, display, pacer=None, stimuli=None, symbols=None):
+    stimuli = stimuli or StimulusRecorder(cpu)
     while True:
-        disp_header(fname, truncate=True)
-        disp_cpu_status(cpu)
-        print(f"\nExecution halted at instruction {hex(cpu.R[cpu.P])}.")
+        display.header(fname, truncate=True)
+        display.render(cpu, force=True)
+        display.newline()
+        print(f"Execution halted at instruction {symbolize(cpu.R[cpu.P], symbols or {})}:")
+        print(listing(cpu.M, cpu.R[cpu.P], cpu.R[cpu.P] + 1, symbols), end='')
+        if pacer:
+            report = pacer.report()
+            print(f"Clock: {report['achieved_cycles_per_s'] * CLOCKS_PER_CYCLE / 1e6:.3f} of "
+                  f"{report['target_cycles_per_s'] * CLOCKS_PER_CYCLE / 1e6:.3f} MHz, {report['slips']} slips.")
         print("[1] Run")
         print("[2] Pause")
         print("[3] Reset")
         print("[4] Modify External Flags")
         print("[5] Write Data Bus")
+        print("[6] Disassemble Memory")
         flush_input()
         match input("Enter menu option or leave blank to resume program execution >> "):
             case "":
@@ -106,30 +294,95 @@ def main_menu(cpu, fname):
                 cpu.pause()
                 break
             case "3":
-                cpu.reset()
-                cpu.run()
+                stimuli.reset()
+                stimuli.apply()
                 break
             case "4":
                 while True:
-                    disp_header(fname, truncate=True)
-                    disp_cpu_status(cpu)
-                    ef = input("\nEnter external flag number (1/2/3/4) or leave blank to exit menu >> ")
+                    display.header(fname, truncate=True)
+                    display.render(cpu, force=True)
+                    display.newline()
+                    ef = input("Enter external flag number (1/2/3/4) or leave blank to exit menu >> ")
                     if not ef: break
-                    if ef in ['1', '2', '3', '4']: cpu.EF[int(ef) - 1] ^= 1
+                    if ef in ['1', '2', '3', '4']:
+                        stimuli.toggle_flag(int(ef))
+                        stimuli.apply()
             case "5":
                 if user_input := input("Hex data bus value >> "):
                     val = int(user_input, 0)
                     if 0 <= val <= 0xFF:
-                        cpu.BUS = val
+                        stimuli.write_bus(val)
+                        stimuli.apply()
                     else:
                         print("Invalid data bus value.")
+            case "6":
+                if user_input := input("Hex memory range (START:END) >> "):
+                    try:
+                        start, end = memory_range(user_input)
+                    except argparse.ArgumentTypeError as e:
+                        print(e)
+                    else:
+                        print(listing(cpu.M, start, end, symbols), end='')
+                        input("Press enter to continue >> ")
 
-    disp_header(fname)
+    display.header(fname)
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Execute assembly code on an emulated RCA 1802 processor.')
-    parser.add_argument('infile', type=argparse.FileType('r'))
+    parser.add_argument('infile', nargs='+', help='program listing, source, Intel HEX (.hex) or binary image (.bin), '
+                                                  'several are only accepted with --headless')
+    parser.add_argument('--headless', action='store_true', help='run without keyboard or console display')
+    parser.add_argument('--max-cycles', type=int, default=10_000_000, help='headless cycle limit per program')
+    parser.add_argument('--dump-state', metavar='FILE', help='write final headless state as JSON')
+    parser.add_argument('--dump-memory', metavar='START:END', type=memory_range, action='append', default=[],
+                        help='hex memory range to include in the dumped state, may be repeated')
+    parser.add_argument('--engine', choices=ENGINES, default='jit', help='execution engine')
+    parser.add_argument('--batch-cycles', type=int, default=10_000, help='interactive cycles between input polls')
+    parser.add_argument('--fps', type=float, default=30, help='interactive status refresh rate')
+    parser.add_argument('--jobs', type=int, help='worker processes for multiple programs')
+    parser.add_argument('--clock', type=float, metavar='HZ', help='pace emulation to this clock rate, e.g. 1.76e6')
+    parser.add_argument('--trace', metavar='FILE', help='record a headless run to a gzip (or .xz) execution trace')
+    parser.add_argument('--profile', action='store_true', help='print a hot spot report for each headless program')
+    parser.add_argument('--collapsed', metavar='FILE', help='write headless profiles as collapsed stacks')
+    parser.add_argument('--break', dest='breakpoints', metavar='ADDR', type=address, action='append', default=[],
+                        help='stop a headless run before executing the instruction at this hex address or label')
+    parser.add_argument('--watch', metavar='START:END', type=memory_range, action='append', default=[],
+                        help='stop a headless run before an instruction writes this hex memory range')
+    parser.add_argument('--watch-read', metavar='START:END', type=memory_range, action='append', default=[],
+                        help='stop a headless run before an instruction reads this hex memory range')
+    parser.add_argument('--record', metavar='FILE', help='log interactive flag toggles, BUS writes and resets by cycle')
+    parser.add_argument('--replay', metavar='FILE', help='apply stimuli logged with --record on the same cycles')
+    parser.add_argument('--check', action='store_true',
+                        help='run headless programs on --engine and the reference state machine in lockstep and '
+                             'report where they first differ')
+    parser.add_argument('--check-interval', type=int, default=CHECK_INTERVAL, metavar='INSTRUCTIONS',
+                        help='instructions between lockstep state comparisons')
     args = parser.parse_args()
-    main(args.infile)
+
+    if args.headless:
+        if args.trace and len(args.infile) > 1: parser.error('only one infile can be traced')
+        if args.trace and (args.profile or args.collapsed): parser.error('--trace and profiling are exclusive')
+        watchpoints = ([(start, end, 'write') for start, end in args.watch] +
+                       [(start, end, 'read') for start, end in args.watch_read])
+        if (args.trace or args.profile or args.collapsed) and (args.breakpoints or watchpoints):
+            parser.error('breakpoints and watchpoints can\'t be combined with --trace or profiling')
+        try:
+            if args.check:
+                sys.exit(0 if main_check(args.infile, args.max_cycles, args.engine, args.jobs, args.check_interval)
+                         else 1)
+            main_headless(args.infile, args.max_cycles, args.dump_memory, args.engine, args.dump_state, args.jobs,
+                          args.clock, args.trace, args.profile, args.collapsed, args.breakpoints, watchpoints,
+                          args.replay)
+        except (LoadError, AssemblyError) as e:
+            sys.exit(f'Error loading program: {e.msg}')
+        except ValueError as e:     # e.g. a breakpoint on a label the program doesn't define
+            sys.exit(f'Error: {e}')
+        sys.exit(0)
+    if len(args.infile) > 1: parser.error('only one infile can be run interactively')
+    try:
+        main(open(args.infile[0]), args.engine, args.batch_cycles, args.fps, args.clock, args.record, args.replay)
+    except (LoadError, AssemblyError) as e:
+        print(f'Error loading program: {e.msg}')
+        exit(1)
     exit(0)
@@ -0,0 +1,107 @@
+from __future__ import annotations
+import heapq
+from itertools import count
+from typing import Callable, Optional, TYPE_CHECKING
+if TYPE_CHECKING:
+    from cpu import CPU
+    from pacing import Runner
+
+
+Action = Callable[['CPU'], None]
+
+
+class Scheduler:
+    # Execution engine firing external events (raising INT, requesting DMA, setting EF lines, ...) at exact
+    # CPU.cycles values. Events are kept in a heap and the wrapped engine runs in batches that end where the next
+    # event comes due, so engines only look at request lines as a batch starts and the no-event case runs at
+    # engine speed. An event due at cycle c fires before the machine cycle with cycles == c runs.
+    def __init__(self, cpu: CPU, engine: Optional[Runner] = None) -> None:
+        self.cpu = cpu
+        self.engine = engine if engine is not None else cpu
+        self._events: list[tuple[int, int, Action]] = []
+        self._order = count()   # ties fire in the order they were scheduled
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def at(self, cycle: int, action: Action) -> None:
+        # Call action(cpu) once CPU.cycles reaches cycle, right away at the next run if it already has
+        heapq.heappush(self._events, (cycle, next(self._order), action))
+
+    def after(self, delay: int, action: Action) -> None:
+        self.at(self.cpu.cycles + delay, action)
+
+    def next_due(self) -> Optional[int]:
+        return self._events[0][0] if self._events else None
+
+    def clear(self) -> None:
+        self._events.clear()
+
+    def _fire(self) -> None:
+        cpu, events = self.cpu, self._events
+        while events and events[0][0] <= cpu.cycles:
+            heapq.heappop(events)[2](cpu)
+
+    def run_cycles(self, n: int, stop_on_idle: bool = False) -> int:
+        # Equivalent to engine.run_cycles(n) with the scheduled events fired on time. With stop_on_idle, returns
+        # early once IDL has executed and no event is left to wake the CPU. Returns the number of cycles executed.
+        cpu, events = self.cpu, self._events
+        done = 0
+        while done < n:
+            self._fire()
+            step = n - done
+            if events: step = min(step, events[0][0] - cpu.cycles)
+            ran = self.engine.run_cycles(step, stop_on_idle and not events)
+            done += ran
+            if ran < step: break
+        else:
+            self._fire()    # leave nothing due behind for callers that inspect the CPU between runs
+        return done
+
+
+def interrupt(level: int = 1) -> Action:
+    # Event setting the INT line (taken at the next S0 while IE is set, held until cleared with interrupt(0))
+    def action(cpu: CPU) -> None:
+        cpu.INT = level
+    return action
+
+
+def dma_in(cycles: int = 1) -> Action:
+    # Event requesting DMA-in cycles, each storing a byte from cpu.dma_device (or the BUS) at M(R(0))
+    def action(cpu: CPU) -> None:
+        cpu.DMA_IN += cycles
+    return action
+
+
+def dma_out(cycles: int = 1) -> Action:
+    # Event requesting DMA-out cycles, each putting M(R(0)) on the BUS for cpu.dma_device
+    def action(cpu: CPU) -> None:
+        cpu.DMA_OUT += cycles
+    return action
+
+
+def set_flag(flag: int, value: int) -> Action:
+    # Event setting external flag EF1-EF4 (flag 1-4)
+    def action(cpu: CPU) -> None:
+        cpu.EF[flag - 1] = value
+    return action
+
+
+def toggle_flag(flag: int) -> Action:
+    def action(cpu: CPU) -> None:
+        cpu.toggle_external_flag(flag)
+    return action
+
+
+def write_bus(value: int) -> Action:
+    def action(cpu: CPU) -> None:
+        cpu.BUS = value
+    return action
+
+
+def reset() -> Action:
+    # Event resetting the CPU and running it again, the Init cycle runs right away (outside any batch)
+    def action(cpu: CPU) -> None:
+        cpu.reset()
+        cpu.run()
+    return action
@@ -1,14 +1,14 @@
 from __future__ import annotations
 from abc import ABC, abstractmethod
-from instructions import decode
+from instructions import DISPATCH
 from typing import Optional, TYPE_CHECKING
 if TYPE_CHECKING:
     from cpu import CPU
 
 
 class State(ABC):
-    def __init__(self) -> None:
-        self._context: Optional[CPU] = None
+    def __init__(self, context: Optional[CPU] = None) -> None:
+        self._context: Optional[CPU] = context
 
     @property
     def context(self) -> CPU:
@@ -35,114 +35,231 @@ class State(ABC):
         pass
 
 
+# States are preallocated once per CPU (see CPU.__init__) and transitions swap between those instances
+# by assigning CPU._state directly, so the hot Fetch/Execute loop never allocates.
+
+class DMAIn(State):
+    # S2 cycle of a DMA-in request, taken in place of S0 (see CPU._service_request)
+    def tick(self) -> None:
+        cpu = self._context
+        cpu.cycles += 1
+        cpu.DMA_IN -= 1
+        if cpu.dma_device is not None: cpu.BUS = cpu.dma_device.read() & 0xFF
+        cpu.store(cpu.R[0], cpu.BUS)
+        cpu.increment_register(0)
+        cpu._state = cpu.fetch_state
+
+    def reset(self) -> None:
+        cpu = self._context
+        cpu._state = cpu.reset_state
+        cpu.tick()
+
+    def run(self) -> None:
+        self._context.tick()
+
+    def pause(self) -> None:
+        cpu = self._context
+        cpu.pause_state.prev_state = self
+        cpu._state = cpu.pause_state
+        cpu.tick()
+
+
+class DMAOut(State):
+    # S2 cycle of a DMA-out request, taken in place of S0 (see CPU._service_request)
+    def tick(self) -> None:
+        cpu = self._context
+        cpu.cycles += 1
+        cpu.DMA_OUT -= 1
+        cpu.BUS = cpu.M[cpu.R[0]]
+        if cpu.dma_device is not None: cpu.dma_device.write(cpu.BUS)
+        cpu.increment_register(0)
+        cpu._state = cpu.fetch_state
+
+    def reset(self) -> None:
+        cpu = self._context
+        cpu._state = cpu.reset_state
+        cpu.tick()
+
+    def run(self) -> None:
+        self._context.tick()
+
+    def pause(self) -> None:
+        cpu = self._context
+        cpu.pause_state.prev_state = self
+        cpu._state = cpu.pause_state
+        cpu.tick()
+
+
 class Execute(State):
     def tick(self) -> None:
-        decode(self.context, self.context.I, self.context.N)
+        cpu = self._context
+        cpu.cycles += 1
+        DISPATCH[(cpu.I << 4) | cpu.N](cpu)
 
     def reset(self) -> None:
-        self.context.set_state(Reset())
-        self.context.tick()
+        cpu = self._context
+        cpu._state = cpu.reset_state
+        cpu.tick()
 
     def run(self) -> None:
-        self.context.tick()
+        self._context.tick()
 
     def pause(self) -> None:
-        self.context.set_state(Pause(prev_state=self))
-        self.context.tick()
+        cpu = self._context
+        cpu.pause_state.prev_state = self
+        cpu._state = cpu.pause_state
+        cpu.tick()
 
 
 class Fetch(State):
     def tick(self) -> None:
-        opcode = self.context.M[self.context.R[self.context.P]]
-        self.context.I = (opcode >> 4) & 0x0F
-        self.context.N = opcode & 0x0F
-        self.context.increment_program_counter()
-        self.context.set_state(Execute())
+        cpu = self._context
+        # requests are sampled at the end of S1, so an S2 or S3 cycle may take the place of this S0
+        if (cpu.DMA_IN or cpu.DMA_OUT or cpu.INT) and cpu._service_request(): return
+        cpu.cycles += 1
+        cpu.instructions += 1
+        opcode = cpu.M[cpu.R[cpu.P]]
+        cpu.I = (opcode >> 4) & 0x0F
+        cpu.N = opcode & 0x0F
+        cpu.increment_program_counter()
+        cpu._state = cpu.execute_state
 
     def reset(self) -> None:
-        self.context.set_state(Reset())
-        self.context.tick()
+        cpu = self._context
+        cpu._state = cpu.reset_state
+        cpu.tick()
 
     def run(self) -> None:
-        self.context.tick()
+        self._context.tick()
 
     def pause(self) -> None:
-        self.context.set_state(Pause(prev_state=self))
-        self.context.tick()
+        cpu = self._context
+        cpu.pause_state.prev_state = self
+        cpu._state = cpu.pause_state
+        cpu.tick()
 
 
 class ForceExecute(State):
     def tick(self) -> None:
-        decode(self.context, self.context.I, self.context.N)
-        self.context.set_state(Fetch())
+        cpu = self._context
+        cpu.cycles += 1
+        DISPATCH[(cpu.I << 4) | cpu.N](cpu)
+        cpu._state = cpu.fetch_state
 
     def reset(self) -> None:
-        self.context.set_state(Reset())
-        self.context.tick()
+        cpu = self._context
+        cpu._state = cpu.reset_state
+        cpu.tick()
 
     def run(self) -> None:
-        self.context.tick()
+        self._context.tick()
 
     def pause(self) -> None:
-        self.context.set_state(Pause(prev_state=self))
-        self.context.tick()
+        cpu = self._context
+        cpu.pause_state.prev_state = self
+        cpu._state = cpu.pause_state
+        cpu.tick()
 
 
 class Init(State):
     def tick(self) -> None:
-        self.context.X = 0
-        self.context.P = 0
-        self.context.R[0] = 0
+        cpu = self._context
+        cpu.cycles += 1
+        cpu.X = 0
+        cpu.P = 0
+        cpu.R[0] = 0
 
-        self.context.set_state(Fetch())
+        cpu._state = cpu.fetch_state
 
     def reset(self) -> None:
-        self.context.set_state(Reset())
-        self.context.tick()
+        cpu = self._context
+        cpu._state = cpu.reset_state
+        cpu.tick()
 
     def run(self) -> None:
         pass  # not implemented, INIT state is only entered when transitioning from RESET to RUN
 
     def pause(self) -> None:
-        self.context.set_state(Pause(prev_state=self))
-        self.context.tick()
+        cpu = self._context
+        cpu.pause_state.prev_state = self
+        cpu._state = cpu.pause_state
+        cpu.tick()
+
+
+class Interrupt(State):
+    # S3 interrupt cycle, taken in place of S0 while INT is raised and IE is set (see CPU._service_request)
+    def tick(self) -> None:
+        cpu = self._context
+        cpu.cycles += 1
+        cpu.T = (cpu.X << 4) | cpu.P
+        cpu.P = 1
+        cpu.X = 2
+        cpu.IE = 0
+        cpu._state = cpu.fetch_state
+
+    def reset(self) -> None:
+        cpu = self._context
+        cpu._state = cpu.reset_state
+        cpu.tick()
+
+    def run(self) -> None:
+        self._context.tick()
+
+    def pause(self) -> None:
+        cpu = self._context
+        cpu.pause_state.prev_state = self
+        cpu._state = cpu.pause_state
+        cpu.tick()
 
 
 class Pause(State):
-    def __init__(self, prev_state):
-        super().__init__()
+    def __init__(self, prev_state: Optional[State] = None, context: Optional[CPU] = None) -> None:
+        super().__init__(context)
+        self._prev_state = prev_state
+
+    @property
+    def prev_state(self) -> Optional[State]:
+        return self._prev_state
+
+    @prev_state.setter
+    def prev_state(self, prev_state: State) -> None:
         self._prev_state = prev_state
 
     def tick(self) -> None:
         pass  # do nothing
 
     def reset(self) -> None:
-        self.context.set_state(Reset())
-        self.context.tick()
+        cpu = self._context
+        cpu._state = cpu.reset_state
+        cpu.tick()
 
     def run(self) -> None:
-        self.context.set_state(self._prev_state)
-        self.context.tick()
+        self._context.set_state(self._prev_state)
+        self._context.tick()
 
     def pause(self) -> None:
-        self.context.tick()
+        self._context.tick()
 
 
 class Reset(State):
     def tick(self) -> None:
-        self.context.I = 0
-        self.context.N = 0
-        self.context.Q = 0
-        self.context.IE = 1
-        self.context.BUS = 0
+        cpu = self._context
+        cpu.I = 0
+        cpu.N = 0
+        cpu.Q = 0
+        cpu.IE = 1
+        cpu.BUS = 0
 
     def reset(self) -> None:
-        self.context.tick()
+        self._context.tick()
 
     def run(self) -> None:
-        self.context.set_state(Init())
-        self.context.tick()
+        cpu = self._context
+        cpu._state = cpu.init_state
+        cpu.tick()
 
     def pause(self) -> None:
-        self.context.set_state(Pause(prev_state=self))
-        self.context.tick()
+        cpu = self._context
+        cpu.pause_state.prev_state = self
+        cpu._state = cpu.pause_state
+        cpu.tick()
@@ -0,0 +1,99 @@
+from __future__ import annotations
+import queue
+import struct
+from scheduler import Scheduler, reset, toggle_flag, write_bus
+from typing import BinaryIO, Iterator, NamedTuple, Optional, TYPE_CHECKING
+if TYPE_CHECKING:
+    from cpu import CPU
+    from pacing import Runner
+
+
+STIMULI_MAGIC = b'1802STM'
+STIMULI_VERSION = 1
+RECORD = struct.Struct('<QBB')  # see Stimulus
+FLAG = 1        # EF toggle, value is the flag (1-4)
+BUS = 2         # BUS write, value is the byte
+RESET = 3       # reset and run, value is unused
+ACTIONS = {FLAG: toggle_flag, BUS: write_bus, RESET: lambda value: reset()}
+
+
+class Stimulus(NamedTuple):
+    cycle: int      # CPU.cycles when it was applied, before that machine cycle ran
+    kind: int       # FLAG, BUS or RESET
+    value: int
+
+
+class StimulusRecorder:
+    # Execution engine applying external stimuli between batches and logging each with the CPU.cycles it took effect
+    # at, so a replay() is bit-identical. toggle_flag(), write_bus() and reset() can be called from any thread (e.g.
+    # keyboard callbacks); stimuli are queued until the next run_cycles() or apply(). Without a path nothing is
+    # logged, but stimuli still land on batch boundaries.
+    def __init__(self, cpu: CPU, engine: Optional[Runner] = None, path: Optional[str] = None) -> None:
+        self.cpu = cpu
+        self.engine = engine if engine is not None else cpu
+        self.path = path
+        self.records = 0
+        self._pending: queue.SimpleQueue[tuple[int, int]] = queue.SimpleQueue()
+        self._file: Optional[BinaryIO] = open(path, 'wb') if path else None
+        if self._file is not None: self._file.write(STIMULI_MAGIC + bytes([STIMULI_VERSION]))
+
+    def __enter__(self) -> StimulusRecorder:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.apply()
+        if self._file is not None: self._file.close()
+
+    def toggle_flag(self, id: int) -> None:
+        if id not in [1, 2, 3, 4]: raise IndexError
+        self._pending.put((FLAG, id))
+
+    def write_bus(self, value: int) -> None:
+        if not 0 <= value <= 0xFF: raise ValueError(f"Invalid data bus value: {value}")
+        self._pending.put((BUS, value))
+
+    def reset(self) -> None:
+        self._pending.put((RESET, 0))
+
+    def apply(self) -> None:
+        # Apply and log queued stimuli now, only call between batches
+        while True:
+            try:
+                kind, value = self._pending.get_nowait()
+            except queue.Empty:
+                return
+            cycle = self.cpu.cycles
+            ACTIONS[kind](value)(self.cpu)
+            self.records += 1
+            if self._file is not None:
+                self._file.write(RECORD.pack(cycle, kind, value))
+                self._file.flush()
+
+    def run_cycles(self, n: int, stop_on_idle: bool = False) -> int:
+        # engine.run_cycles(n) after applying queued stimuli
+        self.apply()
+        return self.engine.run_cycles(n, stop_on_idle)
+
+
+def read_stimuli(path: str) -> Iterator[Stimulus]:
+    with open(path, 'rb') as stimuli_file:
+        header = stimuli_file.read(len(STIMULI_MAGIC) + 1)
+        if header[:-1] != STIMULI_MAGIC: raise ValueError(f"{path} is not a stimuli recording.")
+        if header[-1] != STIMULI_VERSION: raise ValueError(f"Unsupported stimuli version {header[-1]}.")
+        data = stimuli_file.read()
+    if len(data) % RECORD.size: raise ValueError(f"{path} is truncated.")
+    for cycle, kind, value in RECORD.iter_unpack(data):
+        if kind not in ACTIONS: raise ValueError(f"Invalid stimulus kind {kind} in {path}.")
+        yield Stimulus(cycle, kind, value)
+
+
+def replay(path: str, scheduler: Scheduler) -> int:
+    # Schedule the stimuli recorded at path as events, returns how many there are
+    stimuli = 0
+    for stimulus in read_stimuli(path):
+        scheduler.at(stimulus.cycle, ACTIONS[stimulus.kind](stimulus.value))
+        stimuli += 1
+    return stimuli
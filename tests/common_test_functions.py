@@ -1,7 +1,11 @@
 from __future__ import annotations
-from typing import TYPE_CHECKING
-if TYPE_CHECKING:
-    from cpu import CPU
+import unittest
+from cpu import CPU
+
+# counts R1 down from 5, accumulating into M(COUNT_ADDR) and echoing it with OUT 4, then sets Q and idles
+COUNTING_PROGRAM = bytes([0xF8, 0x05, 0xA1, 0xF8, 0x40, 0xA2, 0xE2, 0x81, 0xF4, 0x52, 0x64, 0x22, 0x21, 0x81, 0xCA,
+                          0x00, 0x07, 0x7B, 0x00])
+COUNT_ADDR = 0x40
 
 
 def force_two_cycle_instruction(cpu: CPU, opcode: int, repeat: int = 1):
@@ -15,3 +19,20 @@ def force_three_cycle_instruction(cpu: CPU, opcode: int, repeat: int = 1):
     for _ in range(repeat):
         force_two_cycle_instruction(cpu, opcode)
         cpu.tick()  # execute
+
+
+def make_cpu(program: bytes = COUNTING_PROGRAM) -> CPU:
+    # running CPU with program loaded at 0 and the count starting at 3
+    cpu = CPU()
+    cpu.load(0, bytes(program))
+    cpu.M[COUNT_ADDR] = 0x03
+    cpu.run()
+    return cpu
+
+
+def assert_same_state(test: unittest.TestCase, expected: CPU, actual: CPU):
+    for attr in ['D', 'DF', 'P', 'X', 'I', 'N', 'Q', 'BUS', 'N0', 'N1', 'N2', 'cycles', 'instructions']:
+        test.assertEqual(getattr(expected, attr), getattr(actual, attr), attr)
+    test.assertEqual(list(expected.R), list(actual.R))
+    test.assertEqual(expected.dump(), actual.dump())
+    test.assertIs(type(expected.get_state()), type(actual.get_state()))
@@ -0,0 +1,51 @@
+import unittest
+from alu import ADD_DF, ADD_RESULT, CARRY_IN, SHL_DF, SHL_RESULT, SHR_DF, SHR_RESULT, SUB_DF, SUB_RESULT, TABLES
+from cpu import CPU
+from jit import JIT
+
+
+class ALUTests(unittest.TestCase):
+    def test_two_operand_tables(self):
+        # every entry against the arithmetic the handlers used to do, subtraction as adding the complement
+        self.assertEqual(2**17, len(ADD_RESULT))
+        for carry in range(2):
+            for a in range(256):
+                for b in range(256):
+                    i = (carry << 16) | (a << 8) | b
+                    total = a + b + carry
+                    self.assertEqual((total & 0xFF, int(total > 0xFF)), (ADD_RESULT[i], ADD_DF[i]), f'{i:05X}')
+                    total = a + (~b & 0xFF) + carry
+                    self.assertEqual((total & 0xFF, int(total > 0xFF)), (SUB_RESULT[i], SUB_DF[i]), f'{i:05X}')
+        self.assertEqual((0x00, 1), (SUB_RESULT[CARRY_IN | 0x4242], SUB_DF[CARRY_IN | 0x4242]))  # no borrow
+        self.assertEqual((0xFF, 0), (SUB_RESULT[0x4242], SUB_DF[0x4242]))  # borrow in
+
+    def test_shift_tables(self):
+        self.assertEqual(2**9, len(SHL_RESULT))
+        for carry in range(2):
+            for d in range(256):
+                i = (carry << 8) | d
+                self.assertEqual((((d << 1) & 0xFE) | carry, (d >> 7) & 0x01), (SHL_RESULT[i], SHL_DF[i]))
+                self.assertEqual(((d >> 1) | (carry << 7), d & 0x01), (SHR_RESULT[i], SHR_DF[i]))
+        self.assertEqual({'ADD', 'SUB', 'SHL', 'SHR'}, {name.split('_')[0] for name in TABLES})
+
+    def test_engines_agree(self):
+        # SHL, SHLC, SHRC and SMI in a loop, compiled code should leave DF as the handlers do (a bit, not 0x80)
+        program = bytes([0xF8, 0xC3, 0xFE, 0x7E, 0x7E, 0x76, 0xFF, 0x01, 0xCA, 0x00, 0x02, 0x00])
+        expected, actual = CPU(), CPU()
+        for cpu in [expected, actual]:
+            cpu.load(0, program)
+            cpu.run()
+        jit = JIT(actual, threshold=1)
+        seen = set()
+        for _ in range(100):
+            expected.run_cycles(3)
+            jit.run_cycles(3)
+            for attr in ['D', 'DF', 'cycles', 'instructions']:
+                self.assertEqual(getattr(expected, attr), getattr(actual, attr), attr)
+            self.assertEqual(list(expected.R), list(actual.R))
+            seen.add(expected.DF)
+        self.assertEqual({0, 1}, seen)  # DF is a single bit
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import os
+import tempfile
+import unittest
+from functools import partial
+from unittest import mock
+import assembler
+from assembler import AssemblyError, assemble, assemble_file, symbolize
+from cpu import CPU
+from debugger import Debugger, Hit
+from profiler import Profiler
+from py1802 import run_headless
+
+PROGRAMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'programs')
+
+# counts R1 down from 5, accumulating it into M(DATA) and echoing it with OUT 4, then sets Q and idles
+SOURCE = """\
+; ACCUMULATE
+PORT    EQU 4
+DATA    EQU #40
+        LDI 5
+        PLO R1            ; R1 = COUNT
+        LDI A.0(DATA)
+        PLO 2
+        SEX 2
+LOOP:   GLO 1
+        ADD
+        STR 2
+        OUT PORT
+        DEC 2
+        DEC 1
+        GLO 1
+        LBNZ LOOP
+        SEQ
+        IDL
+        ORG DATA
+        DB 3
+        ORG #100
+TABLE:  DB 'HI', 0, -1, 'A'+1
+        DW TABLE, *+2
+"""
+
+
+class AssemblerTests(unittest.TestCase):
+    def test_listing_program(self):
+        # the mnemonic column of a listing should assemble to its opcode column
+        expected, source = bytearray(), []
+        with open(os.path.join(PROGRAMS, 'test_alu_ops.asm')) as source_file:
+            for line in source_file:
+                if line.startswith(';'): continue
+                tokens = line.split(None, 2)
+                expected += bytes.fromhex(tokens[1])
+                source.append(tokens[2])
+        image = assemble(''.join(source))
+        self.assertEqual([(0, bytes(expected))], image.segments)
+        self.assertEqual({'LOOP': 0x20, 'DOIT': 0x29}, image.symbols)
+        self.assertEqual('LOOP: BN4 *     ; WAIT FOR IT', image.listing[0x20])
+
+    def test_directives(self):
+        image = assemble(SOURCE)
+        self.assertEqual([(0x0000, bytes([0xF8, 0x05, 0xA1, 0xF8, 0x40, 0xA2, 0xE2, 0x81, 0xF4, 0x52, 0x64, 0x22,
+                                          0x21, 0x81, 0xCA, 0x00, 0x07, 0x7B, 0x00])),
+                          (0x0040, b'\x03'),
+                          (0x0100, b'HI\x00\xFFB\x01\x00\x01\x07')], image.segments)
+        self.assertEqual({'LOOP': 0x07, 'TABLE': 0x100}, image.symbols)
+        self.assertEqual({'PORT': 4, 'DATA': 0x40}, image.constants)
+        self.assertEqual('LOOP:   GLO 1', image.listing[0x07])
+
+        cpu = CPU()
+        image.load(cpu)
+        cpu.run()
+        cpu.run_cycles(1000, stop_on_idle=True)
+        self.assertEqual(0x12, cpu.M[0x40])  # 3 + 5 + 4 + 3 + 2 + 1
+        self.assertEqual(1, cpu.Q)
+
+    def test_errors(self):
+        for source, message in [('  LDI 5\n  FOO 1', 'Line 2: Unknown instruction: FOO'),
+                                ('  BR NOWHERE', 'Line 1: Undefined symbol: NOWHERE'),
+                                ('  ORG #FF\n  BR #00', 'Line 2: Short branch target 0000 is off page 01'),
+                                ('  LDN 0', "Line 1: LDN can't use R0"),
+                                ('X: IDL\nX: IDL', 'Line 2: Duplicate symbol: X'),
+                                ('  LDI 256', 'Line 1: Byte value out of range: 256'),
+                                ('  OUT 8', 'Line 1: Invalid port: 8'),
+                                ('  SEQ 1', 'Line 1: SEQ takes no operand'),
+                                ('  LBR 0', 'Line 1: Unknown instruction: LBR')]:  # not implemented by the CPU
+            with self.assertRaises(AssemblyError) as context: assemble(source)
+            self.assertEqual(message, context.exception.msg)
+
+        image = assemble('  ORG #FD\n  BR *+1\n  ORG #1FF\n  BR #200')
+        self.assertEqual([(0xFD, b'\x30\xFE'), (0x1FF, b'\x30\x00')], image.segments)  # the target byte's page
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path, cache = os.path.join(tmp, 'program.src'), os.path.join(tmp, 'cache')
+            with open(path, 'w') as source_file: source_file.write(SOURCE)
+            image = assemble_file(path, cache)
+            self.assertEqual(1, len(os.listdir(cache)))
+            with mock.patch.object(assembler, 'assemble', side_effect=AssertionError):
+                self.assertEqual(image, assemble_file(path, cache))  # cached image, without assembling
+
+            with open(path, 'a') as source_file: source_file.write('        DB 1\n')
+            self.assertNotEqual(image, assemble_file(path, cache))  # any change to the source is a new entry
+            self.assertEqual(2, len(os.listdir(cache)))
+
+    def test_symbols(self):
+        image = assemble(SOURCE)
+        self.assertEqual('LOOP', symbolize(0x07, image.symbols))
+        self.assertEqual('LOOP+3', symbolize(0x0A, image.symbols))
+        self.assertEqual('0003', symbolize(0x03, image.symbols))  # before any label
+
+        cpu = CPU()
+        image.load(cpu)
+        cpu.run()
+        debugger = Debugger(cpu, symbols=image.symbols)
+        debugger.add_breakpoint('LOOP')
+        debugger.run_cycles(1000)
+        self.assertEqual(Hit('break', 0x07, 0x07, 0x81), debugger.hit)
+        with self.assertRaises(ValueError): debugger.add_breakpoint('NOWHERE')
+
+        debugger.clear()
+        profiler = Profiler(cpu)
+        profiler.run_cycles(1000, stop_on_idle=True)
+        collapsed = profiler.collapsed(image.listing, 'acc', image.symbols).splitlines()
+        self.assertEqual('acc;LOOP;0007 LOOP: GLO 1 5', collapsed[0])
+
+    def test_headless_source(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'program.src')
+            with open(path, 'w') as source_file: source_file.write(SOURCE)
+            with mock.patch('loader.assemble_file', partial(assemble_file, cache_dir=os.path.join(tmp, 'cache'))):
+                result = run_headless(path, 1000, [(0x40, 0x41)], breakpoints=['TABLE', 0x11])
+        self.assertEqual({'kind': 'break', 'addr': 0x11, 'pc': 0x11, 'opcode': 0x7B}, result['hit'])
+        self.assertEqual('12', result['memory']['0040-0040'])
+
+
+if __name__ == '__main__':
+    unittest.main()
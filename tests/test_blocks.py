@@ -0,0 +1,70 @@
+import unittest
+from blocks import BlockCache
+from common_test_functions import COUNTING_PROGRAM, assert_same_state, make_cpu
+from states import Fetch
+
+
+class BlockCacheTests(unittest.TestCase):
+    # rewrites the immediate operand of its own LDI at 0x0001 with D+1 on every pass, so each pass must see
+    # the previous pass's store
+    self_modifying = [0xF8, 0x00, 0xFC, 0x01, 0xA3, 0xF8, 0x00, 0xB3, 0xF8, 0x01, 0xA4, 0x83, 0x54, 0x30, 0x00]
+
+    def test_matches_reference(self):
+        for program in [COUNTING_PROGRAM, self.self_modifying]:
+            for cycles in [1, 2, 5, 14, 15, 16, 33, 100, 257]:
+                expected = make_cpu(program)
+                for _ in range(cycles): expected.tick()
+
+                actual = make_cpu(program)
+                BlockCache(actual).run_cycles(cycles)
+                assert_same_state(self, expected, actual)  # cached blocks should match the Fetch/Execute path
+
+    def test_blocks_end_at_branches(self):
+        cpu = make_cpu()
+        cache = BlockCache(cpu)
+
+        block = cache.lookup(0x07)
+        self.assertEqual(0x11, block.end)  # block should end after LBNZ and its two operand bytes
+        self.assertEqual(8, len(block.ops))
+        self.assertEqual(17, block.cycles)  # seven two-cycle instructions and one three-cycle branch
+        self.assertIsNone(cache.lookup(0x12))  # IDL never starts a block
+
+    def test_self_modifying_code(self):
+        cpu = make_cpu(self.self_modifying)
+        cache = BlockCache(cpu)
+
+        cache.run_cycles(30 * 20)  # ten two-cycle instructions per pass
+        self.assertEqual(30, cpu.M[0x01])  # each pass should load the operand written by the previous one
+        self.assertIsInstance(cpu._state, Fetch)  # CPU should be in S0
+
+    def test_host_write_invalidates(self):
+        cpu = make_cpu()
+        cache = BlockCache(cpu)
+
+        block = cache.lookup(0x07)
+        cpu.load(0x0E, b'\xC2')  # LBNZ -> LBZ
+        self.assertFalse(block.valid)  # overlapping block should be dropped
+        self.assertEqual(0, len(cache))
+        self.assertIsNot(block, cache.lookup(0x07))  # and retranslated on next lookup
+        cache.close()
+        cpu.load(0x07, b'\x91')
+        self.assertEqual(0, len(cache))  # closed cache should no longer track writes
+
+    def test_writes_beside_code(self):
+        cpu = make_cpu()
+        cache = BlockCache(cpu)
+
+        outer, inner = cache.lookup(0x07), cache.lookup(0x0B)  # overlapping blocks, both ending at LBNZ
+        cpu.store(0x11, 0x7B)  # just past them, on the same page
+        self.assertTrue(outer.valid and inner.valid)  # data writes next to code shouldn't drop blocks
+        cpu.load(0x08, b'\xF4')
+        self.assertFalse(outer.valid)
+        self.assertTrue(inner.valid)
+        cpu.store(0x0C, 0x21)  # still covered by the inner block
+        self.assertFalse(inner.valid)
+        self.assertEqual(0, len(cache))
+        self.assertEqual(-1, cache._code.find(1))  # nothing left marked as code
+
+
+if __name__ == '__main__':
+    unittest.main()
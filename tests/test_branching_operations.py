@@ -13,7 +13,7 @@ class ShortBranchTests(unittest.TestCase):
         opcode = 0x30  # BR
         pc = 0x1234
         pc_reg = 0
-        payload = 0x5542
+        payload = 0x42
 
         cpu.P = pc_reg
         cpu.R[pc_reg] = pc
@@ -31,7 +31,7 @@ class ShortBranchTests(unittest.TestCase):
             opcode = 0x34 + ef - 1  # B1/B2/B3/B4
             pc = 0x1234
             pc_reg = 0
-            payload = 0x5542
+            payload = 0x42
             branch = True
 
             cpu.P = pc_reg
@@ -51,7 +51,7 @@ class ShortBranchTests(unittest.TestCase):
             opcode = 0x34 + ef - 1  # B1/B2/B3/B4
             pc = 0x1234
             pc_reg = 0
-            payload = 0x5542
+            payload = 0x42
             branch = False
 
             cpu.P = pc_reg
@@ -71,7 +71,7 @@ class ShortBranchTests(unittest.TestCase):
             opcode = 0x3C + ef - 1  # BN1/BN2/BN3/BN4
             pc = 0x1234
             pc_reg = 0
-            payload = 0x5542
+            payload = 0x42
             branch = True
 
             cpu.P = pc_reg
@@ -91,7 +91,7 @@ class ShortBranchTests(unittest.TestCase):
             opcode = 0x3C + ef - 1  # BN1/BN2/BN3/BN4
             pc = 0x1234
             pc_reg = 0
-            payload = 0x5542
+            payload = 0x42
             branch = False
 
             cpu.P = pc_reg
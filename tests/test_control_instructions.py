@@ -77,6 +77,84 @@ class ControlInstructionTests(unittest.TestCase):
         self.assertEqual(expected, cpu.Q)  # Q register should be reset
         self.assertIsInstance(cpu._state, Fetch)  # CPU should be in S0
 
+    def test_RET(self):
+        cpu = CPU()
+        cpu.run()
+
+        opcode = 0x70  # RET
+        reg = 2
+        mem_addr = 0x1234
+
+        cpu.X = reg
+        cpu.R[reg] = mem_addr
+        cpu.M[mem_addr] = 0x53
+        force_two_cycle_instruction(cpu, opcode)
+        self.assertEqual(5, cpu.X)  # X should be set to the high nibble of M(R(X))
+        self.assertEqual(3, cpu.P)  # P should be set to the low nibble of M(R(X))
+        self.assertEqual(mem_addr + 1, cpu.R[reg])  # R(X) should increment
+        self.assertEqual(1, cpu.IE)  # interrupts should be enabled
+        self.assertIsInstance(cpu._state, Fetch)  # CPU should be in S0
+
+    def test_DIS(self):
+        cpu = CPU()
+        cpu.run()
+
+        opcode = 0x71  # DIS
+        reg = 2
+        mem_addr = 0x1234
+
+        cpu.X = reg
+        cpu.R[reg] = mem_addr
+        cpu.M[mem_addr] = 0x53
+        force_two_cycle_instruction(cpu, opcode)
+        self.assertEqual(5, cpu.X)  # X should be set to the high nibble of M(R(X))
+        self.assertEqual(3, cpu.P)  # P should be set to the low nibble of M(R(X))
+        self.assertEqual(mem_addr + 1, cpu.R[reg])  # R(X) should increment
+        self.assertEqual(0, cpu.IE)  # interrupts should be disabled
+        self.assertIsInstance(cpu._state, Fetch)  # CPU should be in S0
+
+    def test_SAV(self):
+        cpu = CPU()
+        cpu.run()
+
+        opcode = 0x78  # SAV
+        reg = 2
+        mem_addr = 0x1234
+
+        cpu.X = reg
+        cpu.R[reg] = mem_addr
+        cpu.T = 0x53
+        force_two_cycle_instruction(cpu, opcode)
+        self.assertEqual(0x53, cpu.M[mem_addr])  # T should be stored at M(R(X))
+        self.assertEqual(mem_addr, cpu.R[reg])  # R(X) should not change
+        self.assertIsInstance(cpu._state, Fetch)  # CPU should be in S0
+
+    def test_MARK(self):
+        cpu = CPU()
+        cpu.run()
+
+        opcode = 0x79  # MARK
+        mem_addr = 0x1234
+
+        cpu.X, cpu.P = 5, 3
+        cpu.R[3] = 0x100
+        cpu.R[2] = mem_addr
+        force_two_cycle_instruction(cpu, opcode)
+        self.assertEqual(0x53, cpu.T)  # T should hold X and P
+        self.assertEqual(0x53, cpu.M[mem_addr])  # and be stored at M(R(2))
+        self.assertEqual(mem_addr - 1, cpu.R[2])  # R(2) should decrement
+        self.assertEqual(3, cpu.X)  # X should be set to P
+        self.assertEqual(3, cpu.P)  # P should not change
+        self.assertIsInstance(cpu._state, Fetch)  # CPU should be in S0
+
+    def test_invalid_instruction(self):
+        cpu = CPU()
+        cpu.run()
+
+        for opcode in [0x31, 0x38, 0x68, 0xC0, 0xCF]:
+            with self.assertRaises(NotImplementedError):
+                force_two_cycle_instruction(cpu, opcode)  # undefined opcodes should not execute
+
 
 if __name__ == '__main__':
     unittest.main()
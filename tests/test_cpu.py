@@ -1,7 +1,14 @@
+import ctypes
+import mmap
+import os
 import unittest
-from cpu import CPU
-from common_test_functions import force_three_cycle_instruction
-from states import Fetch
+try:
+    import resource
+except ImportError:    # not on Windows
+    resource = None
+from cpu import CPU, StopReason
+from common_test_functions import COUNT_ADDR, assert_same_state, force_three_cycle_instruction, make_cpu
+from states import Fetch, Execute, Pause
 
 
 class InternalTests(unittest.TestCase):
@@ -40,6 +47,35 @@ class InternalTests(unittest.TestCase):
         for _ in range(executions): cpu.decrement_register(reg)
         self.assertEqual(expected, cpu.R[reg])  # register value should roll over to 0xFFFF after zero
 
+    def test_load_dump(self):
+        cpu = CPU()
+
+        expected = bytes([0xF8, 0x29, 0xA6, 0xE0])
+        addr = 0xFFFC
+
+        cpu.load(addr, expected)
+        self.assertEqual(expected, cpu.dump(addr, addr + len(expected)))  # dump should return loaded bytes
+        self.assertEqual(0xA6, cpu.M[addr + 2])  # bytes should be visible through M
+        self.assertEqual(bytes(4), cpu.dump(addr - 4, addr))  # neighbouring memory should be untouched
+        with self.assertRaises(IndexError): cpu.load(addr, expected + b'\x00')  # load must fit in 64KB
+        with self.assertRaises(ValueError): cpu.M[0] = 0x100  # memory cells hold a single byte
+
+    def test_cycle_counters(self):
+        cpu = CPU()
+        cpu.run()
+
+        self.assertEqual(1, cpu.cycles)  # initialization cycle
+        force_three_cycle_instruction(cpu, 0xC4, 4)  # NOP
+        self.assertEqual(1 + 4 * 3, cpu.cycles)
+        self.assertEqual(4, cpu.instructions)
+        cpu.pause()
+        for _ in range(10): cpu.tick()
+        self.assertEqual(1 + 4 * 3, cpu.cycles)  # paused CPU shouldn't count cycles
+        cpu.run()  # resuming ticks S0 of the IDL at 0x0004
+        cpu.run_cycles(20)  # IDL repeats S1
+        self.assertEqual(1 + 4 * 3 + 1 + 20, cpu.cycles)
+        self.assertEqual(5, cpu.instructions)
+
     def test_set_external_flag(self):
         cpu = CPU()
 
@@ -48,5 +84,227 @@ class InternalTests(unittest.TestCase):
         self.assertEqual(1, cpu.get_external_flag(3))
 
 
+class StateMachineTests(unittest.TestCase):
+    def test_states_are_reused(self):
+        cpu = CPU()
+        cpu.run()
+
+        opcode = 0xC4  # NOP
+        fetch = cpu.get_state()
+
+        force_three_cycle_instruction(cpu, opcode, 3)
+        self.assertIs(fetch, cpu.get_state())  # transitions should reuse the preallocated Fetch state
+        cpu.tick()
+        self.assertIs(cpu.execute_state, cpu.get_state())  # as well as the preallocated Execute state
+
+    def test_pause_resumes_previous_state(self):
+        cpu = CPU()
+        cpu.run()
+
+        cpu.M[0] = 0xE5  # SEX
+        cpu.tick()  # fetch
+        cpu.pause()
+        self.assertIsInstance(cpu._state, Pause)  # CPU should be paused
+        self.assertIsInstance(cpu._state.prev_state, Execute)  # pause should remember S1
+        cpu.run()
+        self.assertIsInstance(cpu._state, Fetch)  # resumed S1 should complete and return to S0
+        self.assertEqual(5, cpu.X)  # instruction should have executed once resumed
+
+    def test_set_state_from_outside(self):
+        cpu = CPU()
+        cpu.run()
+
+        cpu.M[0x1234:0x1237] = bytes([0xC2, 0x12, 0x34])  # LBZ 1234
+        cpu.R[0] = 0x1235
+        cpu.I, cpu.N = 0xC, 0x2
+        cpu.set_state(Execute())
+        self.assertIs(cpu.execute_state, cpu.get_state())  # should stand for the CPU's own Execute state
+        cpu.tick()
+        cpu.tick()
+        self.assertEqual(0x1234, cpu.R[0])  # LBZ should take its second execute cycle and branch
+        self.assertIs(cpu.fetch_state, cpu.get_state())
+
+        cpu.set_state(Pause(prev_state=Fetch()))
+        self.assertIs(cpu.pause_state, cpu.get_state())
+        cpu.run()
+        self.assertIs(cpu.execute_state, cpu.get_state())  # resumed the CPU's own Fetch, which fetched LBZ
+
+
+class BatchExecutionTests(unittest.TestCase):
+    def test_run_cycles(self):
+        for cycles in [1, 2, 3, 10, 31, 64, 100]:
+            expected = make_cpu()
+            for _ in range(cycles): expected.tick()
+
+            actual = make_cpu()
+            self.assertEqual(cycles, actual.run_cycles(cycles))
+            assert_same_state(self, expected, actual)  # batch run should match repeated ticks
+
+    def test_run_until_idle(self):
+        cpu = make_cpu()
+
+        self.assertEqual(StopReason.IDLE, cpu.run_until(max_cycles=1000))
+        self.assertEqual(1, cpu.Q)  # program should have run to completion
+        self.assertEqual(0x12, cpu.M[COUNT_ADDR])  # 3 + 5 + 4 + 3 + 2 + 1
+        self.assertEqual(0x13, cpu.R[0])  # PC should point past IDL
+
+    def test_run_until_breakpoint(self):
+        cpu = make_cpu()
+
+        self.assertEqual(StopReason.BREAKPOINT, cpu.run_until(breakpoints={0x0D}))
+        self.assertEqual(4, cpu.R[1])  # first pass through the loop
+        self.assertIsInstance(cpu._state, Fetch)  # CPU should stop before fetching
+        self.assertEqual(StopReason.BREAKPOINT, cpu.run_until(breakpoints={0x0D}))
+        self.assertEqual(3, cpu.R[1])  # resuming should not stop at the same address again
+
+    def test_run_until_predicate(self):
+        cpu = make_cpu()
+
+        self.assertEqual(StopReason.PREDICATE, cpu.run_until(lambda c: c.R[1] == 2))
+        self.assertEqual(0x0D, cpu.R[0])  # should stop at the instruction following DEC 1
+        self.assertEqual(StopReason.MAX_CYCLES, cpu.run_until(lambda c: False, max_cycles=7))
+
+
+class SnapshotTests(unittest.TestCase):
+    def test_snapshot_restore(self):
+        for compress in [False, True]:
+            expected = make_cpu()
+            expected.run_until(max_cycles=45)
+            blob = expected.snapshot(compress)
+            expected.run_until(max_cycles=1000)
+
+            actual = CPU()
+            actual.restore(blob)
+            actual.run_until(max_cycles=1000)
+            assert_same_state(self, expected, actual)  # restored CPU should continue exactly like the original
+
+    def test_snapshot_in_place(self):
+        cpu = make_cpu()
+        M, R = cpu.M, cpu.R
+        pc, cycles = cpu.R[0], cpu.cycles
+        blob = cpu.snapshot()
+        cpu.run_until(max_cycles=1000)
+        cpu.restore(blob)
+
+        self.assertIs(M, cpu.M)  # memory should be restored into the existing view
+        self.assertIs(R, cpu.R)  # as should the registers
+        self.assertEqual(0x03, cpu.M[COUNT_ADDR])
+        self.assertEqual((pc, cycles), (cpu.R[0], cpu.cycles))  # back at the start of the program
+
+    def test_snapshot_pause(self):
+        cpu = make_cpu()
+        cpu.run_cycles(1)  # stop in S1 of LDI
+        cpu.pause()
+        blob = cpu.snapshot()
+
+        restored = CPU()
+        restored.restore(blob)
+        self.assertIs(restored.pause_state, restored.get_state())  # should be paused
+        self.assertIs(restored.execute_state, restored.pause_state.prev_state)  # remembering its own S1
+        restored.run()
+        self.assertEqual(0x05, restored.D)  # resumed LDI should complete
+
+    def test_snapshot_invalidates_blocks(self):
+        cpu = make_cpu()
+        written = []
+        cpu.add_write_hook(lambda start, end: written.append((start, end)))
+        cpu.restore(cpu.snapshot())
+        self.assertEqual([(0, 2**16)], written)  # write hooks should see the whole image change
+
+    def test_restore_rejects_bad_blobs(self):
+        cpu = CPU()
+        blob = cpu.snapshot()
+
+        with self.assertRaises(ValueError): cpu.restore(blob[:20])  # truncated header
+        with self.assertRaises(ValueError): cpu.restore(blob[:-1])  # truncated memory
+        with self.assertRaises(ValueError): cpu.restore(b'XXXX' + blob[4:])  # wrong magic
+        with self.assertRaises(ValueError): cpu.restore(blob[:4] + b'\x63' + blob[5:])  # unknown version
+
+
+class ForkTests(unittest.TestCase):
+    def test_fork_runs_like_parent(self):
+        parent = make_cpu()
+        parent.run_until(max_cycles=45)
+        child = parent.fork()
+
+        self.assertEqual(parent.dump(), child.dump())  # child should start from the parent's memory
+        self.assertIs(child.execute_state if parent.get_state() is parent.execute_state else child.fetch_state,
+                      child.get_state())  # child should use its own state instances
+        parent.run_until(max_cycles=1000)
+        child.run_until(max_cycles=1000)
+        assert_same_state(self, parent, child)
+
+    def test_fork_copy_on_write(self):
+        parent = make_cpu()
+        child = parent.fork()
+        sibling = parent.fork()
+        self.assertIs(child._image, sibling._image)  # forks of an unchanged CPU should map the same image
+
+        child.store(COUNT_ADDR, 0x99)
+        self.assertEqual(0x99, child.M[COUNT_ADDR])
+        self.assertEqual(0x03, parent.M[COUNT_ADDR])  # other CPUs shouldn't see the write
+        self.assertEqual(0x03, sibling.M[COUNT_ADDR])
+
+        parent.M[COUNT_ADDR] = 0x42  # nor a write that bypasses store()
+        self.assertEqual(0x03, sibling.M[COUNT_ADDR])
+        late = parent.fork()
+        self.assertIsNot(sibling._image, late._image)  # the image is retaken once the parent has changed
+        self.assertEqual(0x42, late.M[COUNT_ADDR])
+        self.assertEqual(0x99, child.fork().M[COUNT_ADDR])  # and forks of forks see their own writes
+
+    @unittest.skipUnless(os.path.exists('/proc/self/smaps'), "needs /proc/self/smaps")
+    def test_fork_copies_one_page(self):
+        def private_dirty(cpu: CPU) -> int:
+            # bytes of cpu's memory mapping the OS has copied for it
+            addr = ctypes.addressof(ctypes.c_char.from_buffer(cpu._memory))
+            with open('/proc/self/smaps') as smaps:
+                lines = smaps.read().splitlines()
+            for i, line in enumerate(lines):
+                start, _, end = line.partition(' ')[0].partition('-')
+                if end and int(start, 16) <= addr < int(end, 16):
+                    for field in lines[i + 1:]:
+                        if field.startswith('Private_Dirty:'): return int(field.split()[1]) * 1024
+            raise LookupError("mapping not found")
+
+        parent = make_cpu()
+        child = parent.fork()
+        self.assertEqual(0, private_dirty(child))  # a fork shouldn't copy memory
+        child.store(0x1234, 0x99)
+        child.store(0x1235, 0x98)
+        self.assertEqual(mmap.PAGESIZE, private_dirty(child))  # writing should copy just the page written
+
+    @unittest.skipUnless(resource, "needs the resource module")
+    def test_fork_past_fd_limit(self):
+        # search and fuzzing keep many forks alive, more than the process may have file descriptors
+        parent = make_cpu()
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (64, hard))
+        try:
+            children = [parent.fork() for _ in range(200)]
+        finally:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+        for i, child in enumerate(children):
+            child.store(COUNT_ADDR, i)
+        self.assertEqual(list(range(200)), [child.M[COUNT_ADDR] for child in children])
+        self.assertEqual(0x03, parent.M[COUNT_ADDR])
+
+        with parent.fork() as child:
+            child.run_until(max_cycles=1000)
+        with self.assertRaises(ValueError): child.M[0]  # closed forks have released their memory
+        parent.run_until(max_cycles=1000)  # while the parent's is untouched
+
+    def test_fork_keeps_pause(self):
+        parent = make_cpu()
+        parent.run_cycles(1)  # stop in S1 of LDI
+        parent.pause()
+        child = parent.fork()
+
+        self.assertIs(child.pause_state, child.get_state())
+        self.assertIs(child.execute_state, child.pause_state.prev_state)
+        child.run()
+        self.assertEqual(0x05, child.D)  # resumed LDI should complete in the child only
+        self.assertEqual(0x00, parent.D)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,69 @@
+import os
+import unittest
+from common_test_functions import make_cpu
+from debugger import Debugger, Hit
+from jit import JIT
+from py1802 import run_headless
+
+PROGRAMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'programs')
+
+
+class DebuggerTests(unittest.TestCase):
+    def test_breakpoint(self):
+        cpu = make_cpu()
+        debugger = Debugger(cpu)
+        debugger.add_breakpoint(0x0D)
+
+        cycles = debugger.run_cycles(1000)
+        self.assertEqual(Hit('break', 0x0D, 0x0D, 0x81), debugger.hit)  # GLO 1 after the first DEC 1
+        self.assertEqual(cpu.cycles - 1, cycles)  # every cycle but initialization, none for the stopped fetch
+        self.assertIs(cpu.fetch_state, cpu.get_state())
+        self.assertEqual(4, cpu.R[1])
+        debugger.run_cycles(1000)
+        self.assertEqual(3, cpu.R[1])  # resuming should run the instruction it stopped at
+        debugger.remove_breakpoint(0x0D)
+        debugger.run_cycles(1000, stop_on_idle=True)
+        self.assertIsNone(debugger.hit)
+        self.assertEqual(1, cpu.Q)  # ran to completion
+
+    def test_watchpoints(self):
+        cpu = make_cpu()
+        debugger = Debugger(cpu)
+        debugger.add_watchpoint(0x40, 0x41, 'write')
+
+        debugger.run_cycles(1000)
+        self.assertEqual(Hit('write', 0x40, 0x09, 0x52), debugger.hit)  # STR 2
+        self.assertEqual(0x03, cpu.M[0x40])  # stopped before the write
+        debugger.remove_watchpoint(0x40, 0x41, 'write')
+        debugger.add_watchpoint(0x3F, 0x42, 'read')
+        debugger.run_cycles(1000)
+        self.assertEqual(Hit('read', 0x40, 0x0A, 0x64), debugger.hit)  # OUT 4
+        self.assertEqual(0x08, cpu.M[0x40])
+
+        debugger.clear()
+        debugger.add_watchpoint(0x40, 0x41, 'access')
+        debugger.run_cycles(1000)
+        self.assertEqual(Hit('read', 0x40, 0x08, 0xF4), debugger.hit)  # ADD in the second pass
+
+    def test_unarmed_uses_engine(self):
+        expected = make_cpu()
+        expected.run_cycles(1000, stop_on_idle=True)
+
+        cpu = make_cpu()
+        jit = JIT(cpu)
+        debugger = Debugger(cpu, jit)
+        debugger.add_breakpoint(0x20)
+        debugger.remove_breakpoint(0x20)
+        self.assertFalse(debugger.armed())
+        self.assertEqual(expected.cycles - 1, debugger.run_cycles(1000, stop_on_idle=True))
+        self.assertGreater(len(jit), 0)  # plain runs should go through the wrapped engine
+        self.assertEqual(expected.dump(), cpu.dump())
+
+    def test_headless_breakpoint(self):
+        result = run_headless(os.path.join(PROGRAMS, 'test_alu_ops.asm'), 1000, [], breakpoints=[0x09])
+        self.assertEqual({'kind': 'break', 'addr': 0x09, 'pc': 0x09, 'opcode': 0x3F}, result['hit'])
+        self.assertEqual(14, result['cycles'])  # seven two-cycle instructions before BN4
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import unittest
+from assembler import assemble
+from cpu import CPU
+from disassembler import Instruction, decode, disassemble, listing
+from instructions import CYCLES, DISPATCH, _invalid
+from loader import load_listing
+from opcodes import OPCODES, SHORT
+
+PROGRAMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'programs')
+
+
+class DisassemblerTests(unittest.TestCase):
+    def test_table(self):
+        # the table and what the CPU runs should never drift apart
+        for opcode, entry in enumerate(OPCODES):
+            self.assertEqual(not entry.mnemonic, DISPATCH[opcode] is _invalid, f'{opcode:02X}')
+            self.assertEqual(entry.cycles, CYCLES[opcode])
+
+    def test_every_opcode(self):
+        # each implemented opcode should disassemble to source assembling back to the same bytes
+        M = bytearray(2**16)
+        for opcode, entry in enumerate(OPCODES):
+            if not entry.mnemonic: continue
+            addr = 0x1234
+            M[addr:addr + 3] = bytes([opcode, 0x12, 0x56])
+            instruction = decode(M, addr)
+            self.assertEqual(entry.length, len(instruction.data))
+            image = assemble(f'  ORG #{addr:04X}\n  {instruction.text}')
+            self.assertEqual([(addr, instruction.data)], image.segments, instruction.text)
+
+    def test_program(self):
+        cpu = CPU()
+        with open(os.path.join(PROGRAMS, 'test_alu_ops.asm')) as source_file: load_listing(source_file, cpu)
+        symbols = {'LOOP': 0x20, 'DOIT': 0x29}
+        text = listing(cpu.M, 0x00, 0x35, symbols)
+        lines = text.splitlines()
+        self.assertEqual('0000 90         GHI 0', lines[0])
+        self.assertEqual('0002 F829       LDI #29', lines[2])  # immediate bytes aren't taken for addresses
+        self.assertIn('0009 3F09       BN4 *', lines)
+        self.assertIn('0020 3F20 LOOP: BN4 *', lines)
+        self.assertIn('0029 C4   DOIT: NOP', lines)
+        self.assertIn('002F CA0020     LBNZ LOOP', lines)
+        self.assertEqual('0033 3020       BR LOOP', lines[-1])
+
+        copy = CPU()
+        load_listing(text.splitlines(keepends=True), copy)  # the listing loads back as it was
+        self.assertEqual(cpu.M[:0x35], copy.M[:0x35])
+        image = assemble(''.join(line.split(None, 2)[2] + '\n' for line in lines))
+        self.assertEqual(bytes(cpu.M[:0x35]), image.segments[0][1])  # and so does its mnemonic column
+
+    def test_operands(self):
+        M = bytearray(2**16)
+        M[0x10:0x15] = bytes([0x31, 0x69, 0xD3, 0xEC, 0x7C])
+        self.assertEqual(['DB #31', 'INP 1', 'SEP 3', 'SEX RC', 'ADCI #00'],
+                         [instruction.text for instruction in disassemble(M, 0x10, 0x15)])
+        M[0xFF:0x101] = bytes([0x30, 0x05])
+        self.assertEqual(Instruction(0xFF, b'\x30\x05', 'BR #0105'), decode(M, 0xFF))  # the target byte's page
+        M[0xFFFF], M[0] = 0x3F, 0xFF
+        self.assertEqual(Instruction(0xFFFF, b'\x3F\xFF', 'BN4 #00FF'), decode(M, 0xFFFF))  # wraps around memory
+        self.assertEqual(SHORT, OPCODES[0x3F].operand)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import io
+import unittest
+from cpu import CPU
+from display import StatusRenderer, column
+
+
+class StatusRendererTests(unittest.TestCase):
+    def test_redraws_only_changed_fields(self):
+        cpu = CPU()
+        stream = io.StringIO()
+        display = StatusRenderer(stream)
+
+        display.render(cpu, force=True)
+        self.assertIn('DATA: 0x00', stream.getvalue())  # first frame draws every field
+        self.assertIn('EF1-4: 0000', stream.getvalue())
+
+        stream.truncate(0)
+        stream.seek(0)
+        display.render(cpu, force=True)
+        self.assertEqual('', stream.getvalue())  # nothing changed, nothing written
+
+        cpu.Q = 1
+        display.render(cpu, force=True)
+        self.assertEqual(column(14) + 'Q: 1', stream.getvalue())  # only the Q field is rewritten
+
+    def test_frame_rate(self):
+        cpu = CPU()
+        display = StatusRenderer(io.StringIO(), fps=0.001)
+
+        self.assertTrue(display.render(cpu))
+        self.assertFalse(display.render(cpu))  # next frame isn't due yet
+        self.assertTrue(display.render(cpu, force=True))
+
+    def test_header_forces_full_redraw(self):
+        cpu = CPU()
+        stream = io.StringIO()
+        display = StatusRenderer(stream)
+
+        display.render(cpu, force=True)
+        display.header('prog.asm', truncate=True)
+        display.render(cpu, force=True)
+        self.assertEqual(2, stream.getvalue().count('DATA: 0x00'))  # status line redrawn below new header
+        self.assertNotIn('<Esc>', stream.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from py1802 import main_headless, run_headless
+
+PROGRAMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'programs')
+
+
+class HeadlessTests(unittest.TestCase):
+    def test_engines_agree(self):
+        path = os.path.join(PROGRAMS, 'test_alu_ops.asm')
+
+        results = [run_headless(path, 5000, [(0x0, 0x40)], engine) for engine in ['reference', 'blocks', 'jit']]
+        for result in results:
+            self.assertEqual(5000, result['cycles'])  # program waits on EF4 forever
+            self.assertFalse(result['idle'])
+            self.assertEqual(results[0]['registers'], result['registers'])  # every engine should agree
+            self.assertEqual(results[0]['memory'], result['memory'])
+        self.assertEqual('90B6F829A6E06400', results[0]['memory']['0000-003F'][:16])
+
+    def test_stops_on_idle(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'idle.asm')
+            with open(path, 'w') as source_file:
+                source_file.write('; SET Q AND IDLE\n0000 F805 LDI 5\n0002 7B   SEQ\n0003 00   IDL\n')
+            dump = os.path.join(tmp, 'state.json')
+
+            main_headless([path, path], 1000, [], 'jit', dump_state=dump, jobs=2)
+            with open(dump) as dump_file:
+                results = json.load(dump_file)
+        self.assertEqual(2, len(results))  # one result per program
+        for result in results:
+            self.assertEqual(6, result['cycles'])  # three two-cycle instructions
+            self.assertTrue(result['idle'])
+            self.assertEqual(5, result['registers']['D'])
+            self.assertEqual(1, result['registers']['Q'])
+
+    def test_unknown_label(self):
+        path = os.path.join(PROGRAMS, 'test_alu_ops.asm')
+        script = os.path.join(PROGRAMS, '..', 'py1802.py')
+
+        result = subprocess.run([sys.executable, script, '--headless', '--break', 'NOPE', path],
+                                capture_output=True, text=True)
+        self.assertEqual(1, result.returncode)  # reported like a load error
+        self.assertEqual('Error: Unknown symbol: NOPE\n', result.stderr)  # without a traceback
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,11 @@
+import io
+import os
+import tempfile
 import unittest
 from cpu import CPU
 from common_test_functions import force_two_cycle_instruction, force_three_cycle_instruction
+from devices import FileDevice, QueueDevice, StreamDevice
+from jit import JIT
 from states import Fetch
 
 
@@ -60,5 +65,67 @@ class InputOutputByteTransferTests(unittest.TestCase):
         self.assertEqual(0, cpu.N0)  # N0 should be reset
 
 
+class DeviceTests(unittest.TestCase):
+    # echoes bytes from port 1 to port 2 through M(R(1)) until it reads a zero, then sets Q and idles
+    program = [0xE1, 0xF8, 0x80, 0xA1, 0x69, 0xC2, 0x00, 0x0B, 0x62, 0x30, 0x04, 0x7B, 0x00]
+
+    def test_OUT_INP(self):
+        cpu = CPU()
+        cpu.run()
+        device = QueueDevice(b'\x2A')
+        cpu.attach_device(3, device)
+
+        cpu.X = 4
+        cpu.R[4] = 0x1234
+        force_two_cycle_instruction(cpu, 0x6B)  # INP 3
+        self.assertEqual(0x2A, cpu.BUS)  # byte read from the device should be on the bus
+        self.assertEqual(0x2A, cpu.M[0x1234])
+        force_two_cycle_instruction(cpu, 0x63)  # OUT 3
+        self.assertEqual(b'\x2A', device.take())  # and written back to it
+        force_two_cycle_instruction(cpu, 0x6B)
+        self.assertEqual(0, cpu.D)  # empty queue reads as 0
+        force_two_cycle_instruction(cpu, 0x64)  # OUT 4
+        self.assertEqual(b'', device.take())  # other ports shouldn't reach the device
+
+        self.assertIs(device, cpu.detach_device(3))
+        with self.assertRaises(IndexError): cpu.attach_device(0, device)  # ports are 1-7
+
+    def test_engines(self):
+        for engine in [lambda cpu: cpu, JIT]:
+            cpu = CPU()
+            cpu.load(0, bytes(self.program))
+            cpu.attach_device(1, QueueDevice(b'hello\x00'))
+            cpu.attach_device(2, output := QueueDevice())
+            cpu.run()
+            engine(cpu).run_cycles(1000, stop_on_idle=True)
+            self.assertEqual(b'hello', output.take())  # each byte read should be echoed once
+            self.assertEqual(1, cpu.Q)
+
+    def test_stream_devices(self):
+        output = io.BytesIO()
+        device = StreamDevice(io.BytesIO(b'ab'), output, buffer_size=2, eof=0xFF)
+        self.assertEqual([0x61, 0x62, 0xFF], [device.read() for _ in range(3)])  # eof once input runs out
+        device.write(1)
+        self.assertEqual(b'', output.getvalue())  # writes are buffered
+        device.write(2)
+        self.assertEqual(b'\x01\x02', output.getvalue())
+        device.write(3)
+        device.close()
+        self.assertEqual(b'\x01\x02\x03', output.getvalue())
+
+        with tempfile.TemporaryDirectory() as tmp:
+            source, sink = os.path.join(tmp, 'in.bin'), os.path.join(tmp, 'out.bin')
+            with open(source, 'wb') as source_file: source_file.write(b'file\x00')
+            cpu = CPU()
+            cpu.load(0, bytes(self.program))
+            cpu.attach_device(1, reader := FileDevice(input_path=source))
+            cpu.attach_device(2, writer := FileDevice(output_path=sink))
+            cpu.run()
+            cpu.run_cycles(1000, stop_on_idle=True)
+            reader.close()
+            writer.close()
+            with open(sink, 'rb') as sink_file: self.assertEqual(b'file', sink_file.read())
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,77 @@
+import random
+import unittest
+from common_test_functions import assert_same_state, make_cpu
+from instructions import DISPATCH, _invalid
+from jit import JIT
+
+
+class JITTests(unittest.TestCase):
+    def test_matches_reference(self):
+        for cycles in [1, 2, 17, 40, 100, 257]:
+            expected = make_cpu()
+            expected.run_cycles(cycles)
+
+            actual = make_cpu()
+            JIT(actual, threshold=1).run_cycles(cycles)
+            assert_same_state(self, expected, actual)  # compiled blocks should match the Fetch/Execute path
+
+    def test_random_programs(self):
+        # random valid opcodes, so programs branch, switch P/X, do I/O and overwrite their own code
+        rng = random.Random(1802)
+        valid = [opcode for opcode in range(0x100) if DISPATCH[opcode] is not _invalid and opcode != 0x00]
+        for _ in range(40):
+            program = bytes(rng.choice(valid) for _ in range(0x200))
+            flags = [rng.randint(0, 1) for _ in range(4)]
+            expected = make_cpu(program)
+            actual = make_cpu(program)
+            jit = JIT(actual, threshold=2)
+            for cpu in [expected, actual]:
+                cpu.EF[:] = flags
+                cpu.BUS = 0x5A
+
+            for cycles in [50, 500, 2000]:
+                try:
+                    expected.run_cycles(cycles)
+                except NotImplementedError:
+                    # program overwrote itself with an invalid opcode, both engines should stop on it
+                    self.assertRaises(NotImplementedError, jit.run_cycles, cycles)
+                    assert_same_state(self, expected, actual)
+                    break
+                jit.run_cycles(cycles)
+                assert_same_state(self, expected, actual)
+
+    def test_hot_blocks_are_compiled(self):
+        cpu = make_cpu()
+        jit = JIT(cpu, threshold=3)
+
+        jit.run_cycles(200)
+        block = jit.lookup(0x07)
+        self.assertIsNotNone(block.compiled)  # loop body should be compiled once hot
+        self.assertIn((0 << 4) | 2, block.compiled)  # specialized for P=0, X=2
+        self.assertIsNone(jit.lookup(0x00).compiled)  # setup code only ran once
+
+    def test_invalidated_block_falls_back(self):
+        cpu = make_cpu()
+        jit = JIT(cpu, threshold=1)
+
+        jit.run_cycles(100)
+        block = jit.lookup(0x07)
+        self.assertIsNotNone(block.compiled)
+        cpu.load(0x08, b'\xF7')  # ADD -> SM
+        self.assertFalse(block.valid)  # compiled code should be dropped with its block
+        self.assertIsNone(jit.lookup(0x07).compiled)
+
+
+    def test_stores_notify_hooks(self):
+        # compiled stores skip CPU.store() only while the JIT's own hook is the only one
+        cpu = make_cpu()
+        jit = JIT(cpu, threshold=1)
+        writes = []
+        cpu.add_write_hook(lambda start, end: writes.append(start))
+        jit.run_cycles(1000, stop_on_idle=True)
+        self.assertEqual([0x40] * 5, writes)  # STR 2 on each pass
+        self.assertEqual(0x12, cpu.M[0x40])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import random
+import unittest
+from common_test_functions import make_cpu
+from instructions import CYCLES, DISPATCH, _invalid
+from journal import Journal
+
+
+class JournalTests(unittest.TestCase):
+    def run_recording(self, journal: Journal, instructions: int) -> list[bytes]:
+        # snapshot before every instruction, stopping early at IDL
+        cpu = journal.cpu
+        snapshots = []
+        for _ in range(instructions):
+            if cpu.is_idle(): break
+            snapshots.append(cpu.snapshot())
+            journal.run_cycles(CYCLES[cpu.M[cpu.R[cpu.P]]])
+        return snapshots
+
+    def test_step_back(self):
+        cpu = make_cpu()
+        journal = Journal(cpu)
+        snapshots = self.run_recording(journal, 40)
+
+        for expected in reversed(snapshots):
+            self.assertEqual(1, journal.step_back())
+            self.assertEqual(expected, cpu.snapshot())  # each step should undo exactly one instruction
+        self.assertEqual(0, journal.step_back())  # nothing left to undo
+
+    def test_step_back_mid_instruction(self):
+        cpu = make_cpu()
+        journal = Journal(cpu)
+        journal.run_cycles(4)
+        expected = cpu.snapshot()
+        journal.run_cycles(1)  # S0 of LDI 0x40
+
+        self.assertEqual(1, journal.step_back())
+        self.assertEqual(expected, cpu.snapshot())  # partly executed instruction should be undone
+
+    def test_back_to_write(self):
+        cpu = make_cpu()
+        journal = Journal(cpu)
+        journal.run_cycles(1000)
+
+        self.assertTrue(journal.back_to_write(0x40))
+        self.assertEqual(0x52, cpu.M[cpu.R[cpu.P]])  # should stop before the last STR 2
+        self.assertEqual(1, cpu.R[1])  # in the last pass through the loop
+        self.assertEqual(0x11, cpu.M[0x40])  # with the old value back in memory
+        self.assertFalse(journal.back_to_write(0x41))  # never written
+
+    def test_ring_is_bounded(self):
+        cpu = make_cpu()
+        journal = Journal(cpu, size=8)
+        snapshots = self.run_recording(journal, 20)
+
+        self.assertEqual(8, len(journal))
+        self.assertEqual(8, journal.step_back(100))  # only the newest instructions are kept
+        self.assertEqual(snapshots[-8], cpu.snapshot())
+
+    def test_host_write_clears(self):
+        cpu = make_cpu()
+        journal = Journal(cpu)
+        journal.run_cycles(20)
+
+        cpu.load(0x40, b'\x00')
+        self.assertEqual(0, len(journal))  # host writes can't be undone
+        journal.run_cycles(4)
+        cpu.run_cycles(2)
+        journal.run_cycles(2)
+        self.assertEqual(1, len(journal))  # nor can instructions run outside the journal
+
+    def test_random_programs(self):
+        rng = random.Random(1802)
+        valid = [opcode for opcode in range(0x100) if DISPATCH[opcode] is not _invalid and opcode != 0x00]
+        for _ in range(20):
+            program = bytes(rng.choice(valid) for _ in range(0x200))
+            cpu = make_cpu(program)
+            cpu.EF[:] = [rng.randint(0, 1) for _ in range(4)]
+            journal = Journal(cpu)
+            try:
+                snapshots = self.run_recording(journal, 300)
+            except NotImplementedError:
+                continue  # program overwrote itself with an invalid opcode
+
+            self.assertEqual(len(snapshots), journal.step_back(len(snapshots)))
+            self.assertEqual(snapshots[0], cpu.snapshot())  # undoing everything should return to the start
+
+
+if __name__ == '__main__':
+    unittest.main()
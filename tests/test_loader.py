@@ -0,0 +1,106 @@
+import os
+import random
+import tempfile
+import time
+import unittest
+from cpu import CPU
+from loader import LoadError, load_binary, load_intel_hex, load_listing, load_program
+
+PROGRAMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'programs')
+
+# LDI 5, PLO 1, SEQ, IDL at 0000 and two bytes at 0040
+HEX = """\
+:0600000000F805A17B00E1
+:02004000ABCD46
+:00000001FF
+"""
+
+
+def count_loads(cpu: CPU) -> list[tuple[int, int]]:
+    # record each [start, end) written to memory
+    loads = []
+    cpu.add_write_hook(lambda start, end: loads.append((start, end)))
+    return loads
+
+
+class LoaderTests(unittest.TestCase):
+    def test_binary(self):
+        image = bytes(random.Random(1802).randrange(256) for _ in range(2**16))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'image.bin')
+            with open(path, 'wb') as image_file: image_file.write(image)
+            cpu = CPU()
+            loads = count_loads(cpu)
+            start = time.perf_counter()
+            self.assertEqual(2**16, load_binary(path, cpu))
+            elapsed = time.perf_counter() - start
+            self.assertEqual(image, bytes(cpu.M))
+            self.assertEqual([(0, 2**16)], loads)  # one slice assignment
+            self.assertLess(elapsed, 0.05)  # about a millisecond, generously bounded for slow machines
+
+            with self.assertRaises(LoadError): load_binary(path, CPU(), 1)  # would run past the end of memory
+            self.assertEqual({}, load_program(path, CPU()))
+
+    def test_intel_hex(self):
+        cpu = CPU()
+        loads = count_loads(cpu)
+        load_intel_hex(HEX.splitlines(), cpu)
+        self.assertEqual(bytes([0x00, 0xF8, 0x05, 0xA1, 0x7B, 0x00]), bytes(cpu.M[:6]))
+        self.assertEqual(bytes([0xAB, 0xCD]), bytes(cpu.M[0x40:0x42]))
+        self.assertEqual([(0, 6), (0x40, 0x42)], loads)
+
+        cpu = CPU()
+        load_intel_hex([':0400000500000000F7'] + HEX.splitlines()[:1] + [':00000001FF', ':0100060001F8'], cpu)
+        self.assertEqual(0, cpu.M[6])  # the start address is ignored and nothing after EOF is loaded
+
+    def test_intel_hex_errors(self):
+        for lines, message in [([':0600000000F805A17B00E2'], 'Line 1: Checksum mismatch'),
+                               (['', ':0600000000F805A17B'], 'Line 2: Invalid record length'),
+                               (['0600000000F805A17B00E1'], "Line 1: Intel HEX records start with ':'"),
+                               ([':06000000G0F805A17B00E1'], 'Line 1: Invalid hex digits'),
+                               ([':020000040001F9'], "Line 1: Addresses above 64 KB aren't supported"),
+                               ([':00000006FA'], 'Line 1: Unknown record type 06'),
+                               ([':02FFFF00ABCD88'], 'Line 1: 2 bytes at FFFF run past the end of memory')]:
+            with self.assertRaises(LoadError) as context: load_intel_hex(lines, CPU())
+            self.assertEqual(message, context.exception.msg)
+
+    def test_listing(self):
+        cpu, listing = CPU(), {}
+        loads = count_loads(cpu)
+        with open(os.path.join(PROGRAMS, 'test_alu_ops.asm')) as source_file:
+            load_listing(source_file, cpu, listing)
+        self.assertEqual(1, len(loads))  # the program is contiguous, so it is loaded at once
+        self.assertEqual(0x90, cpu.M[0])
+        self.assertEqual('LOOP: BN4 *     ; WAIT FOR IT', listing[0x20])
+
+        cpu = CPU()
+        loads = count_loads(cpu)
+        load_listing(['0000 F805\n', '; COMMENT\n', '0002 A1\n', '\n', '0010 7B00 SEQ\n'], cpu)
+        self.assertEqual([(0, 3), (0x10, 0x12)], loads)
+
+    def test_listing_errors(self):
+        for lines, message in [(['0000 F805', '0002'],
+                                'Line 2: Lines must contain at least memory address and opcode.'),
+                               (['0000 F805', '; X', 'ZZZZ 7B'], 'Line 3: Invalid syntax: ZZZZ 7B'),
+                               (['0000 F8G5'], 'Line 1: Invalid syntax: 0000 F8G5'),
+                               (['10000 7B'], 'Line 1: Address out of range: 10000'),
+                               (['FFFF F805'], 'Line 1: 2 bytes at FFFF run past the end of memory')]:
+            with self.assertRaises(LoadError) as context: load_listing(lines, CPU())
+            self.assertEqual(message, context.exception.msg)
+
+    def test_load_program(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'program.txt')
+            with open(path, 'w') as hex_file: hex_file.write(HEX)
+            cpu = CPU()
+            self.assertEqual({}, load_program(path, cpu))  # Intel HEX told apart by its leading ':'
+            self.assertEqual(0xAB, cpu.M[0x40])
+
+            cpu, listing = CPU(), {}
+            self.assertEqual({}, load_program(os.path.join(PROGRAMS, 'test_alu_ops.asm'), cpu, listing))
+            self.assertEqual(0x90, cpu.M[0])
+            self.assertIn(0x20, listing)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import random
+import unittest
+from blocks import BlockCache
+from common_test_functions import make_cpu
+from cpu import CPU
+from instructions import DISPATCH, _invalid
+from jit import JIT
+from lockstep import Lockstep, StateMachine
+from py1802 import check_headless
+
+PROGRAMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'programs')
+
+
+class Glitch:
+    # CPU.run_cycles, but flips a bit of memory once `at` cycles have run
+    def __init__(self, cpu: CPU, at: int = 101, addr: int = 0x80) -> None:
+        self.cpu = cpu
+        self.at = at
+        self.addr = addr
+
+    def run_cycles(self, n: int, stop_on_idle: bool = False) -> int:
+        cpu = self.cpu
+        if not cpu.cycles < self.at <= cpu.cycles + n: return cpu.run_cycles(n)
+        ran = cpu.run_cycles(self.at - cpu.cycles)
+        cpu.M[self.addr] ^= 0x01
+        return ran + cpu.run_cycles(n - ran)
+
+
+class LockstepTests(unittest.TestCase):
+    def test_state_machine(self):
+        # the reference is the plain state machine, which CPU.run_cycles() inlines
+        expected, actual = make_cpu(), make_cpu()
+        expected.run_cycles(1000)
+        self.assertEqual(1000, StateMachine(actual).run_cycles(1000))
+        self.assertEqual(expected.snapshot(), actual.snapshot())
+        self.assertEqual(99, StateMachine(make_cpu()).run_cycles(1000, stop_on_idle=True))
+
+    def test_engines_match(self):
+        for engine in [lambda cpu: cpu, BlockCache, JIT]:
+            for interval in [1, 7, 1000]:
+                lockstep = Lockstep(make_cpu, engine, interval=interval)
+                cycles = lockstep.run_cycles(1000, stop_on_idle=True)
+                self.assertIn(cycles, [98, 99])  # IDL executed, or fetched as an interval ended
+                self.assertTrue(lockstep.expected.is_idle())
+                self.assertIsNone(lockstep.divergence)
+                self.assertEqual(0x12, lockstep.actual.M[0x40])
+
+    def test_random_programs(self):
+        rng = random.Random(1802)
+        valid = [opcode for opcode in range(0x100) if DISPATCH[opcode] is not _invalid and opcode != 0x00]
+        for _ in range(10):
+            program = bytes(rng.choice(valid) for _ in range(0x200))
+            lockstep = Lockstep(lambda: make_cpu(program), lambda cpu: JIT(cpu, threshold=2), interval=97)
+            try:
+                lockstep.run_cycles(3000)
+            except NotImplementedError:
+                pass    # the program overwrote itself with an invalid opcode, on both engines alike
+            self.assertIsNone(lockstep.divergence)
+
+    def test_divergence(self):
+        lockstep = Lockstep(make_cpu, Glitch, interval=32)
+        self.assertEqual(66, lockstep.run_cycles(1000))  # the first interval matched, up to the 32nd fetch
+        divergence = lockstep.divergence
+        self.assertEqual(101, divergence.cycle)  # bisected to the glitch
+        self.assertEqual(47, divergence.instruction)
+        self.assertEqual(0x12, divergence.pc)  # IDL
+        self.assertEqual({'M[0080]': (0, 1)}, divergence.differences)
+        lines = divergence.context.splitlines()
+        self.assertEqual('  0011 7B         SEQ', lines[7])
+        self.assertEqual('> 0012 00         IDL', lines[8])
+        self.assertIn('M[0080]: reference 0, engine 1', str(divergence))
+
+        lockstep = Lockstep(make_cpu, lambda cpu: Glitch(cpu, 30, 0x40), symbols={'LOOP': 0x07})
+        lockstep.run_cycles(1000)
+        self.assertEqual(30, lockstep.divergence.cycle)  # found within a single interval
+        self.assertIn('  000E CA0007     LBNZ LOOP', lockstep.divergence.context)
+
+    def test_errors(self):
+        program = bytes([0xF8, 0x05, 0x31])
+        with self.assertRaises(NotImplementedError):  # both engines stop on the invalid opcode
+            Lockstep(lambda: make_cpu(program), JIT).run_cycles(100)
+
+        class Broken:
+            def __init__(self, cpu: CPU) -> None:
+                self.cpu = cpu
+
+            def run_cycles(self, n: int, stop_on_idle: bool = False) -> int:
+                if self.cpu.cycles + n > 10: raise RuntimeError("broken")
+                return self.cpu.run_cycles(n)
+
+        lockstep = Lockstep(make_cpu, Broken)
+        lockstep.run_cycles(100)
+        self.assertEqual(11, lockstep.divergence.cycle)
+        self.assertEqual((None, 'RuntimeError: broken'), lockstep.divergence.differences['error'])
+
+    def test_headless(self):
+        result = check_headless(os.path.join(PROGRAMS, 'test_alu_ops.asm'), 20_000, 'jit', 1000)
+        self.assertEqual(20_000, result['cycles'])
+        self.assertIsNone(result['divergence'])
+
+
+if __name__ == '__main__':
+    unittest.main()
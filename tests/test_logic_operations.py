@@ -230,9 +230,9 @@ class LogicOperationTests(unittest.TestCase):
         cpu.run()
 
         expected_val = 0b10100010
-        expected_carry = 0
+        expected_carry = 1
         opcode = 0xFE  # SHL
-        operand = 0b01010001
+        operand = 0b11010001
 
         cpu.D = operand
         force_two_cycle_instruction(cpu, opcode)
@@ -0,0 +1,66 @@
+import unittest
+from pacing import ClockPacer
+
+
+class FakeTime:
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.slept = 0.0
+
+    def clock(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.slept += seconds
+        self.now += seconds
+
+
+class FakeRunner:
+    # takes `cost` host seconds per emulated cycle
+    def __init__(self, time: FakeTime, cost: float) -> None:
+        self.time = time
+        self.cost = cost
+
+    def run_cycles(self, n: int, stop_on_idle: bool = False) -> int:
+        self.time.now += n * self.cost
+        return n
+
+
+class ClockPacerTests(unittest.TestCase):
+    def test_paces_to_target_rate(self):
+        time = FakeTime()
+        pacer = ClockPacer(1_760_000, 8, clock=time.clock, sleep=time.sleep)
+        runner = FakeRunner(time, 1e-7)  # host is 45x faster than the emulated clock
+
+        self.assertEqual(2200, pacer.batch_cycles)  # 10ms of 220k cycles/s
+        self.assertEqual(220_000, pacer.run(runner, 220_000))
+        self.assertAlmostEqual(1.0, time.now)  # one emulated second should take one host second
+        self.assertAlmostEqual(1.0, pacer.report()['ratio'])
+        self.assertEqual(0, pacer.slips)
+
+    def test_no_drift_from_oversleeping(self):
+        time = FakeTime()
+        pacer = ClockPacer(1_760_000, 8, clock=time.clock, sleep=lambda s: time.sleep(s + 0.001))
+        runner = FakeRunner(time, 1e-7)
+
+        pacer.run(runner, 220_000)
+        self.assertLess(time.now, 1.002)  # each oversleep is absorbed by the next batch
+
+    def test_slow_host_degrades(self):
+        time = FakeTime()
+        pacer = ClockPacer(1_760_000, 8, clock=time.clock, sleep=time.sleep)
+        slow = FakeRunner(time, 1 / 110_000)  # host only manages half the emulated clock
+
+        pacer.run(slow, 220_000)
+        self.assertGreater(pacer.slips, 0)  # falling behind should drop the timeline
+        self.assertAlmostEqual(0.5, pacer.report()['ratio'], places=2)
+
+        start = time.now
+        fast = FakeRunner(time, 1e-7)
+        pacer.run(fast, 44_000)  # 200ms of emulated time
+        # at most max_lag of backlog may be made up, the rest of the missed time shouldn't turn into a burst
+        self.assertGreaterEqual(time.now - start, 0.2 - pacer.max_lag)
+
+
+if __name__ == '__main__':
+    unittest.main()
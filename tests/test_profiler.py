@@ -0,0 +1,68 @@
+import os
+import unittest
+from common_test_functions import make_cpu
+from cpu import CPU
+from profiler import Profiler
+from py1802 import load_mem, run_headless
+
+PROGRAMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'programs')
+
+
+class ProfilerTests(unittest.TestCase):
+    def test_counts(self):
+        expected = make_cpu()
+        expected.run_cycles(1000, stop_on_idle=True)
+
+        cpu = make_cpu()
+        profiler = Profiler(cpu)
+        for _ in range(10): profiler.run_cycles(7)  # stop mid-instruction now and then
+        profiler.run_cycles(1000, stop_on_idle=True)
+
+        self.assertEqual(expected.dump(), cpu.dump())  # profiling shouldn't change execution
+        self.assertEqual(expected.cycles, cpu.cycles)
+        self.assertEqual(1, profiler.counts[0x00])
+        self.assertEqual(5, profiler.counts[0x07])  # loop body runs once per count
+        self.assertEqual(5, profiler.opcode_counts[0xCA])
+        self.assertEqual(15, profiler.opcode_cycles[0xCA])  # LBNZ takes three cycles
+        self.assertEqual(cpu.instructions, sum(profiler.opcode_counts))
+        self.assertEqual(cpu.cycles - 1, sum(profiler.opcode_cycles))  # every cycle but initialization
+        self.assertEqual({(0x0E, 0x07): 4}, profiler.loops)  # LBNZ back to the loop start
+        self.assertEqual([(0x07, 0x0E, 4, 5 * 8)], profiler.hot_loops())  # eight instructions per pass
+        self.assertEqual((0x07, 5), profiler.hot_addresses(1)[0])
+
+    def test_loops_need_branches(self):
+        # SEP 3 calls a subroutine below the caller and SEP 0 returns from it, a BR there closes the only loop
+        cpu = make_cpu(bytes([0xF8, 0x0A, 0xA3, 0xD3, 0xD3, 0x7B, 0x00, 0x00, 0x00, 0x00, 0xD0, 0x30, 0x0A]))
+        profiler = Profiler(cpu)
+        profiler.run_cycles(1000, stop_on_idle=True)
+
+        self.assertEqual(1, cpu.Q)
+        self.assertEqual({(0x0B, 0x0A): 1}, profiler.loops)  # returns to lower addresses aren't loops
+
+    def test_report(self):
+        cpu = CPU()
+        listing = {}
+        with open(os.path.join(PROGRAMS, 'test_alu_ops.asm')) as source_file:
+            load_mem(source_file, cpu, listing)
+        cpu.run()
+        profiler = Profiler(cpu)
+        profiler.run_cycles(1000)
+
+        self.assertEqual('BN4 *     ; WAIT FOR IT', listing[0x09])
+        report = profiler.report(listing)
+        self.assertIn('  0009          493   98.6%  BN4 *     ; WAIT FOR IT', report)  # hottest address
+        self.assertIn('  0009-0009          492           493   98.6%  BN4 *', report)  # spin loop
+        self.assertIn('  3F  BN4           493          986', report)  # opcodes by mnemonic
+        collapsed = profiler.collapsed(listing, 'alu').splitlines()
+        self.assertEqual('alu;(start);0009 BN4 * 493', collapsed[-1])
+        self.assertEqual(8, len(collapsed))  # one line per address executed
+
+    def test_headless_profile(self):
+        result = run_headless(os.path.join(PROGRAMS, 'test_alu_ops.asm'), 1000, [], profile=True)
+        self.assertEqual('profile', result['engine'])
+        self.assertIn('Hot loops', result['profile']['report'])
+        self.assertTrue(result['profile']['collapsed'].startswith('test_alu_ops.asm;(start);0000 GHI 0 1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
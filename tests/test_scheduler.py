@@ -0,0 +1,193 @@
+import unittest
+from blocks import BlockCache
+from cpu import CPU
+from devices import QueueDevice
+from jit import JIT
+from scheduler import Scheduler, dma_in, dma_out, interrupt, set_flag, toggle_flag
+
+
+class SchedulerTests(unittest.TestCase):
+    # sets up R1 = 0x0040 (interrupt handler) and R2 = 0x00FF (stack), idles, then sets Q and idles again.
+    # The handler saves T, counts interrupts in R5 and returns with interrupts enabled.
+    program = [0xF8, 0x40, 0xA1, 0xF8, 0xFF, 0xA2, 0x00, 0x7B, 0x00]
+    handler = [0x78, 0x22, 0x15, 0x12, 0x70]
+    # moves the program counter to R3 and R0 to 0x0080, then spins in BN4 * until EF4 is set, then sets Q and idles
+    dma_program = [0xF8, 0x04, 0xA3, 0xD3, 0xF8, 0x80, 0xA0, 0x3F, 0x07, 0x7B, 0x00]
+
+    def make_cpu(self, program: list[int]) -> CPU:
+        cpu = CPU()
+        cpu.load(0, bytes(program))
+        cpu.load(0x40, bytes(self.handler))
+        cpu.run()
+        return cpu
+
+    def test_events_in_order(self):
+        cpu = self.make_cpu(self.dma_program)
+        scheduler = Scheduler(cpu)
+        fired = []
+        scheduler.at(30, lambda cpu: fired.append(('b', cpu.cycles)))
+        scheduler.at(10, lambda cpu: fired.append(('a', cpu.cycles)))
+        scheduler.at(30, lambda cpu: fired.append(('c', cpu.cycles)))
+        self.assertEqual(10, scheduler.next_due())
+        self.assertEqual(3, len(scheduler))
+
+        self.assertEqual(100, scheduler.run_cycles(100))
+        self.assertEqual([('a', 10), ('b', 30), ('c', 30)], fired)  # each at its cycle, ties in scheduling order
+        self.assertEqual(0, len(scheduler))
+        self.assertEqual(101, cpu.cycles)  # initialization plus the cycles run
+
+    def test_interrupt_entry(self):
+        cpu = self.make_cpu(self.dma_program)
+        scheduler = Scheduler(cpu)
+        scheduler.run_cycles(20)
+        while cpu.get_state() is not cpu.fetch_state: scheduler.run_cycles(1)
+        cycles, instructions = cpu.cycles, cpu.instructions
+
+        scheduler.after(0, interrupt())
+        self.assertEqual(1, scheduler.run_cycles(1))
+        self.assertEqual(0x03, cpu.T)  # X and P of the interrupted program
+        self.assertEqual(1, cpu.P)  # interrupt cycle should switch to R(1) as the program counter
+        self.assertEqual(2, cpu.X)  # and R(2) as the stack pointer
+        self.assertEqual(0, cpu.IE)  # with further interrupts disabled
+        self.assertEqual(cycles + 1, cpu.cycles)  # taking one machine cycle
+        self.assertEqual(instructions, cpu.instructions)  # in place of a fetch
+
+    def test_interrupt_wakes_idle(self):
+        cpu = self.make_cpu(self.program)
+        scheduler = Scheduler(cpu)
+        scheduler.at(100, interrupt())
+        scheduler.at(110, interrupt(0))
+        scheduler.run_cycles(1000, stop_on_idle=True)
+        self.assertEqual(1, cpu.R[5])  # handler should run once
+        self.assertEqual(1, cpu.Q)  # and return to the instruction after IDL
+        self.assertEqual(0x100, cpu.R[2])  # with the stack balanced
+        self.assertEqual(1, cpu.IE)
+        self.assertTrue(cpu.is_idle())
+
+        cpu = self.make_cpu(self.program)
+        cpu.IE = 0
+        scheduler = Scheduler(cpu)
+        scheduler.at(100, interrupt())
+        scheduler.run_cycles(1000)
+        self.assertEqual(0, cpu.R[5])  # disabled interrupts shouldn't be taken
+        self.assertEqual(0, cpu.Q)  # or wake IDL
+
+    def test_dma(self):
+        cpu = self.make_cpu(self.dma_program)
+        cpu.dma_device = QueueDevice(b'abc')
+        scheduler = Scheduler(cpu)
+        scheduler.at(100, dma_in(3))
+        scheduler.run_cycles(200)
+        self.assertEqual(b'abc', bytes(cpu.M[0x80:0x83]))  # DMA-in should store at M(R(0))
+        self.assertEqual(0x83, cpu.R[0])  # incrementing R(0)
+        self.assertEqual(0, cpu.DMA_IN)
+
+        cpu.R[0] = 0x80
+        cpu.dma_device = device = QueueDevice()
+        scheduler.after(10, dma_out(2))
+        scheduler.run_cycles(100)
+        self.assertEqual(b'ab', device.take())  # DMA-out should read from M(R(0))
+        self.assertEqual(0x82, cpu.R[0])
+
+    def test_dma_cycles(self):
+        # DMA cycles are stolen from the program: it should be exactly that many cycles behind
+        reference = self.make_cpu(self.dma_program)
+        reference.run_cycles(300)
+        cpu = self.make_cpu(self.dma_program)
+        scheduler = Scheduler(cpu)
+        scheduler.at(101, dma_out(4))
+        scheduler.run_cycles(300)
+        self.assertEqual(reference.cycles, cpu.cycles)
+        self.assertEqual(reference.instructions - 2, cpu.instructions)  # two BN4 instructions fewer
+
+    def test_flag_events(self):
+        cpu = self.make_cpu(self.dma_program)
+        scheduler = Scheduler(cpu)
+        scheduler.at(200, set_flag(4, 1))
+        cycles = scheduler.run_cycles(1000, stop_on_idle=True)
+        self.assertEqual(1, cpu.Q)  # loop should end once EF4 is set
+        self.assertTrue(200 < cycles < 210)  # and not before
+
+        scheduler.at(cpu.cycles + 5, toggle_flag(4))
+        scheduler.run_cycles(10)
+        self.assertEqual(0, cpu.EF[3])
+
+    def test_engines(self):
+        # every engine should end in the same state as the reference with the same events
+        snapshots = []
+        for engine in [lambda cpu: cpu, BlockCache, JIT]:
+            cpu = self.make_cpu(self.dma_program)
+            cpu.dma_device = QueueDevice(range(1, 100))
+            scheduler = Scheduler(cpu, engine(cpu))
+            for cycle in range(50, 1000, 97): scheduler.at(cycle, dma_in(2))
+            scheduler.at(700, dma_out(5))
+            scheduler.at(900, set_flag(4, 1))
+            scheduler.run_cycles(1200)
+            snapshots.append(cpu.snapshot())
+        self.assertEqual(snapshots[0], snapshots[1])
+        self.assertEqual(snapshots[0], snapshots[2])
+
+
+class FastForwardTests(unittest.TestCase):
+    # B4 * at 0x10, LBZ * at 0x20 (spins while D is 0), IDL at 0x30, entered from 0x00 with EF4 set
+    program = {0x00: [0x30, 0x10], 0x10: [0x37, 0x10, 0xF8, 0x00, 0x30, 0x20], 0x20: [0xC2, 0x00, 0x20],
+               0x30: [0x00]}
+
+    def make_cpu(self) -> CPU:
+        cpu = CPU()
+        for addr, code in self.program.items(): cpu.load(addr, bytes(code))
+        cpu.EF[3] = 1
+        cpu.run()
+        return cpu
+
+    def naive(self, cycles: int) -> bytes:
+        cpu = self.make_cpu()
+        for _ in range(cycles): cpu.tick()
+        return cpu.snapshot()
+
+    def test_waiting(self):
+        cpu = self.make_cpu()
+        cpu.run_cycles(2)
+        self.assertTrue(cpu.waiting())  # taken B4 to itself
+        cpu.EF[3] = 0
+        self.assertFalse(cpu.waiting())  # not taken once EF4 drops
+        cpu.EF[3] = 1
+        cpu.INT = cpu.IE = 1
+        self.assertFalse(cpu.waiting())  # or with a request raised
+
+    def test_exact_cycles(self):
+        # fast-forwarded runs should match ticking every cycle for any batch length
+        for engine in [lambda cpu: cpu, BlockCache, JIT]:
+            for cycles in [1, 2, 3, 7, 100, 1001]:
+                cpu = self.make_cpu()
+                runner = engine(cpu)
+                for _ in range(3): runner.run_cycles(cycles)
+                self.assertEqual(self.naive(3 * cycles), cpu.snapshot(), (engine, cycles))
+
+    def test_events(self):
+        # leaving each wait on an event: EF4 cleared ends B4 *, then an interrupt-free LBZ * spins until the end
+        for engine in [lambda cpu: cpu, BlockCache, JIT]:
+            cpu = self.make_cpu()
+            scheduler = Scheduler(cpu, engine(cpu))
+            scheduler.at(10_001, set_flag(4, 0))
+            self.assertEqual(10**9, scheduler.run_cycles(10**9))  # fast enough to run a billion cycles
+            reference = self.make_cpu()
+            for _ in range(10_000): reference.tick()
+            reference.EF[3] = 0
+            for _ in range(100): reference.tick()
+            self.assertEqual(0x20, cpu.R[0])  # spinning in LBZ *
+            self.assertEqual(reference.cycles + 10**9 - 10_100, cpu.cycles)
+            iterations = (10**9 - 10_100) // 3
+            self.assertEqual(reference.instructions + iterations, cpu.instructions)
+
+    def test_idle(self):
+        cpu = self.make_cpu()
+        cpu.M[0x21] = 0x30  # LBZ 0x0030
+        cpu.EF[3] = 0
+        self.assertEqual(10**9, cpu.run_cycles(10**9))
+        self.assertTrue(cpu.is_idle())
+        self.assertEqual(10**9 + 1, cpu.cycles)  # initialization plus the cycles run
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import tempfile
+import threading
+import unittest
+from blocks import BlockCache
+from cpu import CPU
+from jit import JIT
+from py1802 import emulate, run_headless
+from scheduler import Scheduler
+from stimuli import BUS, FLAG, RESET, Stimulus, StimulusRecorder, read_stimuli, replay
+
+PROGRAMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'programs')
+
+
+class StimuliTests(unittest.TestCase):
+    # counts EF4 pulses in R5: waits in BN4 * for EF4 to be set, then in B4 * for it to clear
+    program = [0x3F, 0x00, 0x15, 0x37, 0x03, 0x30, 0x00]
+
+    def make_cpu(self) -> CPU:
+        cpu = CPU()
+        cpu.load(0, bytes(self.program))
+        cpu.run()
+        return cpu
+
+    def record(self, path: str) -> CPU:
+        # a session with stimuli arriving from another thread between batches of uneven length
+        cpu = self.make_cpu()
+        with StimulusRecorder(cpu, path=path) as recorder:
+            for batch in [7, 100, 33, 2, 1, 450, 19]:
+                for id in [4, 4, 4, 4]:
+                    thread = threading.Thread(target=recorder.toggle_flag, args=(id,))
+                    thread.start()
+                    thread.join()
+                    recorder.run_cycles(batch)
+                recorder.write_bus(batch & 0xFF)
+            recorder.reset()
+            recorder.run_cycles(1000)
+            recorder.toggle_flag(4)
+            recorder.run_cycles(50)
+        return cpu
+
+    def test_record(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'session.stim')
+            cpu = self.record(path)
+            stimuli = list(read_stimuli(path))
+            size = os.path.getsize(path)
+
+        self.assertEqual(8 + 10 * len(stimuli), size)  # header and ten bytes per stimulus
+        self.assertEqual(12, cpu.R[5])  # pulses lasting a batch of one or two cycles are too short to count
+        self.assertEqual([Stimulus(1, FLAG, 4), Stimulus(8, FLAG, 4), Stimulus(15, FLAG, 4), Stimulus(22, FLAG, 4),
+                          Stimulus(29, BUS, 7)], stimuli[:5])  # each applied as the next batch started
+        self.assertEqual([Stimulus(2449, BUS, 19), Stimulus(2449, RESET, 0), Stimulus(3450, FLAG, 4)],
+                         stimuli[-3:])  # a reset's Init cycle runs right away
+        self.assertEqual(3500, cpu.cycles)
+
+    def test_replay(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'session.stim')
+            recorded = self.record(path)
+            for engine in [lambda cpu: cpu, BlockCache, JIT]:
+                cpu = self.make_cpu()
+                scheduler = Scheduler(cpu, engine(cpu))
+                self.assertEqual(37, replay(path, scheduler))
+                scheduler.run_cycles(recorded.cycles - cpu.cycles - 1)  # less the Init cycle of the reset
+                self.assertEqual(recorded.snapshot(), cpu.snapshot())  # replays should be bit-identical
+
+    def test_headless_replay(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'session.stim')
+            self.record(path)
+            results = [run_headless(os.path.join(PROGRAMS, 'test_alu_ops.asm'), 20_000, [(0x0, 0x40)], engine,
+                                    replay_path=path) for engine in ['reference', 'blocks', 'jit']]
+        for result in results:
+            self.assertEqual(results[0]['registers'], result['registers'])
+            self.assertEqual(results[0]['memory'], result['memory'])
+
+    def test_paused_input(self):
+        # a flag toggled while the interactive mode is paused should show right away, and replay on the same cycle
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'session.stim')
+            cpu = self.make_cpu()
+            flag_toggled = threading.Event()
+            with StimulusRecorder(cpu, path=path) as recorder:
+                emulate(cpu, recorder, 100, 0.01, flag_toggled)
+                cpu.pause()
+                recorder.toggle_flag(4)
+                flag_toggled.set()
+                emulate(cpu, recorder, 100, 0.01, flag_toggled)
+                self.assertEqual([0, 0, 0, 1], cpu.EF)  # applied without resuming
+                self.assertEqual(101, cpu.cycles)
+                self.assertFalse(flag_toggled.is_set())
+                cpu.run()
+                emulate(cpu, recorder, 100, 0.01, flag_toggled)
+            self.assertEqual(1, cpu.R[5])  # the pulse counter saw the flag
+            self.assertEqual([Stimulus(101, FLAG, 4)], list(read_stimuli(path)))
+
+    def test_bad_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'session.stim')
+            with open(path, 'wb') as stimuli_file: stimuli_file.write(b'1802TRC\x01')
+            with self.assertRaises(ValueError): list(read_stimuli(path))
+            with open(path, 'wb') as stimuli_file: stimuli_file.write(b'1802STM\x01' + bytes(11))
+            with self.assertRaises(ValueError): list(read_stimuli(path))  # truncated record
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+from common_test_functions import make_cpu
+from cpu import CPU
+from py1802 import run_headless
+from tracer import TraceRecorder, read_trace
+
+PROGRAMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'programs')
+
+
+class TracerTests(unittest.TestCase):
+    def test_trace_program(self):
+        for compression in ['zlib', 'lzma']:
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, 'program.trace')
+                expected = make_cpu()
+                expected.run_cycles(1000, stop_on_idle=True)
+
+                cpu = make_cpu()
+                with TraceRecorder(cpu, path, compression, buffer_records=4) as recorder:
+                    for _ in range(10): recorder.run_cycles(7)  # stop mid-instruction now and then
+                    recorder.run_cycles(1000, stop_on_idle=True)
+                records = list(read_trace(path))
+
+            self.assertEqual(expected.dump(), cpu.dump())  # tracing shouldn't change execution
+            self.assertEqual(expected.cycles, cpu.cycles)
+            self.assertEqual(cpu.instructions, len(records))  # one record per instruction
+            self.assertEqual((1, 0x0000, 0xF8, 0, 0, 0, 0, -1, 0), records[0])  # LDI 5 after the init cycle
+            self.assertEqual((3, 0x0002, 0xA1, 5), records[1][:4])
+            self.assertEqual(['LDI', 'PLO'], [record.mnemonic for record in records[:2]])
+            stores = [record for record in records if record.opcode == 0x52]
+            self.assertEqual([(0x40, 0x08), (0x40, 0x0C), (0x40, 0x0F), (0x40, 0x11), (0x40, 0x12)],
+                             [(record.write_addr, record.write_value) for record in stores])  # STR 2 effects
+            self.assertEqual(0x00, records[-1].opcode)  # ends on IDL
+
+    def test_dma_writes(self):
+        # STR 2 then DMA-in cycles, the DMA stores shouldn't show up as (or in place of) the STR's
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'dma.trace')
+            cpu = CPU()
+            cpu.load(0, bytes([0xF8, 0x40, 0xA2, 0xF8, 0x5A, 0x52, 0xC4, 0xC4, 0x00]))
+            cpu.run()
+            cpu.P, cpu.R[0] = 3, 0x80   # R0 is the DMA pointer
+            with TraceRecorder(cpu, path, buffer_records=4) as recorder:
+                cpu.DMA_IN = 2
+                recorder.run_cycles(1)  # a DMA-in cycle before any record
+                recorder.run_cycles(9)  # the other DMA-in cycle, LDI, PLO, LDI, STR
+                cpu.DMA_IN = 2
+                recorder.run_cycles(100, stop_on_idle=True)
+            records = list(read_trace(path))
+        self.assertEqual(0x5A, cpu.M[0x40])
+        self.assertEqual(4, cpu.R[0] - 0x80)  # all four DMA-in cycles ran
+        self.assertEqual([0xF8, 0xA2, 0xF8, 0x52, 0xC4, 0xC4, 0x00], [record.opcode for record in records])
+        self.assertEqual((0x40, 0x5A), (records[3].write_addr, records[3].write_value))
+        self.assertEqual([-1] * 6, [record.write_addr for record in records if record.opcode != 0x52])
+
+    def test_headless_trace(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'alu.trace.xz')
+            result = run_headless(os.path.join(PROGRAMS, 'test_alu_ops.asm'), 5000, [], trace=path)
+            records = list(read_trace(path))
+        self.assertEqual('trace', result['engine'])
+        self.assertEqual(result['instructions'], len(records))
+        self.assertEqual(list(range(1, 5000, 2)), [record.cycle for record in records])  # two-cycle instructions only
+
+
+if __name__ == '__main__':
+    unittest.main()
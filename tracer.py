@@ -0,0 +1,189 @@
+from __future__ import annotations
+import gzip
+import lzma
+import queue
+import struct
+import threading
+import zlib
+from instructions import DISPATCH
+from opcodes import OPCODES
+from typing import BinaryIO, Iterator, NamedTuple, Optional, TYPE_CHECKING
+if TYPE_CHECKING:
+    from cpu import CPU
+
+
+TRACE_MAGIC = b'1802TRC'
+TRACE_VERSION = 1
+RECORD = struct.Struct('<QHBBBBBiB')     # see TraceRecord
+RECORD_WRITE = struct.Struct('<iB')      # trailing write_addr, write_value of a RECORD
+RECORD_WRITE_OFFSET = RECORD.size - RECORD_WRITE.size
+BUFFER_RECORDS = 2**14                  # records per buffer handed to the writer thread
+BUFFERS = 4                             # buffers in flight, emulation only waits on the writer when all are full
+COMPRESSORS = {
+    'zlib': lambda: zlib.compressobj(1, zlib.DEFLATED, 31),    # gzip container, readable with gzip.open
+    'lzma': lambda: lzma.LZMACompressor(preset=0),               # xz container, readable with lzma.open
+}
+
+
+class TraceRecord(NamedTuple):
+    cycle: int          # CPU.cycles when the instruction was fetched
+    pc: int
+    opcode: int
+    D: int              # D, DF, X and P as the instruction starts
+    DF: int
+    X: int
+    P: int
+    write_addr: int     # memory stored to by the instruction, -1 for none
+    write_value: int
+
+    @property
+    def mnemonic(self) -> str:
+        # Mnemonic of the opcode, '?' for one the CPU doesn't implement. Operand bytes aren't recorded.
+        return OPCODES[self.opcode].mnemonic or '?'
+
+
+class TraceRecorder:
+    # Execution engine that appends a TraceRecord per instruction to preallocated buffers. Full buffers are
+    # compressed and written to path by a background thread, so the emulation loop never waits on the file unless
+    # the writer falls BUFFERS buffers behind. close() (or leaving a with block) flushes the rest of the trace.
+    def __init__(self, cpu: CPU, path: str, compression: str = 'zlib', buffer_records: int = BUFFER_RECORDS) -> None:
+        self.cpu = cpu
+        self.path = path
+        self.records = 0
+        self._file: BinaryIO = open(path, 'wb')
+        self._compressor = COMPRESSORS[compression]()
+        self._free: queue.Queue[bytearray] = queue.Queue()
+        for _ in range(BUFFERS): self._free.put(bytearray(RECORD.size * buffer_records))
+        self._full: queue.Queue[Optional[tuple[bytearray, int]]] = queue.Queue()
+        self._error: Optional[BaseException] = None
+        self._writer = threading.Thread(target=self._write_buffers, name=f'trace {path}', daemon=True)
+        self._writer.start()
+
+        self._buffer = self._free.get()
+        self._buffer[:len(TRACE_MAGIC) + 1] = TRACE_MAGIC + bytes([TRACE_VERSION])
+        self._pos = len(TRACE_MAGIC) + 1
+        self._written = -1      # address stored to by the current instruction, its value is read once it's done
+        cpu.add_write_hook(self._on_write)
+
+    def __enter__(self) -> TraceRecorder:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._file.closed: return
+        self.cpu.remove_write_hook(self._on_write)
+        self._full.put((self._buffer, self._pos))
+        self._full.put(None)
+        self._writer.join()
+        self._file.close()
+        if self._error is not None: raise self._error
+
+    def _write_buffers(self) -> None:
+        # writer thread: compress and write full buffers in order, then recycle them. After an error buffers are
+        # still recycled so emulation doesn't wait forever, and the error is raised by the next run_cycles().
+        while (item := self._full.get()) is not None:
+            buffer, length = item
+            if self._error is None:
+                try:
+                    self._file.write(self._compressor.compress(memoryview(buffer)[:length]))
+                except Exception as e:
+                    self._error = e
+            self._free.put(buffer)
+        if self._error is None:
+            try:
+                self._file.write(self._compressor.flush())
+            except Exception as e:
+                self._error = e
+
+    def _on_write(self, start: int, end: int) -> None:
+        self._written = start
+
+    def _finish_write(self) -> None:
+        # fill in the memory effect of the latest record, if the buffer holds one (the first buffer starts with a
+        # header shorter than a record)
+        if self._pos >= RECORD.size:
+            RECORD_WRITE.pack_into(self._buffer, self._pos - RECORD.size + RECORD_WRITE_OFFSET,
+                                   self._written, self.cpu.M[self._written])
+        self._written = -1
+
+    def run_cycles(self, n: int, stop_on_idle: bool = False) -> int:
+        # Equivalent to CPU.run_cycles(n), recording each instruction fetched. With stop_on_idle, returns early
+        # once IDL has executed. Returns the number of cycles executed.
+        if self._error is not None: raise self._error
+        cpu = self.cpu
+        M, R = cpu.M, cpu.R
+        fetch, execute = cpu.fetch_state, cpu.execute_state
+        dispatch = DISPATCH
+        pack = RECORD.pack_into
+        record_size = RECORD.size
+        buffer, pos = self._buffer, self._pos
+        end = len(buffer) - record_size
+
+        requests = cpu.io_requested()
+        self._written = -1      # stores made between runs (e.g. from a debugger) aren't an instruction's
+
+        # inlined states are counted here and added to cycles/instructions once on the way out
+        cycle = -1
+        fetched = ticked = 0
+        try:
+            for cycle in range(n):
+                state = cpu._state
+                if state is fetch:
+                    if self._written >= 0:
+                        self._pos = pos
+                        self._finish_write()
+                    if requests and cpu._service_request():
+                        # a DMA-in cycle's store isn't an instruction's, it isn't recorded
+                        self._written = -1
+                        ticked += 1
+                        continue
+                    if pos > end:
+                        self._full.put((buffer, pos))
+                        buffer = self._buffer = self._free.get()
+                        pos = 0
+                    fetched += 1
+                    cpu.N2 = cpu.N1 = cpu.N0 = 0
+                    P = cpu.P
+                    pc = R[P]
+                    opcode = M[pc]
+                    pack(buffer, pos, cpu.cycles + cycle - ticked, pc, opcode, cpu.D, cpu.DF, cpu.X, P, -1, 0)
+                    pos += record_size
+                    cpu.I = opcode >> 4
+                    cpu.N = opcode & 0x0F
+                    R[P] = (pc + 1) & 0xFFFF
+                    cpu._state = execute
+                elif state is execute:
+                    opcode = (cpu.I << 4) | cpu.N
+                    dispatch[opcode](cpu)
+                    if stop_on_idle and opcode == 0x00: return cycle + 1
+                else:
+                    ticked += 1
+                    cpu.tick()
+                    if stop_on_idle and cpu.is_idle(): return cycle + 1
+            return n
+        finally:
+            self._pos = pos
+            if self._written >= 0: self._finish_write()
+            self.records += fetched
+            cpu.cycles += cycle + 1 - ticked
+            cpu.instructions += fetched
+
+
+def read_trace(path: str) -> Iterator[TraceRecord]:
+    # Records of a trace written by TraceRecorder, with either compression
+    with open(path, 'rb') as raw:
+        magic = raw.read(6)
+    opener = lzma.open if magic == b'\xfd7zXZ\x00' else gzip.open
+    with opener(path, 'rb') as trace_file:
+        header = trace_file.read(len(TRACE_MAGIC) + 1)
+        if header[:-1] != TRACE_MAGIC: raise ValueError(f"{path} is not an execution trace.")
+        if header[-1] != TRACE_VERSION: raise ValueError(f"Unsupported trace version {header[-1]}.")
+        rest = b''
+        while chunk := trace_file.read(RECORD.size * BUFFER_RECORDS):
+            chunk = rest + chunk
+            whole = len(chunk) - len(chunk) % RECORD.size
+            yield from map(TraceRecord._make, RECORD.iter_unpack(chunk[:whole]))
+            rest = chunk[whole:]
+        if rest: raise ValueError(f"{path} is truncated.")